@@ -0,0 +1,93 @@
+"""
+对比docx的提取方式:
+  - python_docx: 之前的实现, 用python-docx构建整个文档的对象模型, 只保留段落
+  - streaming: rev_claude.utils.docx_utils 增量解析 word/document.xml, 包括表格和页眉页脚
+
+除了 resources/Sample_Document.docx, 还会生成一个带表格和页眉页脚的大文档:
+python checking/docx_extract_benchmark.py [path.docx ...]
+
+resources/TextBox_Document.docx 的文本框放在 mc:AlternateContent 里面, 用来检查文本框的内容
+只提取一次, 并且不会和所在段落的文字连在一起。
+"""
+
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from docx import Document
+
+from rev_claude.utils.file_utils import extract_docx_text
+
+ROOT = Path(__file__).parent.parent
+REPEAT = 3
+WORDS = "the model conversation context token stream cache worker page table".split()
+
+
+def build_large_docx(path, sections=400):
+    random.seed(0)
+    document = Document()
+    document.sections[0].header.paragraphs[0].text = "Benchmark header"
+    document.sections[0].footer.paragraphs[0].text = "Benchmark footer"
+    for idx in range(sections):
+        document.add_heading(f"Section {idx}", level=1)
+        for _ in range(5):
+            document.add_paragraph(" ".join(random.choices(WORDS, k=60)))
+        table = document.add_table(rows=6, cols=4)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = " ".join(random.choices(WORDS, k=3))
+        table.cell(1, 0).merge(table.cell(1, 1))
+    document.save(path)
+
+
+def extract_python_docx(path):
+    doc = Document(path)
+    return "\n".join(paragraph.text for paragraph in doc.paragraphs if paragraph.text)
+
+
+def bench(name, path, extract):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        text = extract(path)
+    elapsed = (time.perf_counter() - start) / REPEAT
+
+    tracemalloc.start()
+    extract(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<14}{elapsed:>12.3f}{peak / 1024 / 1024:>12.1f}{len(text):>12}")
+    return text
+
+
+def check_text_boxes():
+    text = extract_docx_text(ROOT / "resources" / "TextBox_Document.docx")
+    lines = text.split("\n")
+    for expected in ("Before  After", "BOXTEXT", "Box second line"):
+        assert lines.count(expected) == 1, f"{expected!r} not extracted once: {text!r}"
+    assert text.count("CELLBOX") == 1, f"CELLBOX not extracted once: {text!r}"
+    print("text boxes: ok")
+
+
+def main():
+    check_text_boxes()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = [Path(path) for path in sys.argv[1:]]
+        if not paths:
+            large_path = Path(temp_dir) / "large.docx"
+            build_large_docx(large_path)
+            paths = [ROOT / "resources" / "Sample_Document.docx", large_path]
+        for path in paths:
+            print(f"\n{path.name} ({path.stat().st_size / 1024:.0f} KB)")
+            print(f"{'method':<14}{'seconds':>12}{'peak MB':>12}{'chars':>12}")
+            baseline = bench("python_docx", path, extract_python_docx)
+            text = bench("streaming", path, extract_docx_text)
+            # 之前能提取到的段落, 现在也都要能提取到
+            missing = [line for line in baseline.split("\n") if line not in text]
+            print(f"missing paragraphs: {len(missing)}")
+
+
+if __name__ == "__main__":
+    main()
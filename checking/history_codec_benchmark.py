@@ -0,0 +1,128 @@
+"""
+对比对话消息的存储格式:
+  - pydantic: 之前整段对话 model_dump_json 的格式(按单条消息计算)
+  - compact_json: 紧凑的json记录
+  - binary: rev_claude.history.message_codec 的二进制格式(带预设字典压缩)
+
+python checking/history_codec_benchmark.py
+"""
+
+import json
+import random
+import time
+from io import StringIO
+from pathlib import Path
+
+from pdfminer.high_level import extract_text_to_fp
+from pdfminer.layout import LAParams
+
+from rev_claude.history.conversation_history_manager import (
+    Message,
+    RoleType,
+    decode_message,
+    encode_message,
+)
+from rev_claude.utils.time_zone_utils import get_shanghai_time
+
+ROOT = Path(__file__).parent.parent
+PDF_PATH = ROOT / "resources" / "Su_2023_Mach._Learn.__Sci._Technol._4_035010.pdf"
+
+CODE_ANSWER = """下面是一个示例, 首先我们定义一个函数:
+
+```python
+import asyncio
+
+
+async def fetch(url):
+    async with httpx.AsyncClient() as client:
+        response = await client.get(url)
+        return response.json()
+
+
+if __name__ == "__main__":
+    print(asyncio.run(fetch("https://www.example.com/")))
+```
+
+需要注意的是, 这个函数会在请求失败的时候抛出异常, 你可以使用 try/except 来处理。
+"""
+
+
+def build_messages(count=2000):
+    output = StringIO()
+    with open(PDF_PATH, "rb") as f:
+        extract_text_to_fp(f, output, laparams=LAParams())
+    paragraphs = [p.strip() for p in output.getvalue().split("\n\n") if p.strip()]
+    random.seed(0)
+    messages = []
+    for idx in range(count):
+        if idx % 2 == 0:
+            content = random.choice(["你好, 你是谁?", "Explain this paper.", "继续"])
+            role = RoleType.USER
+        else:
+            start = random.randrange(len(paragraphs))
+            content = "\n\n".join(paragraphs[start : start + random.randint(1, 12)])
+            if idx % 3 == 0:
+                content = CODE_ANSWER + content
+            role = RoleType.ASSISTANT
+        messages.append(
+            Message(content=content, role=role, timestamp=get_shanghai_time())
+        )
+    return messages
+
+
+def encode_pydantic(message):
+    return message.model_dump_json().encode("utf-8")
+
+
+def decode_pydantic(record):
+    return Message.model_validate_json(record)
+
+
+def encode_compact_json(message):
+    return json.dumps(
+        {
+            "r": message.role.value,
+            "c": message.content,
+            "t": message.timestamp.timestamp(),
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def decode_compact_json(record):
+    return decode_message(record)
+
+
+def bench(name, messages, encode, decode):
+    start = time.perf_counter()
+    records = [encode(message) for message in messages]
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for record in records:
+        decode(record)
+    decode_time = time.perf_counter() - start
+
+    total_bytes = sum(len(record) for record in records)
+    print(
+        f"{name:<14}"
+        f"{total_bytes / len(records):>12.1f}"
+        f"{len(records) / encode_time:>16.0f}"
+        f"{len(records) / decode_time:>16.0f}"
+    )
+    return total_bytes
+
+
+def main():
+    messages = build_messages()
+    print(f"messages: {len(messages)}")
+    print(f"{'format':<14}{'bytes/msg':>12}{'encode msg/s':>16}{'decode msg/s':>16}")
+    baseline = bench("pydantic", messages, encode_pydantic, decode_pydantic)
+    bench("compact_json", messages, encode_compact_json, decode_compact_json)
+    binary = bench("binary", messages, encode_message, decode_message)
+    print(f"binary / pydantic: {binary / baseline:.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+对比pdf的提取方式:
+  - single_pass: 一个转换进程从头到尾提取整个文件
+  - batched: DocumentConverter 一批一批地提取(页数少于并行阈值时的路径)
+  - parallel: DocumentConverter 把页分成多段并行提取
+
+默认使用 resources/ 和 checking/ 下面的pdf, 也可以传入其他pdf的路径:
+python checking/pdf_extract_benchmark.py [path.pdf ...]
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from rev_claude.configs import DOCUMENT_CONVERSION_WORKERS
+from rev_claude.utils.conversion_pool import conversion_pool
+from rev_claude.utils.file_utils import DocumentConverter, extract_pdf_text
+
+ROOT = Path(__file__).parent.parent
+REPEAT = 3
+
+
+def find_pdfs():
+    if len(sys.argv) > 1:
+        return [Path(path) for path in sys.argv[1:]]
+    return sorted((ROOT / "resources").glob("*.pdf")) + sorted(
+        (ROOT / "checking").glob("*.pdf")
+    )
+
+
+async def run_single_pass(path):
+    return await conversion_pool.run(extract_pdf_text, str(path))
+
+
+def make_converter_run(parallel_min_pages):
+    async def run(path):
+        # 只用到转换的逻辑, 不需要真正的上传文件
+        converter = DocumentConverter(
+            None, max_chars=sys.maxsize, parallel_min_pages=parallel_min_pages
+        )
+        result = await converter.process_pdf(str(path))
+        return result.text
+
+    return run
+
+
+async def bench(name, path, run, expected):
+    # 先跑一次让进程池启动起来
+    await run(path)
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        text = await run(path)
+    elapsed = (time.perf_counter() - start) / REPEAT
+    # pdfminer 对重叠的文本块排序不稳定, 同一个进程里面多次提取的结果行序也可能不同,
+    # 所以只比较提取出来的行是否一致
+    same = "yes" if expected is None or sorted(text.split("\n")) == expected else "NO"
+    print(f"{name:<14}{elapsed:>12.3f}{same:>10}")
+    return sorted(text.split("\n"))
+
+
+async def main():
+    print(f"workers: {DOCUMENT_CONVERSION_WORKERS}, repeat: {REPEAT}")
+    for path in find_pdfs():
+        print(f"\n{path.relative_to(ROOT) if path.is_absolute() else path}")
+        print(f"{'method':<14}{'seconds':>12}{'same':>10}")
+        expected = await bench("single_pass", path, run_single_pass, None)
+        await bench("batched", path, make_converter_run(sys.maxsize), expected)
+        await bench("parallel", path, make_converter_run(0), expected)
+    conversion_pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
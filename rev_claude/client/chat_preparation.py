@@ -0,0 +1,191 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+
+from rev_claude.configs import (
+    CHAT_PREPARE_CONVERSATION_TIMEOUT,
+    CHAT_PREPARE_RENDER_TIMEOUT,
+    CHAT_PREPARE_WEB_SEARCH_TIMEOUT,
+    NEW_CONVERSATION_RETRY,
+    NEW_CONVERSATION_SETTLE_SECONDS,
+    USE_MERMAID_AND_SVG,
+)
+from rev_claude.prompts_builder.artifacts_render_prompt import ArtifactsRendererPrompt
+from rev_claude.prompts_builder.duckduck_search_prompt import DuckDuckSearchPrompt
+from rev_claude.schemas import ClaudeChatRequest
+from rev_claude.tracing.request_trace import record_span
+
+# claude 接收的附件字段, 转换接口返回的其他字段(比如 truncated)不需要传过去
+ATTACHMENT_FIELDS = ("file_name", "file_type", "file_size", "extracted_content")
+
+
+class StageStatus:
+    OK = "ok"
+    SKIPPED = "skipped"
+    TIMEOUT = "timeout"
+    ERROR = "error"
+
+
+class StageTiming(BaseModel):
+    status: str
+    elapsed: float = 0
+
+
+class PreparedChat(BaseModel):
+    # 创建对话失败的时候是 None
+    conversation_id: Optional[str]
+    prompt: str
+    hrefs: List[str] = []
+    attachments: List[Dict] = []
+    files: List[str] = []
+    timings: Dict[str, StageTiming] = {}
+
+
+async def run_stage(name, coro, timeout, timings, default=None):
+    """执行一个准备步骤, 超时或者出错的时候返回 default, 不影响其他步骤。"""
+    if coro is None:
+        timings[name] = StageTiming(status=StageStatus.SKIPPED)
+        return default
+    start_time = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(coro, timeout)
+        status = StageStatus.OK
+    except asyncio.TimeoutError:
+        logger.warning(f"Chat preparation stage {name} timed out after {timeout}s")
+        result, status = default, StageStatus.TIMEOUT
+    except Exception as e:
+        logger.error(f"Chat preparation stage {name} failed: {e}")
+        result, status = default, StageStatus.ERROR
+    timings[name] = StageTiming(status=status, elapsed=time.perf_counter() - start_time)
+    record_span(f"prepare.{name}", start_time)
+    return result
+
+
+async def create_conversation(claude_client, model) -> str:
+    max_retry = NEW_CONVERSATION_RETRY
+    for current_retry in range(1, max_retry + 1):
+        try:
+            conversation = await claude_client.create_new_chat(model=model)
+            logger.debug(f"Created new conversation with response: \n{conversation}")
+            conversation_id = conversation["uuid"]
+            # 等待创建成功, 这段时间里面其他的准备步骤照常进行
+            await asyncio.sleep(NEW_CONVERSATION_SETTLE_SECONDS)
+            return conversation_id
+        except Exception as e:
+            logger.error(
+                f"Failed to create conversation. Retry {current_retry}/{max_retry}. Error: {e}"
+            )
+            if current_retry < max_retry:
+                logger.info("Retrying in 2 second...")
+                await asyncio.sleep(2)
+    raise Exception(f"Failed to create conversation after {max_retry} retries.")
+
+
+async def render_artifacts_prompt(prompt: str) -> str:
+    rendered_prompt = await ArtifactsRendererPrompt(prompt=prompt).render_prompt()
+    logger.info(f"Prompt After rendering: \n{rendered_prompt}")
+    return rendered_prompt
+
+
+async def normalize_attachments(attachments: Optional[List[Dict]]) -> List[Dict]:
+    normalized = []
+    for attachment in attachments or []:
+        normalized_attachment = {
+            field: attachment[field]
+            for field in ATTACHMENT_FIELDS
+            if field in attachment
+        }
+        normalized_attachment.setdefault(
+            "file_size", len(attachment.get("extracted_content", ""))
+        )
+        normalized.append(normalized_attachment)
+    return normalized
+
+
+async def prepare_chat(
+    claude_client, claude_chat_request: ClaudeChatRequest
+) -> PreparedChat:
+    """同时完成发送消息之前的准备工作: 创建对话、联网搜索、渲染artifacts的prompt、整理附件。
+
+    这几步互不依赖, 总耗时是最慢的一步而不是所有步骤之和。只有创建对话失败会导致
+    不能继续, 其他步骤超时或者出错的时候跳过这一步。
+    """
+    raw_message = claude_chat_request.message
+    conversation_id = claude_chat_request.conversation_id
+    is_new_conversation = not conversation_id
+    if not is_new_conversation:
+        logger.info(f"Using existing conversation with id: {conversation_id}")
+    # artifacts 的说明只在新对话的第一条消息里面加
+    need_artifacts = (
+        USE_MERMAID_AND_SVG
+        and claude_chat_request.need_artifacts
+        and is_new_conversation
+    )
+    logger.debug(f"Need web search: {claude_chat_request.need_web_search}")
+    search_prompt = DuckDuckSearchPrompt(prompt=raw_message)
+
+    timings: Dict[str, StageTiming] = {}
+    new_conversation_id, search_results, rendered_prompt, attachments = (
+        await asyncio.gather(
+            run_stage(
+                "conversation",
+                (
+                    create_conversation(claude_client, claude_chat_request.model)
+                    if is_new_conversation
+                    else None
+                ),
+                CHAT_PREPARE_CONVERSATION_TIMEOUT,
+                timings,
+            ),
+            run_stage(
+                "web_search",
+                (
+                    search_prompt.search()
+                    if claude_chat_request.need_web_search
+                    else None
+                ),
+                CHAT_PREPARE_WEB_SEARCH_TIMEOUT,
+                timings,
+                default=[],
+            ),
+            run_stage(
+                "artifacts_prompt",
+                render_artifacts_prompt(raw_message) if need_artifacts else None,
+                CHAT_PREPARE_RENDER_TIMEOUT,
+                timings,
+                default=raw_message,
+            ),
+            run_stage(
+                "attachments",
+                normalize_attachments(claude_chat_request.attachments),
+                CHAT_PREPARE_RENDER_TIMEOUT,
+                timings,
+                default=claude_chat_request.attachments or [],
+            ),
+        )
+    )
+
+    # 搜索结果包在最外层, 和之前先渲染artifacts再搜索的结果一致
+    prompt, hrefs = search_prompt.build_prompt(
+        search_results, rendered_prompt or raw_message
+    )
+    if search_results:
+        logger.info(f"Prompt After search: \n{prompt}")
+    logger.info(
+        "Chat preparation timings: "
+        + ", ".join(
+            f"{name}={timing.elapsed:.2f}s({timing.status})"
+            for name, timing in timings.items()
+        )
+    )
+    return PreparedChat(
+        conversation_id=new_conversation_id if is_new_conversation else conversation_id,
+        prompt=prompt,
+        hrefs=hrefs,
+        attachments=attachments,
+        files=claude_chat_request.files or [],
+        timings=timings,
+    )
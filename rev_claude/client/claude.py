@@ -1,23 +1,33 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import asyncio
-import itertools
 import json
 import os
-import random
 import re
+import time
 import uuid
+from typing import List
 
 import httpx
-from fake_useragent import UserAgent
 from fastapi import HTTPException, UploadFile, status
 from fastapi.responses import JSONResponse
 from httpx_sse._decoders import SSEDecoder
 from loguru import logger
 
+from rev_claude.client.headers import (
+    HeaderKind,
+    build_header_templates,
+    generate_trace_id,
+)
+from rev_claude.client.user_agents import get_pinned_user_agent
 from rev_claude.configs import (
     CLAUDE_OFFICIAL_EXPIRE_TIME,
     CLAUDE_OFFICIAL_REVERSE_BASE_URL,
+    DOCUMENT_BATCH_CONCURRENCY,
+    IMAGE_UPLOAD_MAX_CONNECTIONS,
+    IMAGE_UPLOAD_MAX_RETRIES,
+    IMAGE_UPLOAD_RETRY_BACKOFF,
+    IMAGE_UPLOAD_TIMEOUT,
     PROXIES,
     STREAM_CONNECTION_TIME_OUT,
     STREAM_TIMEOUT,
@@ -31,51 +41,23 @@ from rev_claude.REMINDING_MESSAGE import (
 )
 from rev_claude.status.clients_status_manager import ClientsStatusManager
 from rev_claude.status_code.status_code_enum import (
+    HTTP_429_TOO_MANY_REQUESTS,
     HTTP_481_IMAGE_UPLOAD_FAILED,
     HTTP_482_DOCUMENT_UPLOAD_FAILED,
 )
+from rev_claude.tracing.request_trace import record_span, trace_span
+from rev_claude.utils.conversion_pool import ConversionPoolBusy, ConversionTimeout
 from rev_claude.utils.file_utils import DocumentConverter
+from rev_claude.utils.image_utils import open_upload_image
+from rev_claude.utils.sse_utils import build_sse_event
 
 
-def generate_trace_id():
-    # 生成一个随机的 UUID
-    trace_id = uuid.uuid4().hex
-
-    # 生成一个随机的 Span ID，长度为16的十六进制数
-    span_id = os.urandom(8).hex()
-
-    # 设定采样标识，这里假设采样率为1/10，即10%的数据发送
-    sampled = random.choices([0, 1], weights=[9, 1])[0]
-
-    # 将三个部分组合成完整的 Sentry-Trace
-    sentry_trace = f"{trace_id}-{span_id}-{sampled}"
-    return sentry_trace
-
-
-ua = UserAgent()
-filtered_browsers = list(
-    filter(
-        lambda x: x["browser"] in ua.browsers
-        and x["os"] in ua.os
-        and x["percent"] >= ua.min_percentage,
-        ua.data_browsers,
-    )
-)
-
-# 使用itertools.cycle创建一个无限迭代器
-infinite_iter = itertools.cycle(filtered_browsers)
-
-
-def get_random_user_agent():
-    return next(infinite_iter).get("useragent")
-
-
-async def upload_attachment_for_fastapi(file: UploadFile):
+async def convert_attachment(file: UploadFile, on_progress=None):
     # 从 UploadFile 对象读取文件内容
     # 直接try to read
     try:
         document_converter = DocumentConverter(upload_file=file)
-        result = await document_converter.convert()
+        result = await document_converter.convert(on_progress)
 
         if result is None:
             logger.error(f"Unsupported file type: {file.filename}")
@@ -86,9 +68,25 @@ async def upload_attachment_for_fastapi(file: UploadFile):
                 status_code=HTTP_482_DOCUMENT_UPLOAD_FAILED,
                 detail="无法处理该文件类型",
             )
+        if result.truncated:
+            logger.warning(
+                f"Truncated {file.filename} after {len(result.extracted_content)} characters"
+            )
+        return result
 
-        return JSONResponse(content=result.model_dump())
-
+    except HTTPException:
+        raise
+    except ConversionPoolBusy:
+        logger.warning(f"Document conversion pool is busy: {file.filename}")
+        raise HTTPException(
+            status_code=HTTP_429_TOO_MANY_REQUESTS,
+            detail="文档转换繁忙，请稍后再试。",
+        )
+    except ConversionTimeout:
+        raise HTTPException(
+            status_code=HTTP_482_DOCUMENT_UPLOAD_FAILED,
+            detail="文档转换超时，请尝试拆分文件后上传。",
+        )
     except Exception as e:
         logger.error(f"Meet Error when converting file to text: \n{e}")
         # return JSONResponse(content={"message": "处理上传文件报错"}, status_code=HTTP_482_DOCUMENT_UPLOAD_FAILED)
@@ -98,6 +96,106 @@ async def upload_attachment_for_fastapi(file: UploadFile):
         )
 
 
+async def upload_attachment_for_fastapi(file: UploadFile):
+    result = await convert_attachment(file)
+    return JSONResponse(content=result.model_dump())
+
+
+async def stream_attachment_conversion(file: UploadFile):
+    """以SSE的形式返回转换进度, 最后一个事件是 result 或者 error。"""
+    events = asyncio.Queue()
+
+    async def on_progress(pages_extracted, total_pages, extracted_chars):
+        await events.put(
+            build_sse_event(
+                "progress",
+                {
+                    "pages_extracted": pages_extracted,
+                    "total_pages": total_pages,
+                    "extracted_chars": extracted_chars,
+                },
+            )
+        )
+
+    async def run():
+        try:
+            result = await convert_attachment(file, on_progress)
+            await events.put(build_sse_event("result", result.model_dump()))
+        except HTTPException as e:
+            await events.put(
+                build_sse_event(
+                    "error", {"status_code": e.status_code, "detail": e.detail}
+                )
+            )
+        finally:
+            await events.put(None)
+
+    task = asyncio.create_task(run())
+    try:
+        while (event := await events.get()) is not None:
+            yield event
+    finally:
+        task.cancel()
+
+
+async def stream_batch_conversion(
+    files: List[UploadFile], concurrency: int = DOCUMENT_BATCH_CONCURRENCY
+):
+    """同时转换多个文件, 每个文件转换完就返回一个 result 或者 error 事件,
+    事件里面的 index 是文件在请求中的位置, 全部完成之后返回 done 事件。"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def convert(index, file):
+        async with semaphore:
+            try:
+                result = await convert_attachment(file)
+                return build_sse_event(
+                    "result", {"index": index, **result.model_dump()}
+                )
+            except HTTPException as e:
+                return build_sse_event(
+                    "error",
+                    {
+                        "index": index,
+                        "file_name": file.filename,
+                        "status_code": e.status_code,
+                        "detail": e.detail,
+                    },
+                )
+
+    tasks = [asyncio.create_task(convert(idx, file)) for idx, file in enumerate(files)]
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            event = await next_done
+            succeeded += event.startswith("event: result")
+            yield event
+        yield build_sse_event(
+            "done", {"succeeded": succeeded, "failed": len(files) - succeeded}
+        )
+    finally:
+        # 客户端断开的时候取消还没转换完的文件
+        for task in tasks:
+            task.cancel()
+
+
+# 这些状态码说明是临时的问题, 上传的时候可以重试
+TRANSIENT_UPLOAD_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def get_proxy_mounts(limits: httpx.Limits = httpx.Limits()):
+    """httpx 0.28 去掉了 proxies 参数, 按 PROXIES 里面的规则挂载代理。
+
+    挂载的 transport 不会用 AsyncClient 的 limits, 需要单独传进去。
+    """
+    if not USE_PROXY:
+        return None
+    return {
+        pattern: httpx.AsyncHTTPTransport(proxy=proxy, limits=limits)
+        for pattern, proxy in PROXIES.items()
+    }
+
+
 class Client:
     def fix_sessionKey(self, cookie):
         if "sessionKey=" not in cookie:
@@ -107,8 +205,32 @@ class Client:
     def __init__(self, cookie, cookie_key=None):
         self.cookie = self.fix_sessionKey(cookie)
         self.cookie_key = cookie_key
+        self.header_templates = build_header_templates(self.cookie, self.user_agent)
+        self._http_client = None
         # self.organization_id = self.get_organization_id()
 
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        # 每个账号一个连接池, 上传之类的短请求可以复用已经建立好的连接
+        if self._http_client is None or self._http_client.is_closed:
+            limits = httpx.Limits(max_connections=IMAGE_UPLOAD_MAX_CONNECTIONS)
+            self._http_client = httpx.AsyncClient(
+                timeout=IMAGE_UPLOAD_TIMEOUT,
+                limits=limits,
+                mounts=get_proxy_mounts(limits),
+            )
+        return self._http_client
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    @property
+    def user_agent(self):
+        # 每个账号固定一个UA, 没有cookie_key的时候就用cookie本身来固定
+        return get_pinned_user_agent(self.cookie_key or self.cookie)
+
     async def retrieve_reverse_official_route(self, unique_name):
         payload = {
             "session_key": self.retrieve_session_key(),
@@ -137,18 +259,7 @@ class Client:
         return
 
     def build_organization_headers(self):
-        return {
-            "User-Agent": get_random_user_agent(),
-            # "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/124.0",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Referer": "https://claude.ai/chats",
-            "Content-Type": "application/json",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
-            "Connection": "keep-alive",
-            "Cookie": self.cookie,
-        }
+        return self.header_templates[HeaderKind.ORGANIZATION]
 
     async def __async_get_organization_id(self):
         url = "https://claude.ai/api/organizations"
@@ -182,22 +293,7 @@ class Client:
 
     def build_stream_headers(self):
         return {
-            "X-Forwarded-Proto": "https",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/124.0",
-            "Accept": "text/event-stream, text/event-stream",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Referer": "https://claude.ai/chats",
-            "Content-Type": "application/json",
-            "Origin": "https://claude.ai",
-            "DNT": "1",
-            "Connection": "keep-alive",
-            "Cookie": self.cookie,
-            "TE": "trailers",
-            "Sec-Ch-Ua-Mobile": "?0",
-            "Sec-Ch-Ua-Platform": "Windows",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
+            **self.header_templates[HeaderKind.STREAM],
             "Sentry-Trace": generate_trace_id()[2:],
         }
 
@@ -215,7 +311,6 @@ class Client:
         call_back=None,
         timeout=120,
     ):
-        url = f"https://claude.ai/api/organizations/{self.organization_id}/chat_conversations/{conversation_id}/completion"
         __payload = {
             "attachments": attachments,  # attachments is a list
             "files": [] if files is None else files,
@@ -238,10 +333,13 @@ class Client:
             yield NO_EMPTY_PROMPT_MESSAGE
             return
         while current_retry < max_retry:
+            # organization_id 可能在重试前被重新校验过, 所以每次重试都重新拼接url
+            url = f"https://claude.ai/api/organizations/{self.organization_id}/chat_conversations/{conversation_id}/completion"
+            attempt_start = time.perf_counter()
             try:
                 works_fine = False
                 async with httpx.AsyncClient(
-                    timeout=STREAM_TIMEOUT, proxies=PROXIES if USE_PROXY else None
+                    timeout=STREAM_TIMEOUT, mounts=get_proxy_mounts()
                 ) as client:
                     # logger.debug(f"url:\n {url}")
                     # logger.debug(f"headers:\n {headers}")
@@ -254,6 +352,7 @@ class Client:
                         json=payload,
                         timeout=10,
                     ) as response:
+                        record_span("upstream.headers", attempt_start)
                         async for text in response.aiter_lines():
                             # logger.debug(f"raw text: {text}")
                             # async with client.stream(method="POST", url=url, headers=headers, json=data) as response:
@@ -280,6 +379,12 @@ class Client:
                                 return
                             elif "permission_error" in text:
                                 logger.error(f"permission_error : {text}")
+                                # 只针对这个账号重新校验 organization_id
+                                from rev_claude.cookie.organization_cache import (
+                                    organization_id_cache,
+                                )
+
+                                await organization_id_cache.revalidate(self)
                                 raise Exception(text)
                                 # ClientsStatusManager
 
@@ -299,6 +404,14 @@ class Client:
                                 await client_manager.set_client_limited(
                                     client_type, client_idx, start_time, model
                                 )
+                                # 到了刷新时间马上检测, 让账号尽快恢复使用
+                                from rev_claude.periodic_checks.reset_rechecks import (
+                                    schedule_reset_recheck,
+                                )
+
+                                await schedule_reset_recheck(
+                                    client_type, client_idx, resetAt
+                                )
 
                                 logger.error(f"exceeded_limit : {text}")
                                 yield EXCEED_LIMIT_MESSAGE
@@ -345,6 +458,7 @@ class Client:
                                     #        "completion_type": "text"}
                                     response_parse_text = message
                                     remaining = data.get("remaining", None)
+                                    status_update_start = time.perf_counter()
                                     if remaining is not None:
                                         # 那么就把当前剩余的次数改为remaining
                                         client_manager = ClientsStatusManager()
@@ -360,19 +474,27 @@ class Client:
                                         await client_manager.set_remaining_usage(
                                             client_type, client_idx, 999999
                                         )
+                                    record_span(
+                                        "clients_status.stream_updates",
+                                        status_update_start,
+                                    )
 
                                     # 那么证明现在是ok的。
 
                             # logger.info(f"parsed text: {response_parse_text}")
                             if response_parse_text:
-                                await client_manager.set_client_status(
-                                    client_type, client_idx, "active"
-                                )
+                                if not response_text:
+                                    record_span("upstream.first_token", attempt_start)
+                                with trace_span("clients_status.stream_updates"):
+                                    await client_manager.set_client_status(
+                                        client_type, client_idx, "active"
+                                    )
                                 resp_text = "".join(response_parse_text)
                                 response_text += resp_text
                                 yield resp_text
                                 await asyncio.sleep(0)  # 模拟异步操作, 让出权限
 
+                record_span("upstream.attempt", attempt_start)
                 logger.info(f"Response text:\n {response_text}")
                 if call_back:
                     await call_back(response_text)
@@ -380,6 +502,7 @@ class Client:
             except Exception as e:
                 import traceback
 
+                record_span("upstream.attempt", attempt_start)
                 current_retry += 1
                 logger.error(
                     f"Failed to stream message. Retry {current_retry}/{max_retry}. Error: {traceback.format_exc()}"
@@ -395,20 +518,7 @@ class Client:
     def delete_conversation(self, conversation_id):
         url = f"https://claude.ai/api/organizations/{self.organization_id}/chat_conversations/{conversation_id}"
         payload = json.dumps(f"{conversation_id}")
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/124.0",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Content-Type": "application/json",
-            "Content-Length": "38",
-            "Referer": "https://claude.ai/chats",
-            "Origin": "https://claude.ai",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
-            "Connection": "keep-alive",
-            "Cookie": self.cookie,
-            "TE": "trailers",
-        }
+        headers = self.header_templates[HeaderKind.DELETE]
 
         response = requests.delete(
             url, headers=headers, data=payload, impersonate="chrome110"
@@ -424,17 +534,7 @@ class Client:
     def chat_conversation_history(self, conversation_id):
         url = f"https://claude.ai/api/organizations/{self.organization_id}/chat_conversations/{conversation_id}"
 
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/124.0",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Referer": "https://claude.ai/chats",
-            "Content-Type": "application/json",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
-            "Connection": "keep-alive",
-            "Cookie": self.cookie,
-        }
+        headers = self.header_templates[HeaderKind.CONVERSATION]
 
         response = requests.get(url, headers=headers, impersonate="chrome110")
 
@@ -449,43 +549,14 @@ class Client:
 
     def build_new_chat_headers(self, uuid):
         return {
-            # "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
-            "X-Forwarded-Proto": "https",
-            "User-Agent": get_random_user_agent(),
-            "Accept-Language": "en-US,en;q=0.5",
+            **self.header_templates[HeaderKind.NEW_CHAT],
             "Referer": f"https://claude.ai/chat/{uuid}",
-            "Content-Type": "application/json",
-            "Origin": "https://claude.ai",
-            "DNT": "1",
-            "Connection": "keep-alive",
-            "Cookie": self.cookie,
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
-            "TE": "trailers",
         }
 
     def build_get_conversation_histories_headers(self, url_path):
         return {
-            "Alt-Svc": "h3=':443'; ma=86400",
-            "Cf-Cache-Status": "DYNAMIC",
-            # "Cf-Ray": "89a7300dae7c827c-TPE",
-            "Content-Encoding": "br",
-            # "Content-Security-Policy": "script-src 'strict-dynamic' 'wasm-unsafe-eval' https: 'nonce-17ba8129-a77d-4672-b23d-4662a4cbb39d'; object-src 'none'; base-uri 'none'; frame-ancestors 'self'; block-all-mixed-content; upgrade-insecure-requests",
-            "Content-Type": "application/json",
-            # "Date": "Thu, 27 Jun 2024 17:34:25 GMT",
-            "Server": "cloudflare",
-            "Set-Cookie": self.cookie,
-            # f"activitySessionId=ad8f37d8-d54a-4730-be0a-c86e39b90f30; Path=/; Expires=Fri, 28 Jun 2024 05:34:25 GMT; Secure; HttpOnly; SameSite=lax",
-            "Strict-Transport-Security": "max-age=63072000; includeSubDomains; preload",
-            "Vary": "RSC, Next-Router-State-Tree, Next-Router-Prefetch, Next-Url",
-            "Via": "1.1 google",
-            "X-Activity-Session-Id": "ad8f37d8-d54a-4730-be0a-c86e39b90f30",
-            "X-Content-Type-Options": "nosniff",
-            "X-Frame-Options": "SAMEORIGIN",
+            **self.header_templates[HeaderKind.CONVERSATION_HISTORIES],
             "X-Request-Pathname": url_path,
-            # "/api/organizations/dc00b293-7c1c-43f9-ac4a-d14d501e73ca/chat_conversations/0796759-9efe-4875-9984-8dc2021640bc",
-            "X-Xss-Protection": "1; mode=block",
         }
 
     async def get_conversation_histories(self, conversation_id):
@@ -544,18 +615,7 @@ class Client:
                 "extracted_content": file_content,
             }
         url = "https://claude.ai/api/convert_document"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/124.0",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Referer": "https://claude.ai/chats",
-            "Origin": "https://claude.ai",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
-            "Connection": "keep-alive",
-            "Cookie": self.cookie,
-            "TE": "trailers",
-        }
+        headers = self.header_templates[HeaderKind.UPLOAD]
 
         file_name = os.path.basename(file_path)
         content_type = self.get_content_type(file_path)
@@ -572,54 +632,49 @@ class Client:
             return False
 
     async def upload_images(self, image_file: UploadFile):
+        async with open_upload_image(image_file) as (file_name, file, content_type):
+            return await self.upload_image_file(file_name, file, content_type)
+
+    async def upload_image_file(self, file_name, file, content_type):
         url = f"https://claude.ai/api/{self.organization_id}/upload"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/124.0",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Referer": "https://claude.ai/chats",
-            "Origin": "https://claude.ai",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
-            "Connection": "keep-alive",
-            "Cookie": self.cookie,
-            "TE": "trailers",
-        }
-        time_out = 10
-        try:
-            async with httpx.AsyncClient(timeout=time_out) as client:
-                response = await client.post(
+        headers = self.header_templates[HeaderKind.UPLOAD]
+        for attempt in range(IMAGE_UPLOAD_MAX_RETRIES + 1):
+            # 文件对象直接交给httpx分块读取, 重试之前回到开头
+            file.seek(0)
+            try:
+                response = await self.http_client.post(
                     url,
                     headers=headers,
-                    files={
-                        "file": (
-                            image_file.filename,
-                            image_file.file,
-                            image_file.content_type,
-                        )
-                    },
+                    files={"file": (file_name, file, content_type)},
                 )
-                logger.info(f"response: \n{response.json()} ")
+            except httpx.TransportError as e:
+                # 连接失败和超时都可以重试
+                error = f"{type(e).__name__}: {e}"
+            else:
                 if response.status_code == 200:
-                    res_json = response.json()
-                    return JSONResponse(content=res_json)
-
-                else:
-                    # return JSONResponse(
-                    #     content={"message": "Failed to upload image"},
-                    #     status_code=HTTP_481_IMAGE_UPLOAD_FAILED,
-                    # )
-                    raise HTTPException(
-                        status_code=HTTP_481_IMAGE_UPLOAD_FAILED,
-                        detail="Failed to upload image",
-                    )
-
-        except Exception as e:
-            logger.error(f"Failed to upload image: {e}")
-            raise HTTPException(
-                status_code=HTTP_481_IMAGE_UPLOAD_FAILED,
-                detail="Failed to upload image",
+                    try:
+                        return JSONResponse(content=response.json())
+                    except ValueError:
+                        # 比如被拦截之后返回的html页面, 重试也是一样的结果
+                        logger.error(
+                            f"Failed to upload image {file_name}: "
+                            f"invalid JSON response: {response.text[:200]}"
+                        )
+                        break
+                error = f"status {response.status_code}: {response.text[:200]}"
+                if response.status_code not in TRANSIENT_UPLOAD_STATUS_CODES:
+                    logger.error(f"Failed to upload image {file_name}: {error}")
+                    break
+            logger.warning(
+                f"Failed to upload image {file_name} "
+                f"(attempt {attempt + 1}/{IMAGE_UPLOAD_MAX_RETRIES + 1}): {error}"
             )
+            if attempt < IMAGE_UPLOAD_MAX_RETRIES:
+                await asyncio.sleep(IMAGE_UPLOAD_RETRY_BACKOFF * 2**attempt)
+        raise HTTPException(
+            status_code=HTTP_481_IMAGE_UPLOAD_FAILED,
+            detail="Failed to upload image",
+        )
 
     # Renames the chat conversation title
     def rename_chat(self, title, conversation_id):
@@ -632,19 +687,7 @@ class Client:
                 "title": f"{title}",
             }
         )
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/124.0",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Content-Type": "application/json",
-            "Referer": "https://claude.ai/chats",
-            "Origin": "https://claude.ai",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
-            "Connection": "keep-alive",
-            "Cookie": self.cookie,
-            "TE": "trailers",
-        }
+        headers = self.header_templates[HeaderKind.RENAME]
 
         response = requests.post(
             url, headers=headers, data=payload, impersonate="chrome110"
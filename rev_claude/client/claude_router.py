@@ -1,33 +1,41 @@
-import asyncio
 import json
 from functools import partial
+from typing import List
 
 from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile
 from fastapi.responses import JSONResponse, StreamingResponse
 from loguru import logger
 
 from rev_claude.api_key.api_key_manage import APIKeyManager, get_api_key_manager
-from rev_claude.client.claude import upload_attachment_for_fastapi
+from rev_claude.client.chat_preparation import prepare_chat
+from rev_claude.client.claude import (
+    stream_attachment_conversion,
+    stream_batch_conversion,
+    upload_attachment_for_fastapi,
+)
 from rev_claude.client.client_manager import ClientManager
 from rev_claude.configs import (
     CLAUDE_OFFICIAL_USAGE_INCREASE,
-    NEW_CONVERSATION_RETRY,
-    USE_MERMAID_AND_SVG,
+    DOCUMENT_BATCH_MAX_FILES,
 )
 from rev_claude.history.conversation_history_manager import (
     ConversationHistoryRequestInput,
     Message,
     RoleType,
-    conversation_history_manager,
 )
+from rev_claude.history.history_persistence import history_persistence_queue
 from rev_claude.models import ClaudeModels
-from rev_claude.prompts_builder.artifacts_render_prompt import ArtifactsRendererPrompt
 from rev_claude.schemas import (
     ClaudeChatRequest,
     ObtainReverseOfficialLoginRouterRequest,
 )
 from rev_claude.status.clients_status_manager import ClientsStatusManager
-from rev_claude.status_code.status_code_enum import HTTP_480_API_KEY_INVALID
+from rev_claude.status_code.status_code_enum import (
+    HTTP_480_API_KEY_INVALID,
+    HTTP_482_DOCUMENT_UPLOAD_FAILED,
+)
+from rev_claude.tracing.request_trace import get_current_trace, trace_span
+from rev_claude.utils.conversion_cache import conversion_cache
 from rev_claude.utils.sse_utils import build_sse_data
 
 # This in only for claude router, I do not use the
@@ -38,17 +46,22 @@ async def validate_api_key(
 ):
     api_key = request.headers.get("Authorization")
     # logger.info(f"checking api key: {api_key}")
-    if api_key is None or not manager.is_api_key_valid(api_key):
+    with trace_span("api_key.validate"):
+        is_valid = api_key is not None and manager.is_api_key_valid(api_key)
+    if not is_valid:
         raise HTTPException(
             status_code=HTTP_480_API_KEY_INVALID,
             detail="APIKEY已经过期或者不存在，请检查您的APIKEY是否正确。",
         )
-    manager.increment_usage(api_key)
+    with trace_span("api_key.increment_usage"):
+        manager.increment_usage(api_key)
 
     logger.info(f"API key:\n{api_key}")
-    logger.info(manager.get_apikey_information(api_key))
+    with trace_span("api_key.information"):
+        logger.info(manager.get_apikey_information(api_key))
     # 尝试激活 API key
-    active_message = manager.activate_api_key(api_key)
+    with trace_span("api_key.activate"):
+        active_message = manager.activate_api_key(api_key)
     logger.info(active_message)
 
 
@@ -73,7 +86,13 @@ async def patched_generate_data(original_generator, conversation_id, hrefs=None)
         for href in hrefs:
             yield build_sse_data(message=href, id=conversation_id)
 
-    yield build_sse_data(message="closed", id=conversation_id)
+    # 最后一个事件带上这个请求各个阶段的耗时
+    trace = get_current_trace()
+    yield build_sse_data(
+        message="closed",
+        id=conversation_id,
+        spans=trace.to_list() if trace is not None else None,
+    )
 
 
 @router.get("/list_models")
@@ -84,12 +103,39 @@ async def list_models():
 @router.post("/convert_document")
 async def convert_document(
     file: UploadFile = File(...),
+    progress: bool = False,
 ):
     logger.info(f"Uploading file: {file.filename}")
+    if progress:
+        # 大文件可以通过SSE拿到转换进度
+        return StreamingResponse(
+            stream_attachment_conversion(file),
+            media_type="text/event-stream",
+        )
     response = await upload_attachment_for_fastapi(file)
     return response
 
 
+@router.post("/convert_documents")
+async def convert_documents(files: List[UploadFile] = File(...)):
+    # 多个附件一次上传, 转换完一个就通过SSE返回一个
+    logger.info(f"Uploading {len(files)} files: {[file.filename for file in files]}")
+    if len(files) > DOCUMENT_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=HTTP_482_DOCUMENT_UPLOAD_FAILED,
+            detail=f"一次最多上传{DOCUMENT_BATCH_MAX_FILES}个文件",
+        )
+    return StreamingResponse(
+        stream_batch_conversion(files),
+        media_type="text/event-stream",
+    )
+
+
+@router.get("/conversion_cache_stats")
+async def conversion_cache_stats():
+    return await conversion_cache.get_stats()
+
+
 @router.post("/upload_image")
 async def upload_image(
     file: UploadFile = File(...),
@@ -124,7 +170,9 @@ async def push_assistant_message_callback(
         hrefs_str = "".join(hrefs)
         messages[-1].content += hrefs_str
 
-    await conversation_history_manager.push_message(request, messages)
+    # 放到后台队列里面写入, 流式响应可以马上结束
+    with trace_span("history.submit"):
+        await history_persistence_queue.submit(request, messages)
 
 
 @router.post("/obtain_reverse_official_login_router")
@@ -182,7 +230,8 @@ async def chat(
     manager: APIKeyManager = Depends(get_api_key_manager),
 ):
     api_key = request.headers.get("Authorization")
-    has_reached_limit = manager.has_exceeded_limit(api_key)
+    with trace_span("api_key.check_limit"):
+        has_reached_limit = manager.has_exceeded_limit(api_key)
     if has_reached_limit:
         # 首先check一下用户是不是被删除了
         is_deleted = not manager.is_api_key_valid(api_key)
@@ -226,10 +275,13 @@ async def chat(
     client_type = "plus" if client_type == "plus" else "basic"
     # increase the usage count
     clients_status_manager = ClientsStatusManager()
-    await clients_status_manager.increment_usage(
-        client_type=client_type, client_idx=client_idx
-    )
-    if (not manager.is_plus_user(api_key)) and (client_type == "plus"):
+    with trace_span("clients_status.increment_usage"):
+        await clients_status_manager.increment_usage(
+            client_type=client_type, client_idx=client_idx
+        )
+    with trace_span("api_key.is_plus_user"):
+        is_plus_user = manager.is_plus_user(api_key)
+    if (not is_plus_user) and (client_type == "plus"):
         return StreamingResponse(
             build_sse_data(message="您的登录秘钥不是Plus 用户，请升级您的套餐以访问此账户。"),
             media_type="text/event-stream",
@@ -246,60 +298,23 @@ async def chat(
     else:
         claude_client = basic_clients[client_idx]
     raw_message = claude_chat_request.message
-    max_retry = NEW_CONVERSATION_RETRY
-    current_retry = 0
-    while current_retry < max_retry:
-        try:
-            if not conversation_id:
-                try:
-                    conversation = await claude_client.create_new_chat(model=model)
-                    logger.debug(
-                        f"Created new conversation with response: \n{conversation}"
-                    )
-                    conversation_id = conversation["uuid"]
-                    # now we can render the user's prompt
-                    if USE_MERMAID_AND_SVG and claude_chat_request.need_artifacts:
-                        prompt = claude_chat_request.message
-
-                        rendered_prompt = await ArtifactsRendererPrompt(
-                            prompt=prompt
-                        ).render_prompt()
-                        logger.info(f"Prompt After rendering: \n{rendered_prompt}")
-                        claude_chat_request.message = rendered_prompt
-                    await asyncio.sleep(2)  # 等待两秒秒,创建成功后
-
-                    break  # 成功创建对话后跳出循环
-                except Exception as e:
-                    current_retry += 1
-                    logger.error(
-                        f"Failed to create conversation. Retry {current_retry}/{max_retry}. Error: {e}"
-                    )
-                    if current_retry == max_retry:
-                        logger.error(
-                            f"Failed to create conversation after {max_retry} retries."
-                        )
-                        # return StreamingResponse(
-                        #     build_sse_data(message="创建对话失败，请重新尝试。"),
-                        #     media_type="text/event-stream",
-                        # )
-                        generate_data = build_sse_data(message="创建对话失败，请重新尝试。")
-                        done_data = build_sse_data(message="closed", id=conversation_id)
-
-                        return StreamingResponse(
-                            generate_data + done_data,
-                            media_type="text/event-stream",
-                        )
-                    else:
-                        logger.info("Retrying in 2 second...")
-                        await asyncio.sleep(2)
-            else:
-                logger.info(f"Using existing conversation with id: {conversation_id}")
-                break
-        except Exception as e:
-            logger.error(f"Meet an error: {e}")
-            return
-
-    message = claude_chat_request.message
+    # 创建对话、联网搜索等准备工作同时进行
+    with trace_span("prepare_chat"):
+        prepared_chat = await prepare_chat(claude_client, claude_chat_request)
+    conversation_id = prepared_chat.conversation_id
+    if conversation_id is None:
+        generate_data = build_sse_data(message="创建对话失败，请重新尝试。")
+        done_data = build_sse_data(message="closed", id=conversation_id)
+
+        return StreamingResponse(
+            generate_data + done_data,
+            media_type="text/event-stream",
+        )
+
+    message = prepared_chat.prompt
+    hrefs = prepared_chat.hrefs
+    attachments = prepared_chat.attachments
+    files = prepared_chat.files
     is_stream = claude_chat_request.stream
 
     conversation_history_request = ConversationHistoryRequestInput(
@@ -317,30 +332,6 @@ async def chat(
         )
     ]
 
-    # 处理文件的部分
-    attachments = claude_chat_request.attachments
-    if attachments is None:
-        attachments = []
-
-    # conversation_history_manager
-
-    files = claude_chat_request.files
-    if files is None:
-        files = []
-
-    # 处理message的部分， 如果需要搜索的话:
-    logger.debug(f"Need web search: {claude_chat_request.need_web_search}")
-    hrefs = []
-    if claude_chat_request.need_web_search:
-        from rev_claude.prompts_builder.duckduck_search_prompt import (
-            DuckDuckSearchPrompt,
-        )
-
-        # here we choose a number from 3 to 5
-        message, hrefs = await DuckDuckSearchPrompt(
-            prompt=message,
-        ).render_prompt()
-        logger.info(f"Prompt After search: \n{message}")
     call_back = partial(
         push_assistant_message_callback, conversation_history_request, messages, hrefs
     )
@@ -1,10 +1,13 @@
+import asyncio
 import hashlib
 from typing import Dict, List
 
 from loguru import logger
 from tqdm.asyncio import tqdm, tqdm_asyncio
 
-from rev_claude.cookie.claude_cookie_manage import get_cookie_manager
+from rev_claude.configs import BULK_COOKIE_VALIDATE_CONCURRENCY
+from rev_claude.cookie.claude_cookie_manage import CookieKeyType, get_cookie_manager
+from rev_claude.utils.async_utils import validate_client
 
 HASH_MODULE = 1e6
 
@@ -25,18 +28,119 @@ class ClientManager:
             basic_clients,
             plus_clients,
         ) = await cookie_manager.get_all_basic_and_plus_client(reload)
+        old_clients = [
+            *ClientManager.basic_clients.values(),
+            *ClientManager.plus_clients.values(),
+        ]
         ClientManager.basic_clients = {
             int(improved_hash(client.cookie_key)): client for client in basic_clients
         }
         ClientManager.plus_clients = {
             int(improved_hash(client.cookie_key)): client for client in plus_clients
         }
+        # 重新加载之后旧的 Client 不再使用, 关闭它们的连接池
+        await self.close_replaced_clients(old_clients)
         logger.info(f"basic_clients: {ClientManager.basic_clients.keys()}")
         logger.info(f"plus_clients: {ClientManager.plus_clients.keys()}")
 
     def get_clients(self):
         return ClientManager.basic_clients, ClientManager.plus_clients
 
+    async def close_clients(self):
+        # 关闭每个账号的连接池
+        clients = [
+            *ClientManager.basic_clients.values(),
+            *ClientManager.plus_clients.values(),
+        ]
+        await asyncio.gather(
+            *[client.aclose() for client in clients], return_exceptions=True
+        )
+
+    async def close_replaced_clients(self, clients):
+        # 已经不在账号列表里面的 Client 才关闭, 同一个对象可能还在使用
+        live_clients = {
+            id(client)
+            for client in (
+                *ClientManager.basic_clients.values(),
+                *ClientManager.plus_clients.values(),
+            )
+        }
+        results = await asyncio.gather(
+            *[
+                client.aclose()
+                for client in clients
+                if client is not None and id(client) not in live_clients
+            ],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Failed to close replaced client: {result}")
+
+    async def add_client(self, client, cookie_type: str):
+        # 直接修改现有的字典, 不需要重新加载全部账号
+        idx = int(improved_hash(client.cookie_key))
+        if cookie_type == CookieKeyType.PLUS.value:
+            clients, other_clients = (
+                ClientManager.plus_clients,
+                ClientManager.basic_clients,
+            )
+        else:
+            clients, other_clients = (
+                ClientManager.basic_clients,
+                ClientManager.plus_clients,
+            )
+        # 类型变了的时候从另一个类型里面移除, 同一个账号只在一个池子里
+        replaced = [clients.get(idx), other_clients.pop(idx, None)]
+        clients[idx] = client
+        await self.close_replaced_clients(replaced)
+        return idx
+
+    async def remove_client(self, cookie_key: str):
+        idx = int(improved_hash(cookie_key))
+        removed = [
+            ClientManager.basic_clients.pop(idx, None),
+            ClientManager.plus_clients.pop(idx, None),
+        ]
+        await self.close_replaced_clients(removed)
+        return any(client is not None for client in removed)
+
+    async def validate_and_add_clients(
+        self,
+        cookies_info: List[Dict],
+        concurrency: int = BULK_COOKIE_VALIDATE_CONCURRENCY,
+    ) -> Dict[str, List[str]]:
+        """并发校验cookie(最多 concurrency 个同时进行), 有效的立即加入到当前的账号列表。"""
+        semaphore = asyncio.Semaphore(concurrency)
+        valid_cookie_keys = []
+        invalid_cookie_keys = []
+
+        async def _validate(cookie_info):
+            async with semaphore:
+                client = await validate_client(
+                    cookie_info["cookie"], cookie_info["cookie_key"]
+                )
+            if client is None:
+                # 更新之后校验失败, 不能继续使用之前的 Client
+                await self.remove_client(cookie_info["cookie_key"])
+                invalid_cookie_keys.append(cookie_info["cookie_key"])
+                return
+            if cookie_info["type"] in (
+                CookieKeyType.PLUS.value,
+                CookieKeyType.BASIC.value,
+            ):
+                await self.add_client(client, cookie_info["type"])
+            else:
+                await self.remove_client(cookie_info["cookie_key"])
+                await client.aclose()
+            valid_cookie_keys.append(cookie_info["cookie_key"])
+
+        await asyncio.gather(*[_validate(cookie_info) for cookie_info in cookies_info])
+        logger.info(
+            f"Validated cookies: {len(valid_cookie_keys)} / {len(cookies_info)} valid"
+        )
+        return {"valid": valid_cookie_keys, "invalid": invalid_cookie_keys}
+
     async def retrieve_clients_information(self) -> Dict[str, List[Dict]]:
         basic_cookie_keys = [
             client.cookie_key for client in ClientManager.basic_clients.values()
@@ -0,0 +1,119 @@
+import os
+import random
+import uuid
+from enum import Enum
+from types import MappingProxyType
+from typing import Dict, Mapping
+
+# 官网请求头统一在这里维护, 每个账号在创建 Client 的时候生成一次只读模板,
+# 每次请求只需要填充会变化的字段(Sentry-Trace, Referer 等)。
+
+FIREFOX_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/124.0"
+)
+
+CLAUDE_ORIGIN = "https://claude.ai"
+CLAUDE_CHATS_REFERER = "https://claude.ai/chats"
+
+
+class HeaderKind(Enum):
+    ORGANIZATION = "organization"
+    STREAM = "stream"
+    NEW_CHAT = "new_chat"
+    CONVERSATION = "conversation"
+    CONVERSATION_HISTORIES = "conversation_histories"
+    UPLOAD = "upload"
+    DELETE = "delete"
+    RENAME = "rename"
+
+
+def _base_headers(cookie: str, user_agent: str) -> Dict[str, str]:
+    return {
+        "User-Agent": user_agent,
+        "Accept-Language": "en-US,en;q=0.5",
+        "Referer": CLAUDE_CHATS_REFERER,
+        "Sec-Fetch-Dest": "empty",
+        "Sec-Fetch-Mode": "cors",
+        "Sec-Fetch-Site": "same-origin",
+        "Connection": "keep-alive",
+        "Cookie": cookie,
+    }
+
+
+def build_header_templates(
+    cookie: str, user_agent: str
+) -> Mapping[HeaderKind, Mapping[str, str]]:
+    """为单个账号生成所有请求类型的只读请求头模板。"""
+    base = _base_headers(cookie, user_agent)
+    firefox_base = _base_headers(cookie, FIREFOX_USER_AGENT)
+    templates = {
+        HeaderKind.ORGANIZATION: {
+            **base,
+            "Content-Type": "application/json",
+        },
+        HeaderKind.STREAM: {
+            **firefox_base,
+            "X-Forwarded-Proto": "https",
+            "Accept": "text/event-stream, text/event-stream",
+            "Content-Type": "application/json",
+            "Origin": CLAUDE_ORIGIN,
+            "DNT": "1",
+            "TE": "trailers",
+            "Sec-Ch-Ua-Mobile": "?0",
+            "Sec-Ch-Ua-Platform": "Windows",
+        },
+        HeaderKind.NEW_CHAT: {
+            **base,
+            "X-Forwarded-Proto": "https",
+            "Content-Type": "application/json",
+            "Origin": CLAUDE_ORIGIN,
+            "DNT": "1",
+            "TE": "trailers",
+        },
+        HeaderKind.CONVERSATION: {
+            **firefox_base,
+            "Content-Type": "application/json",
+        },
+        HeaderKind.CONVERSATION_HISTORIES: {
+            "Alt-Svc": "h3=':443'; ma=86400",
+            "Cf-Cache-Status": "DYNAMIC",
+            "Content-Encoding": "br",
+            "Content-Type": "application/json",
+            "Server": "cloudflare",
+            "Set-Cookie": cookie,
+            "Strict-Transport-Security": "max-age=63072000; includeSubDomains; preload",
+            "Vary": "RSC, Next-Router-State-Tree, Next-Router-Prefetch, Next-Url",
+            "Via": "1.1 google",
+            "X-Activity-Session-Id": "ad8f37d8-d54a-4730-be0a-c86e39b90f30",
+            "X-Content-Type-Options": "nosniff",
+            "X-Frame-Options": "SAMEORIGIN",
+            "X-Xss-Protection": "1; mode=block",
+        },
+        HeaderKind.UPLOAD: {
+            **firefox_base,
+            "Origin": CLAUDE_ORIGIN,
+            "TE": "trailers",
+        },
+        HeaderKind.DELETE: {
+            **firefox_base,
+            "Content-Type": "application/json",
+            "Content-Length": "38",
+            "Origin": CLAUDE_ORIGIN,
+            "TE": "trailers",
+        },
+        HeaderKind.RENAME: {
+            **firefox_base,
+            "Content-Type": "application/json",
+            "Origin": CLAUDE_ORIGIN,
+            "TE": "trailers",
+        },
+    }
+    return MappingProxyType(
+        {kind: MappingProxyType(headers) for kind, headers in templates.items()}
+    )
+
+
+def generate_trace_id():
+    # trace_id-span_id-sampled, 采样率为1/10
+    sampled = 1 if random.random() < 0.1 else 0
+    return f"{uuid.uuid4().hex}-{os.urandom(8).hex()}-{sampled}"
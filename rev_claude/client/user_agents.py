@@ -0,0 +1,48 @@
+import hashlib
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import List
+
+USER_AGENTS_PATH = Path(__file__).parent / "user_agents.json"
+
+
+@lru_cache(maxsize=1)
+def load_user_agents() -> List[str]:
+    """第一次使用时才读取预先生成的UA表，之后都走缓存。"""
+    with open(USER_AGENTS_PATH, "r", encoding="utf-8") as f:
+        user_agents = json.load(f)
+    if not user_agents:
+        raise ValueError(f"User agent table is empty: {USER_AGENTS_PATH}")
+    return user_agents
+
+
+@lru_cache(maxsize=4096)
+def get_pinned_user_agent(pin_key: str) -> str:
+    """同一个账号(cookie_key)总是拿到同一个UA，保证指纹一致。"""
+    user_agents = load_user_agents()
+    digest = hashlib.sha256(pin_key.encode()).hexdigest()
+    return user_agents[int(digest, 16) % len(user_agents)]
+
+
+def generate_user_agents_table(output_path: Path = USER_AGENTS_PATH):
+    """用 fake_useragent 重新生成UA表，只在维护时手动运行。"""
+    from fake_useragent import UserAgent
+
+    ua = UserAgent()
+    user_agents = sorted(
+        {
+            x["useragent"]
+            for x in ua.data_browsers
+            if x["browser"] in ua.browsers
+            and x["os"] in ua.os
+            and x["percent"] >= ua.min_percentage
+        }
+    )
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(user_agents, f, indent=0)
+    return len(user_agents)
+
+
+if __name__ == "__main__":
+    print(generate_user_agents_table())
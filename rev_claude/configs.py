@@ -34,6 +34,37 @@ USE_MERMAID_AND_SVG = True
 
 PROXIES = {"http://": "socks5://127.0.0.1:7891", "https://": "socks5://127.0.0.1:7891"}
 
+# 上传图片: 每个账号复用一个连接池, 超时/连接失败/5xx/429 的时候按指数退避重试
+IMAGE_UPLOAD_TIMEOUT = Timeout(connect=10, read=60, write=60, pool=30)
+IMAGE_UPLOAD_MAX_CONNECTIONS = 4
+IMAGE_UPLOAD_MAX_RETRIES = 2
+IMAGE_UPLOAD_RETRY_BACKOFF = 0.5
+# 超过这个边长或者文件大小的图片先在转换进程里面缩小并重新编码再上传, 需要安装 pillow
+IMAGE_DOWNSCALE_ENABLED = True
+IMAGE_DOWNSCALE_MAX_SIDE = 2048
+IMAGE_DOWNSCALE_MAX_BYTES = 5 * 1024 * 1024
+IMAGE_DOWNSCALE_QUALITY = 85
+
+# 联网搜索: 同样的问题(归一化之后)缓存 CACHE_TTL 秒; 超过 TIMEOUT 秒不再等待搜索结果,
+# 避免拖慢第一个token, 搜索本身最多 BACKEND_TIMEOUT 秒
+WEB_SEARCH_CACHE_TTL = 30 * 60
+WEB_SEARCH_TIMEOUT = 3
+WEB_SEARCH_BACKEND_TIMEOUT = 10
+
+# 发送消息之前的准备工作(创建对话、联网搜索、渲染prompt、整理附件)同时进行, 每一步的超时时间
+CHAT_PREPARE_CONVERSATION_TIMEOUT = 60
+CHAT_PREPARE_WEB_SEARCH_TIMEOUT = WEB_SEARCH_TIMEOUT + 2
+CHAT_PREPARE_RENDER_TIMEOUT = 5
+# 新对话创建成功之后等待一会儿再发送消息
+NEW_CONVERSATION_SETTLE_SECONDS = 2
+
+# 请求分阶段计时: /api/v1 下面的请求都会记录每个阶段的耗时, 通过 Server-Timing 响应头
+# (流式对话在最后的 closed 事件里面)返回; 按比例抽样写入redis里面按小时分桶的直方图
+TRACING_ENABLED = True
+TRACING_PATH_PREFIX = "/api/v1"
+TRACE_SAMPLE_RATE = 0.1
+TRACE_HISTOGRAM_RETENTION_HOURS = 72
+
 REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
 REDIS_DB = int(os.environ.get("REDIS_DB", 0))
@@ -57,14 +88,47 @@ CLAUDE_OFFICIAL_USAGE_INCREASE = 5
 
 
 # limits check的函数
-CLAUDE_CLIENT_LIMIT_CHECKS_INTERVAL_MINUTES = 60
+# 账号会在额度刷新的时候单独检测, 这里只是低频的兜底全量检测
+CLAUDE_CLIENT_LIMIT_CHECKS_INTERVAL_MINUTES = 6 * 60
 CLAUDE_CLIENT_LIMIT_CHECKS_PROMPT = "Say: OK."
+# 同时检测的账号数量
+CLAUDE_CLIENT_LIMIT_CHECKS_CONCURRENCY = 5
+# 到了 resetsAt 之后再等几秒才检测, 避免刚好在刷新之前
+CLAUDE_CLIENT_RESET_RECHECK_DELAY_SECONDS = 5
+# 检查有没有到期的刷新检测的间隔
+CLAUDE_CLIENT_RESET_RECHECK_POLL_SECONDS = 5
+
+# 多个worker/多台机器的时候只有拿到租约的那个进程运行定时任务
+SCHEDULER_LEADER_KEY = "scheduler_leader"
+SCHEDULER_LEADER_LEASE_SECONDS = 30
+SCHEDULER_LEADER_RENEW_INTERVAL = 10
+
+# organization_id 缓存, 超过TTL之后仍然先用旧值, 由后台分批重新校验
+ORGANIZATION_ID_TTL_SECONDS = 6 * 60 * 60
+ORGANIZATION_REVALIDATE_INTERVAL_MINUTES = 30
+ORGANIZATION_REVALIDATE_BATCH_SIZE = 5
+ORGANIZATION_REVALIDATE_BATCH_INTERVAL = 2  # 批次之间间隔的秒数
+
+# 没有设置 usage_type 的账号按 cookie_key 的哈希值分配, 比例之和为1
+COOKIE_USAGE_TYPE_RATIOS = {
+    "WEB_LOGIN_ONLY": 0.8,
+    "REVERSE_API_ONLY": 0.2,
+}
+
+# 批量导入cookie的时候同时校验的账号数量
+BULK_COOKIE_VALIDATE_CONCURRENCY = 10
 
 CLAUDE_BACKEND_API_BASE_URL = "https://clauai.qqyunsd.com/adminapi"
 CLAUDE_BACKEND_API_USER_URL = f"{CLAUDE_BACKEND_API_BASE_URL}/chatgpt/user/"
 CLAUDE_BACKEND_API_APIAUTH = "ccccld"
 
 
+# 对话列表里面显示的标题长度(取第一条用户消息)
+CONVERSATION_TITLE_LENGTH = 50
+
+# 导出对话的时候每批SCAN的key数量
+CONVERSATION_EXPORT_BATCH_SIZE = 200
+
 # IP访问的限制
 IP_REQUEST_LIMIT_PER_MINUTE = 40  # 一分钟40次
 
@@ -75,5 +139,58 @@ LOGS_PATH = ROOT / "logs"
 
 LOGS_PATH.mkdir(exist_ok=True)
 
+DATA_PATH = ROOT / "data"
+
+# pdf/docx 的转换放在独立的进程池里面, 避免占用事件循环所在进程的GIL
+DOCUMENT_CONVERSION_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# 除了正在转换的, 最多还能排队这么多个, 再多就直接返回繁忙
+DOCUMENT_CONVERSION_QUEUE_SIZE = 8
+DOCUMENT_CONVERSION_TIMEOUT = 60
+# 每个转换进程的内存上限, 0 表示不限制
+DOCUMENT_CONVERSION_MEMORY_LIMIT_MB = 1024
+# 转换结果按文件内容的sha256缓存在redis里面, 超过大小上限之后淘汰最久没用过的
+DOCUMENT_CONVERSION_CACHE_ENABLED = True
+DOCUMENT_CONVERSION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# 提取出来的文本超过这么多字符就不再继续提取, 反正也超过了对话的长度上限
+DOCUMENT_EXTRACT_MAX_CHARS = 300_000
+# pdf 每次交给转换进程的页数, 每完成一批检查一次字数并汇报进度
+DOCUMENT_PDF_PAGES_PER_JOB = 8
+# 总页数达到这个数量的pdf把后面的页分成多段, 同时交给多个转换进程提取;
+# 页数少的时候每个进程都要重新解析一遍文件, 并行反而更慢
+DOCUMENT_PDF_PARALLEL_MIN_PAGES = 32
+# 同一个pdf最多同时占用的转换进程数, 避免一个大文件占满整个进程池
+DOCUMENT_PDF_PARALLEL_JOBS = DOCUMENT_CONVERSION_WORKERS
+# 批量转换一次最多上传的文件数, 同一批里面最多同时转换的文件数
+DOCUMENT_BATCH_MAX_FILES = 20
+DOCUMENT_BATCH_CONCURRENCY = DOCUMENT_CONVERSION_WORKERS
+
+# 对话历史的保留策略: 按api key类型保留的天数, 超过 COLD_AFTER_DAYS 没有活跃的对话
+# 从redis移到本地的SQLite里面, api key过期之后它的对话全部移到本地。
+CONVERSATION_RETENTION_DAYS = {
+    "plus": 180,
+    "basic": 90,
+}
+CONVERSATION_DEFAULT_RETENTION_DAYS = 90
+CONVERSATION_COLD_AFTER_DAYS = 7
+CONVERSATION_ARCHIVE_PATH = DATA_PATH / "conversation_archive.sqlite3"
+CONVERSATION_RETENTION_SWEEP_INTERVAL_MINUTES = 60
+# 每处理这么多个对话就暂停一下, 避免占满redis
+CONVERSATION_RETENTION_SWEEP_BATCH_SIZE = 50
+CONVERSATION_RETENTION_SWEEP_BATCH_INTERVAL = 1
+
+# 对话全文搜索的索引(SQLite FTS5), 和归档库分开存放
+CONVERSATION_SEARCH_INDEX_PATH = DATA_PATH / "conversation_search.sqlite3"
+CONVERSATION_SEARCH_SNIPPET_TOKENS = 24
+
+# 对话历史在后台队列里面写入, 不占用流式响应的时间
+HISTORY_PERSIST_WORKERS = 2
+# 每个worker的队列长度, 满了之后直接在请求里面写入
+HISTORY_PERSIST_QUEUE_SIZE = 500
+HISTORY_PERSIST_BATCH_SIZE = 20
+HISTORY_PERSIST_MAX_RETRIES = 5
+HISTORY_PERSIST_RETRY_INTERVAL = 0.5
+# 重试之后还是写不进去的记录保存在这里, 之后可以重新导入
+HISTORY_PERSIST_FAILED_PATH = DATA_PATH / "failed_history_writes.ndjson"
+
 if __name__ == "__main__":
     print(ROOT)
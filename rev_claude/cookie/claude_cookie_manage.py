@@ -1,15 +1,16 @@
 import asyncio
-import random
+import hashlib
+import time
 import uuid
 from enum import Enum
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import redis
 from loguru import logger
 from redis.asyncio import Redis
 
 from rev_claude.client.claude import Client
-from rev_claude.configs import REDIS_HOST, REDIS_PORT
+from rev_claude.configs import COOKIE_USAGE_TYPE_RATIOS, REDIS_HOST, REDIS_PORT
 from rev_claude.utils.async_utils import register_clients
 
 
@@ -26,16 +27,21 @@ class CookieUsageType(Enum):
     BOTH = 2
 
     @classmethod
-    def get_default(cls):
-        if random.random() < 0.2:
-            return cls.REVERSE_API_ONLY
-        else:
-            return cls.WEB_LOGIN_ONLY
+    def get_default(cls, cookie_key: str):
+        """按 cookie_key 的哈希值分配, 同一个账号每次得到的结果都一样。"""
+        digest = hashlib.sha256(cookie_key.encode()).hexdigest()
+        bucket = int(digest, 16) % 10000 / 10000
+        cumulative = 0.0
+        for name, ratio in COOKIE_USAGE_TYPE_RATIOS.items():
+            cumulative += ratio
+            if bucket < cumulative:
+                return cls[name]
+        return cls.WEB_LOGIN_ONLY
 
     @classmethod
-    def from_redis_value(cls, value):
+    def from_redis_value(cls, value, cookie_key: str):
         if value is None:
-            return cls.get_default()
+            return cls.get_default(cookie_key)
         return cls(int(value))
 
 
@@ -69,27 +75,53 @@ class CookieManager:
     def get_cookie_organization_key(self, cookie_key):
         return f"{cookie_key}:organization"
 
+    def get_cookie_organization_checked_at_key(self, cookie_key):
+        return f"{cookie_key}:organization_checked_at"
+
     def get_cookie_usage_type_key(self, cookie_key):
         return f"{cookie_key}:usage_type"
 
     async def get_cookie_usage_type(self, cookie_key: str) -> CookieUsageType:
         """Retrieve the usage type for a specific cookie."""
-        usage_type_key = self.get_cookie_usage_type_key(cookie_key)
-        usage_type_value = await self.decoded_get(usage_type_key)
-
-        if usage_type_value is None:
-            return CookieUsageType.get_default()
-
-        if isinstance(usage_type_value, bytes):
-            usage_type_value = usage_type_value.decode("utf-8")
-
-        try:
-            return CookieUsageType(int(usage_type_value))
-        except ValueError:
-            logger.warning(
-                f"Invalid usage type value for cookie {cookie_key}: {usage_type_value}"
-            )
-            return CookieUsageType.get_default()
+        return (await self.get_cookie_usage_types([cookie_key]))[cookie_key]
+
+    async def get_cookie_usage_types(
+        self, cookie_keys: List[str]
+    ) -> Dict[str, CookieUsageType]:
+        """一次取出多个cookie的 usage_type, 没有设置过的账号分配一次并写回redis。"""
+        if not cookie_keys:
+            return {}
+        redis_instance = await self.get_aioredis()
+        values = await redis_instance.mget(
+            [self.get_cookie_usage_type_key(cookie_key) for cookie_key in cookie_keys]
+        )
+        usage_types = {}
+        unassigned = {}
+        for cookie_key, value in zip(cookie_keys, values):
+            if isinstance(value, bytes):
+                value = value.decode("utf-8")
+            try:
+                usage_types[cookie_key] = CookieUsageType.from_redis_value(
+                    value, cookie_key
+                )
+            except ValueError:
+                logger.warning(
+                    f"Invalid usage type value for cookie {cookie_key}: {value}"
+                )
+                usage_types[cookie_key] = CookieUsageType.get_default(cookie_key)
+            if value is None:
+                unassigned[cookie_key] = usage_types[cookie_key]
+
+        if unassigned:
+            # setnx: 多个worker同时分配的时候不会互相覆盖, 而且分配结果本来就是一样的
+            async with redis_instance.pipeline(transaction=False) as pipe:
+                for cookie_key, usage_type in unassigned.items():
+                    pipe.setnx(
+                        self.get_cookie_usage_type_key(cookie_key), usage_type.value
+                    )
+                await pipe.execute()
+            logger.info(f"Assigned usage type for {len(unassigned)} cookies")
+        return usage_types
 
     async def set_cookie_usage_type(self, cookie_key: str, usage_type: CookieUsageType):
         """Set the usage type for a specific cookie."""
@@ -99,15 +131,20 @@ class CookieManager:
 
     async def update_organization_id(self, cookie_key, organization_id):
         organization_key = self.get_cookie_organization_key(cookie_key)
+        checked_at_key = self.get_cookie_organization_checked_at_key(cookie_key)
         redis_instance = await self.get_aioredis()
-        await redis_instance.set(organization_key, organization_id)
+        async with redis_instance.pipeline(transaction=False) as pipe:
+            pipe.set(organization_key, organization_id)
+            pipe.set(checked_at_key, time.time())
+            await pipe.execute()
         return f"Organization ID for {cookie_key} has been updated."
 
     async def delete_organization_id(self, cookie_key):
         organization_key = self.get_cookie_organization_key(cookie_key)
+        checked_at_key = self.get_cookie_organization_checked_at_key(cookie_key)
         redis_instance = await self.get_aioredis()
         if await redis_instance.exists(organization_key):
-            await redis_instance.delete(organization_key)
+            await redis_instance.delete(organization_key, checked_at_key)
             return f"Organization ID for {cookie_key} has been deleted."
         else:
             return f"No organization found for {cookie_key}. Nothing to delete."
@@ -125,6 +162,13 @@ class CookieManager:
             else organization_id
         )
 
+    async def get_organization_checked_at(self, cookie_key):
+        checked_at_key = self.get_cookie_organization_checked_at_key(cookie_key)
+        checked_at = await self.decoded_get(checked_at_key)
+        if checked_at is None:
+            return None
+        return float(checked_at)
+
     async def upload_cookie(
         self, cookie: str, cookie_type=CookieKeyType.BASIC.value, account=""
     ):
@@ -138,6 +182,55 @@ class CookieManager:
         await redis_instance.set(account_key, account)
         return cookie_key
 
+    async def bulk_upsert_cookies(self, records) -> List[str]:
+        """在一个pipeline里面写入或更新多个cookie, 返回每条记录对应的cookie_key。"""
+        cookie_keys = []
+        redis_instance = await self.get_aioredis()
+        async with redis_instance.pipeline(transaction=False) as pipe:
+            for record in records:
+                cookie_key = (
+                    record.cookie_key or f"cookie-{str(uuid.uuid4()).replace('-', '')}"
+                )
+                # 更新已有的cookie时只写调用方给出的字段, 没给的保持原来的值
+                fields = record.model_fields_set if record.cookie_key else None
+                pipe.set(cookie_key, record.cookie)
+                if fields is None or "type" in fields:
+                    pipe.set(self.get_cookie_type_key(cookie_key), record.type.value)
+                if fields is None or "account" in fields:
+                    pipe.set(self.get_cookie_account_key(cookie_key), record.account)
+                if record.usage_type is not None:
+                    pipe.set(
+                        self.get_cookie_usage_type_key(cookie_key),
+                        record.usage_type.value,
+                    )
+                cookie_keys.append(cookie_key)
+            await pipe.execute()
+        return cookie_keys
+
+    async def get_missing_cookie_keys(self, cookie_keys: List[str]) -> List[str]:
+        if not cookie_keys:
+            return []
+        redis_instance = await self.get_aioredis()
+        async with redis_instance.pipeline(transaction=False) as pipe:
+            for cookie_key in cookie_keys:
+                pipe.exists(cookie_key)
+            exists = await pipe.execute()
+        return [
+            cookie_key for cookie_key, found in zip(cookie_keys, exists) if not found
+        ]
+
+    async def get_cookie_types(self, cookie_keys: List[str]) -> List[Optional[str]]:
+        if not cookie_keys:
+            return []
+        redis_instance = await self.get_aioredis()
+        values = await redis_instance.mget(
+            [self.get_cookie_type_key(cookie_key) for cookie_key in cookie_keys]
+        )
+        return [
+            value.decode("utf-8") if isinstance(value, bytes) else value
+            for value in values
+        ]
+
     async def update_cookie(self, cookie_key: str, cookie: str, account: str = ""):
         account_key = self.get_cookie_account_key(cookie_key)
         redis_instance = await self.get_aioredis()
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 from fastapi.responses import JSONResponse
 
 from rev_claude.client.client_manager import ClientManager
@@ -8,6 +10,10 @@ from rev_claude.cookie.claude_cookie_manage import (
     CookieUsageType,
     get_cookie_manager,
 )
+from rev_claude.cookie.cookie_bulk_import import (
+    CookieImportRecord,
+    parse_cookie_import_file,
+)
 
 router = APIRouter()
 
@@ -70,6 +76,71 @@ async def upload_cookie(
     return {"cookie_key": cookie_key}
 
 
+async def bulk_upsert_and_register(
+    records: List[CookieImportRecord], manager: CookieManager
+):
+    # 带 cookie_key 的记录只能更新已有的cookie, 不能借此创建新的key
+    missing = await manager.get_missing_cookie_keys(
+        [record.cookie_key for record in records if record.cookie_key]
+    )
+    if missing:
+        raise HTTPException(status_code=404, detail=f"cookie_key not found: {missing}")
+    cookie_keys = await manager.bulk_upsert_cookies(records)
+    # 更新的时候可能没有给出类型, 按写入之后redis里面的类型加入账号池
+    cookie_types = await manager.get_cookie_types(cookie_keys)
+    result = await ClientManager().validate_and_add_clients(
+        [
+            {
+                "cookie": record.cookie,
+                "cookie_key": cookie_key,
+                "type": cookie_type or record.type.value,
+            }
+            for record, cookie_key, cookie_type in zip(
+                records, cookie_keys, cookie_types
+            )
+        ]
+    )
+    return {"cookie_keys": cookie_keys, **result}
+
+
+@router.post("/bulk_upload_cookies")
+async def bulk_upload_cookies(
+    file: UploadFile = File(...),
+    file_format: Optional[Literal["ndjson", "csv"]] = None,
+    manager: CookieManager = Depends(get_cookie_manager),
+):
+    """Upload cookies in bulk from an NDJSON or CSV file.
+
+    Each record has cookie, type, account and usage_type; records with a cookie_key update
+    the existing cookie, changing only the fields they include. Valid cookies go live
+    without a full refresh.
+    """
+    try:
+        records, errors = parse_cookie_import_file(
+            await file.read(), file.filename, file_format
+        )
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=400, detail="Cookie file must be encoded in UTF-8."
+        )
+    result = await bulk_upsert_and_register(records, manager)
+    return {**result, "errors": [error.model_dump() for error in errors]}
+
+
+@router.put("/bulk_update_cookies")
+async def bulk_update_cookies(
+    records: List[CookieImportRecord],
+    manager: CookieManager = Depends(get_cookie_manager),
+):
+    """Update existing cookies in bulk, changing only the fields each record includes."""
+    missing = [idx for idx, record in enumerate(records) if not record.cookie_key]
+    if missing:
+        raise HTTPException(
+            status_code=400, detail=f"cookie_key is required, missing at: {missing}"
+        )
+    return await bulk_upsert_and_register(records, manager)
+
+
 @router.put("/update_cookie/{cookie_key}")
 async def update_cookie(
     cookie_key: str,
@@ -0,0 +1,88 @@
+import csv
+import io
+import json
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+from rev_claude.cookie.claude_cookie_manage import CookieKeyType, CookieUsageType
+
+
+class CookieImportRecord(BaseModel):
+    cookie: str
+    type: CookieKeyType = CookieKeyType.BASIC
+    account: str = ""
+    usage_type: Optional[CookieUsageType] = None
+    # 带上cookie_key的时候就是更新已有的cookie
+    cookie_key: Optional[str] = None
+
+    @field_validator("type", "cookie_key", mode="before")
+    @classmethod
+    def empty_to_default(cls, value, info):
+        if value == "":
+            return CookieKeyType.BASIC if info.field_name == "type" else None
+        return value
+
+    @field_validator("usage_type", mode="before")
+    @classmethod
+    def parse_usage_type(cls, value):
+        # csv 里面可能是 "", "1" 或者 "REVERSE_API_ONLY"
+        if isinstance(value, str):
+            if not value:
+                return None
+            if value.isdigit():
+                return int(value)
+            try:
+                return CookieUsageType[value.upper()]
+            except KeyError:
+                raise ValueError(f"Unknown usage type: {value}")
+        return value
+
+
+class CookieImportError(BaseModel):
+    line: int
+    error: str
+
+
+def parse_ndjson(
+    content: str,
+) -> Tuple[List[CookieImportRecord], List[CookieImportError]]:
+    records, errors = [], []
+    for line_number, line in enumerate(content.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            records.append(CookieImportRecord.model_validate(json.loads(line)))
+        except (json.JSONDecodeError, ValidationError) as e:
+            errors.append(CookieImportError(line=line_number, error=str(e)))
+    return records, errors
+
+
+def parse_csv(content: str) -> Tuple[List[CookieImportRecord], List[CookieImportError]]:
+    records, errors = [], []
+    reader = csv.DictReader(io.StringIO(content))
+    # 表头占了第一行
+    for line_number, row in enumerate(reader, start=2):
+        try:
+            # 空的单元格当作没有给出这个字段, 更新的时候不会覆盖原来的值
+            row = {
+                key.strip(): value.strip()
+                for key, value in row.items()
+                if key and value and value.strip()
+            }
+            records.append(CookieImportRecord.model_validate(row))
+        except ValidationError as e:
+            errors.append(CookieImportError(line=line_number, error=str(e)))
+    return records, errors
+
+
+def parse_cookie_import_file(
+    content: bytes, file_name: str = "", file_format: Optional[str] = None
+) -> Tuple[List[CookieImportRecord], List[CookieImportError]]:
+    """解析 NDJSON 或 CSV 格式的批量cookie, 没有指定格式的时候按文件后缀判断。"""
+    text = content.decode("utf-8-sig")
+    if file_format is None:
+        file_format = "csv" if (file_name or "").lower().endswith(".csv") else "ndjson"
+    if file_format == "csv":
+        return parse_csv(text)
+    return parse_ndjson(text)
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+
+from rev_claude.configs import (
+    ORGANIZATION_ID_TTL_SECONDS,
+    ORGANIZATION_REVALIDATE_BATCH_INTERVAL,
+    ORGANIZATION_REVALIDATE_BATCH_SIZE,
+)
+from rev_claude.cookie.claude_cookie_manage import get_cookie_manager
+
+
+class OrganizationIdCache:
+    """organization_id 的缓存层。
+
+    超过 TTL 的 organization_id 依然会被使用(stale-while-revalidate),
+    由后台任务分批重新校验; 单个账号遇到 permission_error 时只重新校验这个账号。
+    """
+
+    # 同一个账号同时只会有一个校验请求, 其他调用者共享结果
+    _inflight: Dict[str, asyncio.Task] = {}
+
+    def __init__(self, ttl: float = ORGANIZATION_ID_TTL_SECONDS):
+        self.ttl = ttl
+        self.cookie_manager = get_cookie_manager()
+
+    async def get(self, cookie_key: str) -> Tuple[Optional[str], bool]:
+        """返回 (organization_id, is_stale), 没有缓存时 is_stale 为 True。"""
+        organization_id = await self.cookie_manager.get_organization_id(cookie_key)
+        if organization_id is None:
+            return None, True
+        checked_at = await self.cookie_manager.get_organization_checked_at(cookie_key)
+        is_stale = checked_at is None or time.time() - checked_at > self.ttl
+        return organization_id, is_stale
+
+    async def _revalidate(self, client) -> Optional[str]:
+        old_organization_id = getattr(client, "organization_id", None)
+        try:
+            organization_id = await client.__set_organization_id__()
+        except Exception as e:
+            # 校验失败的时候继续使用旧的值
+            logger.error(
+                f"Failed to revalidate organization of {client.cookie_key}: {e}"
+            )
+            return old_organization_id
+        await self.cookie_manager.update_organization_id(
+            client.cookie_key, organization_id
+        )
+        if old_organization_id and old_organization_id != organization_id:
+            logger.warning(
+                f"Organization of {client.cookie_key} changed: "
+                f"{old_organization_id} -> {organization_id}"
+            )
+        return organization_id
+
+    async def revalidate(self, client) -> Optional[str]:
+        cookie_key = client.cookie_key
+        task = OrganizationIdCache._inflight.get(cookie_key)
+        if task is None:
+            task = asyncio.create_task(self._revalidate(client))
+            OrganizationIdCache._inflight[cookie_key] = task
+            task.add_done_callback(
+                lambda _: OrganizationIdCache._inflight.pop(cookie_key, None)
+            )
+        # 调用方被取消的时候, 校验任务本身还是会继续完成
+        return await asyncio.shield(task)
+
+    async def revalidate_stale_clients(
+        self,
+        clients,
+        batch_size: int = ORGANIZATION_REVALIDATE_BATCH_SIZE,
+        batch_interval: float = ORGANIZATION_REVALIDATE_BATCH_INTERVAL,
+    ):
+        stale_clients = []
+        for client in clients:
+            _, is_stale = await self.get(client.cookie_key)
+            if is_stale:
+                stale_clients.append(client)
+        logger.info(f"Revalidating organization of {len(stale_clients)} clients")
+
+        for i in range(0, len(stale_clients), batch_size):
+            batch = stale_clients[i : i + batch_size]
+            await asyncio.gather(
+                *[self.revalidate(client) for client in batch],
+                return_exceptions=True,
+            )
+            if i + batch_size < len(stale_clients):
+                await asyncio.sleep(batch_interval)
+        return len(stale_clients)
+
+
+organization_id_cache = OrganizationIdCache()
+
+
+async def revalidate_organization_ids():
+    from rev_claude.client.client_manager import ClientManager
+
+    basic_clients, plus_clients = ClientManager().get_clients()
+    clients = list(plus_clients.values()) + list(basic_clients.values())
+    return await organization_id_cache.revalidate_stale_clients(clients)
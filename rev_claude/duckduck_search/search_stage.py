@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import json
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+from redis.asyncio import Redis
+
+from rev_claude.configs import (
+    REDIS_HOST,
+    REDIS_PORT,
+    WEB_SEARCH_CACHE_TTL,
+    WEB_SEARCH_TIMEOUT,
+)
+from rev_claude.duckduck_search.utils import collect_duckduckgo_results
+from rev_claude.utils.async_task_utils import submit_task2event_loop
+
+WEB_SEARCH_CACHE_PREFIX = "web_search"
+# 问题结尾的标点不影响搜索结果
+TRAILING_PUNCTUATION = "?？!！.。,，;；:： "
+
+
+class WebSearchResult(BaseModel):
+    results: List[Dict[str, str]] = []
+    cached: bool = False
+    # 超过时间预算的时候不再等待, 没有结果
+    timed_out: bool = False
+    elapsed: float = 0
+
+
+def normalize_query(query: str) -> str:
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return " ".join(query.split()).strip(TRAILING_PUNCTUATION)
+
+
+class WebSearchStage:
+    """对话前的联网搜索。
+
+    - 归一化之后的问题作为key, 搜索结果在redis里面缓存 ttl 秒
+    - 同一个进程里面同时搜索同一个问题的请求共用一次搜索
+    - 超过 timeout 秒不再等待, 这次没有搜索结果, 搜索在后台继续并写入缓存,
+      之后同样的问题可以直接用缓存
+    """
+
+    def __init__(
+        self,
+        ttl: int = WEB_SEARCH_CACHE_TTL,
+        timeout: float = WEB_SEARCH_TIMEOUT,
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=0,
+    ):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.host = host
+        self.port = port
+        self.db = db
+        self.aioredis = None
+        self.inflight: Dict[str, asyncio.Task] = {}
+
+    async def get_aioredis(self):
+        if self.aioredis is None:
+            self.aioredis = await Redis.from_url(
+                f"redis://{self.host}:{self.port}/{self.db}", decode_responses=True
+            )
+        return self.aioredis
+
+    def get_cache_key(self, normalized_query: str, max_results: int):
+        digest = hashlib.sha1(normalized_query.encode("utf-8")).hexdigest()
+        return f"{WEB_SEARCH_CACHE_PREFIX}:{digest}:{max_results}"
+
+    async def get_cached(self, cache_key: str) -> Optional[List[Dict[str, str]]]:
+        try:
+            redis_instance = await self.get_aioredis()
+            data = await redis_instance.get(cache_key)
+        except Exception as e:
+            logger.error(f"Failed to read web search cache: {e}")
+            return None
+        return json.loads(data) if data else None
+
+    async def set_cached(self, cache_key: str, results: List[Dict[str, str]]):
+        try:
+            redis_instance = await self.get_aioredis()
+            await redis_instance.set(
+                cache_key, json.dumps(results, ensure_ascii=False), ex=self.ttl
+            )
+        except Exception as e:
+            logger.error(f"Failed to write web search cache: {e}")
+
+    async def _run_search(self, cache_key, query, max_results):
+        results = await submit_task2event_loop(
+            collect_duckduckgo_results, query, max_results
+        )
+        # 没有结果的时候不缓存, 下次重新搜索
+        if results:
+            await self.set_cached(cache_key, results)
+        return results
+
+    def _on_search_done(self, cache_key: str, task: asyncio.Task):
+        self.inflight.pop(cache_key, None)
+        # 超时之后没有人等待这个任务, 在这里取出异常, 避免 never retrieved 的警告
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Web search failed: {task.exception()}")
+
+    def get_or_start_search(self, cache_key: str, query: str, max_results: int):
+        task = self.inflight.get(cache_key)
+        if task is not None:
+            return task
+        task = asyncio.create_task(self._run_search(cache_key, query, max_results))
+        task.add_done_callback(lambda done: self._on_search_done(cache_key, done))
+        self.inflight[cache_key] = task
+        return task
+
+    async def search(self, query: str, max_results: int = 5) -> WebSearchResult:
+        start_time = time.perf_counter()
+        normalized_query = normalize_query(query)
+        cache_key = self.get_cache_key(normalized_query, max_results)
+        cached = await self.get_cached(cache_key)
+        if cached is not None:
+            return WebSearchResult(
+                results=cached,
+                cached=True,
+                elapsed=time.perf_counter() - start_time,
+            )
+
+        task = self.get_or_start_search(cache_key, normalized_query, max_results)
+        remaining = max(self.timeout - (time.perf_counter() - start_time), 0)
+        results, timed_out = [], False
+        try:
+            # shield: 超时的时候只是不再等待, 不取消其他请求也在等待的搜索
+            results = await asyncio.wait_for(asyncio.shield(task), remaining)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Web search exceeded {self.timeout}s, continuing without results"
+            )
+            timed_out = True
+        except Exception as e:
+            logger.error(f"Web search failed: {e}")
+        return WebSearchResult(
+            results=list(results),
+            timed_out=timed_out,
+            elapsed=time.perf_counter() - start_time,
+        )
+
+
+web_search_stage = WebSearchStage()
@@ -1,11 +1,21 @@
 import asyncio
+from typing import Dict, List
 
-from duckduckgo_search import AsyncDDGS
+from duckduckgo_search import DDGS
+
+from rev_claude.configs import WEB_SEARCH_BACKEND_TIMEOUT
+from rev_claude.utils.async_task_utils import submit_task2event_loop
+
+
+def collect_duckduckgo_results(query: str, max_results: int) -> List[Dict[str, str]]:
+    # DDGS 是同步的, 在线程里面执行; 请求完成之后才一次性返回全部结果
+    return list(
+        DDGS(timeout=WEB_SEARCH_BACKEND_TIMEOUT).text(query, max_results=max_results)
+    )
 
 
 async def search_with_duckduckgo(query: str, max_results: int = 10):
-    results = await AsyncDDGS().atext(query, max_results=max_results)
-    return results
+    return await submit_task2event_loop(collect_duckduckgo_results, query, max_results)
 
 
 async def main():
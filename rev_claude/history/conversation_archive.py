@@ -0,0 +1,191 @@
+import sqlite3
+import zlib
+from contextlib import closing
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from rev_claude.configs import CONVERSATION_ARCHIVE_PATH
+from rev_claude.utils.async_task_utils import submit_task2event_loop
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS conversations (
+    history_key TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    model TEXT,
+    title TEXT NOT NULL DEFAULT '',
+    message_count INTEGER NOT NULL DEFAULT 0,
+    last_timestamp REAL NOT NULL DEFAULT 0,
+    history BLOB NOT NULL,
+    PRIMARY KEY (history_key, conversation_id)
+)
+"""
+
+CREATE_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_conversations_last_timestamp
+ON conversations (history_key, last_timestamp)
+"""
+
+
+class ConversationArchive:
+    """冷对话的本地存储(SQLite), 所有的读写都放到线程池里面执行。
+
+    history 字段是 ConversationHistory 的json经过 zlib 压缩之后的内容,
+    其他字段用来在不解压的情况下列出对话摘要。
+    """
+
+    def __init__(self, path: Path = CONVERSATION_ARCHIVE_PATH):
+        self.path = Path(path)
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(CREATE_TABLE_SQL)
+            connection.execute(CREATE_INDEX_SQL)
+            connection.commit()
+            self._initialized = True
+        return connection
+
+    def _execute(self, sql: str, params=(), fetch: bool = False):
+        with closing(self._connect()) as connection:
+            with connection:
+                cursor = connection.execute(sql, params)
+                return cursor.fetchall() if fetch else cursor.rowcount
+
+    @staticmethod
+    def compress_history(history_json: str) -> bytes:
+        return zlib.compress(history_json.encode("utf-8"))
+
+    @staticmethod
+    def decompress_history(data: bytes) -> str:
+        return zlib.decompress(data).decode("utf-8")
+
+    async def save(
+        self,
+        history_key: str,
+        conversation_id: str,
+        model: Optional[str],
+        title: str,
+        message_count: int,
+        last_timestamp: float,
+        history_json: str,
+    ):
+        await submit_task2event_loop(
+            self._execute,
+            "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                history_key,
+                conversation_id,
+                model,
+                title,
+                message_count,
+                last_timestamp,
+                self.compress_history(history_json),
+            ),
+        )
+
+    async def get(self, history_key: str, conversation_id: str) -> Optional[str]:
+        rows = await submit_task2event_loop(
+            self._execute,
+            "SELECT history FROM conversations WHERE history_key = ? AND conversation_id = ?",
+            (history_key, conversation_id),
+            True,
+        )
+        return self.decompress_history(rows[0][0]) if rows else None
+
+    async def delete(self, history_key: str, conversation_id: str):
+        await submit_task2event_loop(
+            self._execute,
+            "DELETE FROM conversations WHERE history_key = ? AND conversation_id = ?",
+            (history_key, conversation_id),
+        )
+
+    async def count(self, history_key: str) -> int:
+        rows = await submit_task2event_loop(
+            self._execute,
+            "SELECT COUNT(*) FROM conversations WHERE history_key = ?",
+            (history_key,),
+            True,
+        )
+        return rows[0][0]
+
+    async def list_summaries(
+        self, history_key: str, offset: int, limit: int
+    ) -> List[Tuple[str, Optional[str], str, int, float]]:
+        return await submit_task2event_loop(
+            self._execute,
+            "SELECT conversation_id, model, title, message_count, last_timestamp "
+            "FROM conversations WHERE history_key = ? "
+            "ORDER BY last_timestamp DESC LIMIT ? OFFSET ?",
+            (history_key, limit, offset),
+            True,
+        )
+
+    async def list_histories(
+        self,
+        history_key: Optional[str] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+        offset: int = 0,
+        limit: int = -1,
+    ) -> List[Tuple[str, str]]:
+        """返回 (history_key, history_json), 按最后活跃时间倒序。"""
+        conditions, params = [], []
+        if history_key is not None:
+            conditions.append("history_key = ?")
+            params.append(history_key)
+        if start_time is not None:
+            conditions.append("last_timestamp >= ?")
+            params.append(start_time)
+        if end_time is not None:
+            conditions.append("last_timestamp <= ?")
+            params.append(end_time)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = await submit_task2event_loop(
+            self._execute,
+            f"SELECT history_key, history FROM conversations {where} "
+            "ORDER BY last_timestamp DESC LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+            True,
+        )
+        return [(key, self.decompress_history(data)) for key, data in rows]
+
+    async def list_history_keys(self) -> List[str]:
+        rows = await submit_task2event_loop(
+            self._execute, "SELECT DISTINCT history_key FROM conversations", (), True
+        )
+        return [row[0] for row in rows]
+
+    def _delete_older_than(self, history_key: str, timestamp: float) -> List[str]:
+        with closing(self._connect()) as connection:
+            with connection:
+                rows = connection.execute(
+                    "SELECT conversation_id FROM conversations "
+                    "WHERE history_key = ? AND last_timestamp < ?",
+                    (history_key, timestamp),
+                ).fetchall()
+                connection.execute(
+                    "DELETE FROM conversations "
+                    "WHERE history_key = ? AND last_timestamp < ?",
+                    (history_key, timestamp),
+                )
+        return [row[0] for row in rows]
+
+    async def delete_older_than(self, history_key: str, timestamp: float) -> List[str]:
+        """删除最后活跃时间早于 timestamp 的对话, 返回删除的对话id。"""
+        return await submit_task2event_loop(
+            self._delete_older_than, history_key, timestamp
+        )
+
+    async def delete_all(self, history_key: str) -> int:
+        return await submit_task2event_loop(
+            self._execute,
+            "DELETE FROM conversations WHERE history_key = ?",
+            (history_key,),
+        )
+
+
+conversation_archive = ConversationArchive()
@@ -1,16 +1,34 @@
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Union
 
+import pytz
 import redis
+from loguru import logger
 from pydantic import BaseModel, Field
 from redis.asyncio import Redis
 
-from rev_claude.configs import REDIS_HOST, REDIS_PORT
+from rev_claude.configs import (
+    CONVERSATION_EXPORT_BATCH_SIZE,
+    CONVERSATION_TITLE_LENGTH,
+    REDIS_HOST,
+    REDIS_PORT,
+)
 from rev_claude.cookie.claude_cookie_manage import CookieKeyType
+from rev_claude.history.conversation_archive import conversation_archive
+from rev_claude.history.conversation_search import (
+    SearchHit,
+    SearchPage,
+    conversation_search_index,
+)
+from rev_claude.history.message_codec import decode_record, encode_record
 from rev_claude.models import ClaudeModels
 from rev_claude.utils.time_zone_utils import get_shanghai_time
 
+SHANGHAI_TZ = pytz.timezone("Asia/Shanghai")
+
+CONVERSATION_HISTORY_PREFIX = "conversation_history-"
+
 
 class RoleType(Enum):
     ASSISTANT = "assistant"
@@ -31,6 +49,27 @@ class ConversationHistory(BaseModel):
     model: ClaudeModels
 
 
+class ConversationSummary(BaseModel):
+    conversation_id: str
+    model: Optional[ClaudeModels] = None
+    title: str = ""
+    message_count: int = 0
+    last_timestamp: Optional[datetime] = None
+
+
+class ConversationSummaryPage(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    summaries: List[ConversationSummary]
+
+
+class ExportedConversation(ConversationHistory):
+    api_key: str
+    client_idx: int
+    conversation_type: str
+
+
 class ConversationHistoryRequestInput(BaseModel):
     client_idx: int
     conversation_type: CookieKeyType
@@ -39,6 +78,80 @@ class ConversationHistoryRequestInput(BaseModel):
     model: Optional[ClaudeModels] = None
 
 
+def encode_message(message: Message) -> bytes:
+    """消息在redis列表里面的紧凑格式, 见 message_codec。"""
+    return encode_record(
+        message.content, message.role == RoleType.ASSISTANT, message.timestamp
+    )
+
+
+def decode_message(record: Union[bytes, str]) -> Message:
+    content, is_assistant, timestamp = decode_record(record)
+    return Message(
+        content=content,
+        role=RoleType.ASSISTANT if is_assistant else RoleType.USER,
+        timestamp=to_shanghai_time(timestamp),
+    )
+
+
+def to_shanghai_time(timestamp: Optional[float]) -> Optional[datetime]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(float(timestamp), SHANGHAI_TZ)
+
+
+def fill_missing_timestamps(history: ConversationHistory) -> ConversationHistory:
+    # 处理可能缺失的时间戳， 如果没有的话， 就返回初始时间戳, 就是刚开始的哪个1970年， 但是单位要和datetime.utcnow()一样
+    default_time = datetime(1970, 1, 1)
+    for message in history.messages:
+        if message.timestamp is None:
+            message.timestamp = default_time
+            default_time = default_time.replace(
+                microsecond=default_time.microsecond + 1
+            )
+    return history
+
+
+def build_conversation_title(messages: List[Message]) -> str:
+    for message in messages:
+        if message.role == RoleType.USER:
+            return message.content[:CONVERSATION_TITLE_LENGTH]
+    return ""
+
+
+# KEYS: 旧的hash, 消息列表, 元数据hash, 对话索引(zset)
+# ARGV: 对话id, model, 标题, 最后的时间戳, 倒序的消息...
+MIGRATE_LEGACY_CONVERSATION_SCRIPT = """
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 1 then
+    local count = #ARGV - 4
+    if count > 0 then
+        redis.call('LPUSH', KEYS[2], unpack(ARGV, 5))
+    end
+    redis.call('HSETNX', KEYS[3], 'model', ARGV[2])
+    redis.call('HSET', KEYS[3], 'title', ARGV[3])
+    redis.call('HINCRBY', KEYS[3], 'message_count', count)
+    -- 已经有新消息写入的时候不要覆盖最后活跃时间
+    if not redis.call('HGET', KEYS[3], 'last_timestamp') then
+        redis.call('HSET', KEYS[3], 'last_timestamp', ARGV[4])
+        redis.call('ZADD', KEYS[4], ARGV[4], ARGV[1])
+    end
+end
+return 0
+"""
+
+# KEYS: 消息列表, 元数据hash, 对话索引(zset)
+# ARGV: 对话id, 已经归档的消息条数
+# 归档期间有新消息写入的时候放弃这次归档
+ARCHIVE_CONVERSATION_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) ~= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('ZREM', KEYS[3], ARGV[1])
+return 1
+"""
+
+
 class ConversationHistoryManager:
     def __init__(self, host=REDIS_HOST, port=REDIS_PORT, db=0):
         """Initialize the connection to Redis."""
@@ -51,6 +164,10 @@ class ConversationHistoryManager:
         # )
 
         self.aioredis = None
+        self.raw_aioredis = None
+        # 长时间不活跃的对话放在本地的SQLite里面
+        self.archive = conversation_archive
+        self.search_index = conversation_search_index
 
     async def get_aioredis(self):
         if self.aioredis is None:
@@ -59,6 +176,14 @@ class ConversationHistoryManager:
             )
         return self.aioredis
 
+    async def get_raw_aioredis(self):
+        # 消息列表里面存的是二进制格式, 读取的时候不能自动解码
+        if self.raw_aioredis is None:
+            self.raw_aioredis = await Redis.from_url(
+                f"redis://{self.host}:{self.port}/{self.db}"
+            )
+        return self.raw_aioredis
+
     async def decoded_get(self, key):
         res = await (await self.get_aioredis()).get(key)
         if isinstance(res, bytes):
@@ -79,124 +204,490 @@ class ConversationHistoryManager:
 
     def get_conversation_history_key(self, request: ConversationHistoryRequestInput):
         if request.conversation_type.value == "normal":
-            return f"conversation_history-{request.api_key}-{request.client_idx}-basic"
-        return f"conversation_history-{request.api_key}-{request.client_idx}-{request.conversation_type.value}"
-
-    # def push_message(
-    #     self, request: ConversationHistoryRequestInput, messages: list[Message]
-    # ):
-    #     conversation_history_key = self.get_conversation_history_key(request)
-    #     conversation_history_data = self.redis.hget(
-    #         conversation_history_key, request.conversation_id
-    #     )
-    #
-    #     if conversation_history_data:
-    #         conversation_history = ConversationHistory.model_validate_json(
-    #             conversation_history_data
-    #         )
-    #         conversation_history.messages.extend(messages)
-    #     else:
-    #         conversation_history = ConversationHistory(
-    #             conversation_id=request.conversation_id,
-    #             messages=messages,
-    #             model=request.model,
-    #         )
-    #
-    #     self.redis.hset(
-    #         conversation_history_key,
-    #         request.conversation_id,
-    #         conversation_history.model_dump_json(),
-    #     )
+            return f"{CONVERSATION_HISTORY_PREFIX}{request.api_key}-{request.client_idx}-basic"
+        return f"{CONVERSATION_HISTORY_PREFIX}{request.api_key}-{request.client_idx}-{request.conversation_type.value}"
+
+    # 旧格式是 conversation_history_key 这个hash, 每个对话整个json存一份;
+    # 新格式每个对话是一个只追加的消息列表加上一个很小的元数据hash,
+    # 另外用一个按最后活跃时间排序的zset作为对话索引。
+    def get_conversation_index_key(self, history_key: str):
+        return f"{history_key}:conversations"
+
+    def get_conversation_messages_key(self, history_key: str, conversation_id: str):
+        return f"{history_key}:messages:{conversation_id}"
+
+    def get_conversation_meta_key(self, history_key: str, conversation_id: str):
+        return f"{history_key}:meta:{conversation_id}"
+
+    async def migrate_legacy_conversation(self, history_key: str, conversation_id: str):
+        """把旧格式里面的对话搬到消息列表的最前面, 只有删除成功的那个调用会真正写入。"""
+        legacy_data = await self.hget_async(history_key, conversation_id)
+        if not legacy_data:
+            return
+        legacy_history = ConversationHistory.model_validate_json(legacy_data)
+        last_message = legacy_history.messages[-1] if legacy_history.messages else None
+        last_timestamp = (
+            last_message.timestamp.timestamp()
+            if last_message and last_message.timestamp
+            else 0
+        )
+        redis_instance = await self.get_aioredis()
+        await redis_instance.eval(
+            MIGRATE_LEGACY_CONVERSATION_SCRIPT,
+            4,
+            history_key,
+            self.get_conversation_messages_key(history_key, conversation_id),
+            self.get_conversation_meta_key(history_key, conversation_id),
+            self.get_conversation_index_key(history_key),
+            conversation_id,
+            legacy_history.model.value,
+            build_conversation_title(legacy_history.messages),
+            last_timestamp,
+            # LPUSH 是倒序插入的
+            *[encode_message(message) for message in reversed(legacy_history.messages)],
+        )
+
+    async def migrate_legacy_conversations(self, history_key: str):
+        redis_instance = await self.get_aioredis()
+        if not await redis_instance.hlen(history_key):
+            return
+        for conversation_id in await redis_instance.hkeys(history_key):
+            await self.migrate_legacy_conversation(history_key, conversation_id)
+
+    async def restore_archived_conversation(
+        self, history_key: str, conversation_id: str
+    ):
+        """已经归档的对话又有新消息的时候, 先把它从SQLite搬回redis。"""
+        redis_instance = await self.get_aioredis()
+        if (
+            await redis_instance.zscore(
+                self.get_conversation_index_key(history_key), conversation_id
+            )
+            is not None
+        ):
+            return
+        history_json = await self.archive.get(history_key, conversation_id)
+        if history_json is None:
+            return
+        # 放回旧格式的hash里面, 复用迁移脚本写入消息列表
+        await redis_instance.hsetnx(history_key, conversation_id, history_json)
+        await self.migrate_legacy_conversation(history_key, conversation_id)
+        await self.archive.delete(history_key, conversation_id)
+
+    async def archive_conversation(self, history_key: str, conversation_id: str):
+        """把一个对话从redis移到SQLite, 返回是否归档成功。"""
+        redis_instance = await self.get_aioredis()
+        index_key = self.get_conversation_index_key(history_key)
+        meta_key = self.get_conversation_meta_key(history_key, conversation_id)
+        histories = await self.load_conversations(history_key, [conversation_id])
+        if not histories:
+            # 索引里面残留的空对话
+            await redis_instance.zrem(index_key, conversation_id)
+            return False
+        history = histories[0]
+        meta = await redis_instance.hgetall(meta_key)
+        await self.archive.save(
+            history_key,
+            conversation_id,
+            history.model.value,
+            meta.get("title", ""),
+            len(history.messages),
+            float(meta.get("last_timestamp", 0)),
+            history.model_dump_json(),
+        )
+        archived = await redis_instance.eval(
+            ARCHIVE_CONVERSATION_SCRIPT,
+            3,
+            self.get_conversation_messages_key(history_key, conversation_id),
+            meta_key,
+            index_key,
+            conversation_id,
+            len(history.messages),
+        )
+        if not archived:
+            await self.archive.delete(history_key, conversation_id)
+        return bool(archived)
+
+    async def delete_conversation(self, history_key: str, conversation_id: str):
+        redis_instance = await self.get_aioredis()
+        async with redis_instance.pipeline(transaction=True) as pipe:
+            pipe.delete(
+                self.get_conversation_messages_key(history_key, conversation_id),
+                self.get_conversation_meta_key(history_key, conversation_id),
+            )
+            pipe.zrem(self.get_conversation_index_key(history_key), conversation_id)
+            await pipe.execute()
+        await self.archive.delete(history_key, conversation_id)
+        await self.search_index.delete_conversation(history_key, conversation_id)
+
+    async def index_messages(
+        self, history_key: str, conversation_id: str, messages: List[Message]
+    ):
+        # 搜索索引只是辅助的, 写入失败不影响对话本身
+        try:
+            await self.search_index.add_messages(
+                history_key,
+                conversation_id,
+                [
+                    (
+                        message.content,
+                        message.role.value,
+                        message.timestamp.timestamp() if message.timestamp else None,
+                    )
+                    for message in messages
+                ],
+            )
+        except Exception as e:
+            logger.error(f"Failed to index messages of {conversation_id}: {e}")
+
     async def push_message(
         self, request: ConversationHistoryRequestInput, messages: list[Message]
     ):
-        conversation_history_key = self.get_conversation_history_key(request)
-        # conversation_history_data = self.redis.hget(
-        #     conversation_history_key, request.conversation_id
-        # )
-        conversation_history_data = await self.hget_async(
-            conversation_history_key, request.conversation_id
+        history_key = self.get_conversation_history_key(request)
+        conversation_id = request.conversation_id
+        await self.restore_archived_conversation(history_key, conversation_id)
+        await self.migrate_legacy_conversation(history_key, conversation_id)
+
+        # 确保所有消息都有时间戳
+        now = get_shanghai_time()
+        for message in messages:
+            message.timestamp = now
+        last_timestamp = now.timestamp()
+
+        meta_key = self.get_conversation_meta_key(history_key, conversation_id)
+        redis_instance = await self.get_raw_aioredis()
+        async with redis_instance.pipeline(transaction=True) as pipe:
+            pipe.rpush(
+                self.get_conversation_messages_key(history_key, conversation_id),
+                *[encode_message(message) for message in messages],
+            )
+            if request.model is not None:
+                pipe.hsetnx(meta_key, "model", request.model.value)
+            title = build_conversation_title(messages)
+            if title:
+                pipe.hsetnx(meta_key, "title", title)
+            pipe.hincrby(meta_key, "message_count", len(messages))
+            pipe.hset(meta_key, "last_timestamp", last_timestamp)
+            pipe.zadd(
+                self.get_conversation_index_key(history_key),
+                {conversation_id: last_timestamp},
+            )
+            await pipe.execute()
+        await self.index_messages(history_key, conversation_id, messages)
+
+    async def search_conversations(
+        self,
+        request: ConversationHistoryRequestInput,
+        query: str,
+        offset: int = 0,
+        limit: int = 20,
+    ) -> SearchPage:
+        history_key = self.get_conversation_history_key(request)
+        total, rows = await self.search_index.search(history_key, query, offset, limit)
+        hits = [
+            SearchHit(
+                conversation_id=conversation_id,
+                role=role,
+                snippet=snippet,
+                timestamp=to_shanghai_time(timestamp),
+            )
+            for conversation_id, role, snippet, timestamp in rows
+        ]
+        return SearchPage(total=total, offset=offset, limit=limit, hits=hits)
+
+    async def rebuild_search_index(self, api_key: Optional[str] = None) -> int:
+        """把已有的对话(包括旧格式和归档的)重新写入搜索索引, 返回对话数。"""
+        count = 0
+        async for conversation in self.export_conversations(api_key=api_key):
+            history_key = self.get_conversation_history_key(
+                ConversationHistoryRequestInput(
+                    client_idx=conversation.client_idx,
+                    conversation_type=conversation.conversation_type,
+                    api_key=conversation.api_key,
+                )
+            )
+            await self.search_index.delete_conversation(
+                history_key, conversation.conversation_id
+            )
+            await self.index_messages(
+                history_key, conversation.conversation_id, conversation.messages
+            )
+            count += 1
+        return count
+
+    async def get_conversation_summaries(
+        self, request: ConversationHistoryRequestInput, offset: int = 0, limit: int = 20
+    ) -> ConversationSummaryPage:
+        """按最后活跃时间倒序分页返回对话摘要, 不读取消息内容。
+
+        redis里面的对话都比归档的对话新, 所以先翻redis里面的, 翻完了再接着翻归档的。
+        """
+        history_key = self.get_conversation_history_key(request)
+        await self.migrate_legacy_conversations(history_key)
+
+        index_key = self.get_conversation_index_key(history_key)
+        redis_instance = await self.get_aioredis()
+        async with redis_instance.pipeline(transaction=False) as pipe:
+            pipe.zcard(index_key)
+            pipe.zrevrange(index_key, offset, offset + limit - 1)
+            hot_total, conversation_ids = await pipe.execute()
+
+        async with redis_instance.pipeline(transaction=False) as pipe:
+            for conversation_id in conversation_ids:
+                pipe.hgetall(
+                    self.get_conversation_meta_key(history_key, conversation_id)
+                )
+            metas = await pipe.execute()
+
+        summaries = [
+            ConversationSummary(
+                conversation_id=conversation_id,
+                model=meta.get("model"),
+                title=meta.get("title", ""),
+                message_count=int(meta.get("message_count", 0)),
+                last_timestamp=to_shanghai_time(meta.get("last_timestamp")),
+            )
+            for conversation_id, meta in zip(conversation_ids, metas)
+        ]
+
+        archived_total = await self.archive.count(history_key)
+        remaining = limit - len(summaries)
+        if remaining > 0 and archived_total:
+            rows = await self.archive.list_summaries(
+                history_key, max(offset - hot_total, 0), remaining
+            )
+            summaries.extend(
+                ConversationSummary(
+                    conversation_id=conversation_id,
+                    model=model,
+                    title=title,
+                    message_count=message_count,
+                    last_timestamp=to_shanghai_time(last_timestamp),
+                )
+                for conversation_id, model, title, message_count, last_timestamp in rows
+            )
+        total = hot_total + archived_total
+        return ConversationSummaryPage(
+            total=total, offset=offset, limit=limit, summaries=summaries
         )
 
-        if conversation_history_data:
-            conversation_history = ConversationHistory.model_validate_json(
-                conversation_history_data
-            )
-            # 确保所有消息都有时间戳
-            for message in messages:
-                # if message.timestamp is None:
-                message.timestamp = get_shanghai_time()
-            conversation_history.messages.extend(messages)
-        else:
-            # 确保所有消息都有时间戳
-            for message in messages:
-                # if message.timestamp is None:
-                message.timestamp = get_shanghai_time()
-            conversation_history = ConversationHistory(
-                conversation_id=request.conversation_id,
-                messages=messages,
-                model=request.model,
-            )
-
-        # self.redis.hset(
-        #     conversation_history_key,
-        #     request.conversation_id,
-        #     conversation_history.model_dump_json(),
-        # )
-        await self.hset_async(
-            conversation_history_key,
-            request.conversation_id,
-            conversation_history.model_dump_json(),
+    async def load_conversations(
+        self, history_key: str, conversation_ids: List[str]
+    ) -> List[ConversationHistory]:
+        redis_instance = await self.get_raw_aioredis()
+        async with redis_instance.pipeline(transaction=False) as pipe:
+            for conversation_id in conversation_ids:
+                pipe.lrange(
+                    self.get_conversation_messages_key(history_key, conversation_id),
+                    0,
+                    -1,
+                )
+                pipe.hget(
+                    self.get_conversation_meta_key(history_key, conversation_id),
+                    "model",
+                )
+            results = await pipe.execute()
+
+        histories = []
+        for idx, conversation_id in enumerate(conversation_ids):
+            records, model = results[2 * idx], results[2 * idx + 1]
+            if not records or model is None:
+                continue
+            history = ConversationHistory(
+                conversation_id=conversation_id,
+                messages=[decode_message(record) for record in records],
+                model=model.decode("utf-8"),
+            )
+            histories.append(fill_missing_timestamps(history))
+        return histories
+
+    async def get_conversation(
+        self, request: ConversationHistoryRequestInput
+    ) -> Optional[ConversationHistory]:
+        """打开某个对话的时候才读取它的全部消息。"""
+        history_key = self.get_conversation_history_key(request)
+        await self.migrate_legacy_conversation(history_key, request.conversation_id)
+        histories = await self.load_conversations(
+            history_key, [request.conversation_id]
         )
+        if histories:
+            return histories[0]
+        history_json = await self.archive.get(history_key, request.conversation_id)
+        if history_json is None:
+            return None
+        return ConversationHistory.model_validate_json(history_json)
 
-    # def get_conversation_histories(
-    #     self, request: ConversationHistoryRequestInput
-    # ) -> List[ConversationHistory]:
-    #     conversation_history_key = self.get_conversation_history_key(request)
-    #     conversation_histories_data = self.redis.hgetall(conversation_history_key)
-    #     histories = []
-    #
-    #     for conversation_id, history_data in conversation_histories_data.items():
-    #         history = ConversationHistory.model_validate_json(history_data)
-    #         histories.append(history)
-    #
-    #     return histories
     async def get_conversation_histories(
         self, request: ConversationHistoryRequestInput
     ) -> List[ConversationHistory]:
-        conversation_history_key = self.get_conversation_history_key(request)
-        # conversation_histories_data = self.redis.hgetall(conversation_history_key)
-        conversation_histories_data = await self.hgetall_async(conversation_history_key)
-        histories = []
+        history_key = self.get_conversation_history_key(request)
+        await self.migrate_legacy_conversations(history_key)
+        redis_instance = await self.get_aioredis()
+        conversation_ids = await redis_instance.zrevrange(
+            self.get_conversation_index_key(history_key), 0, -1
+        )
+        histories = await self.load_conversations(history_key, conversation_ids)
+        # 归档的对话只有在请求全部历史的时候才从SQLite读出来
+        for _, history_json in await self.archive.list_histories(history_key):
+            histories.append(ConversationHistory.model_validate_json(history_json))
+        return histories
 
-        for conversation_id, history_data in conversation_histories_data.items():
+    async def scan_history_keys(
+        self,
+        api_key: Optional[str] = None,
+        batch_size: int = CONVERSATION_EXPORT_BATCH_SIZE,
+    ) -> AsyncIterator[str]:
+        """分批SCAN出所有的 conversation_history key(不带后缀的那一层)。"""
+        pattern = (
+            f"{CONVERSATION_HISTORY_PREFIX}{api_key}-*"
+            if api_key
+            else f"{CONVERSATION_HISTORY_PREFIX}*"
+        )
+        redis_instance = await self.get_aioredis()
+        seen = set()
+        async for key in redis_instance.scan_iter(match=pattern, count=batch_size):
+            history_key = key.split(":", 1)[0]
+            # 模式匹配可能会匹配到以这个api_key开头的其他api_key
+            if api_key and parse_conversation_history_key(history_key)[0] != api_key:
+                continue
+            # 同一个history_key会对应好几个key, 只需要处理一次
+            if history_key in seen:
+                continue
+            seen.add(history_key)
+            yield history_key
+
+    async def iter_legacy_conversations(
+        self,
+        history_key: str,
+        start_time: Optional[float],
+        end_time: Optional[float],
+        batch_size: int,
+    ) -> AsyncIterator[ConversationHistory]:
+        redis_instance = await self.get_aioredis()
+        if await redis_instance.type(history_key) != "hash":
+            return
+        async for _, history_data in redis_instance.hscan_iter(
+            history_key, count=batch_size
+        ):
             history = ConversationHistory.model_validate_json(history_data)
-
-            # 处理可能缺失的时间戳， 如果没有的话， 就返回初始时间戳, 就是刚开始的哪个1970年， 但是单位要和datetime.utcnow()一样
-
-            default_time = datetime(1970, 1, 1)
-            for message in history.messages:
-                if message.timestamp is None:
-                    message.timestamp = default_time
-                    default_time = default_time.replace(
-                        microsecond=default_time.microsecond + 1
+            last_timestamp = (
+                history.messages[-1].timestamp.timestamp()
+                if history.messages and history.messages[-1].timestamp
+                else 0
+            )
+            if start_time is not None and last_timestamp < start_time:
+                continue
+            if end_time is not None and last_timestamp > end_time:
+                continue
+            yield fill_missing_timestamps(history)
+
+    async def iter_conversations(
+        self,
+        history_key: str,
+        start_time: Optional[float],
+        end_time: Optional[float],
+        batch_size: int,
+    ) -> AsyncIterator[ConversationHistory]:
+        redis_instance = await self.get_aioredis()
+        index_key = self.get_conversation_index_key(history_key)
+        offset = 0
+        while True:
+            conversation_ids = await redis_instance.zrangebyscore(
+                index_key,
+                "-inf" if start_time is None else start_time,
+                "+inf" if end_time is None else end_time,
+                start=offset,
+                num=batch_size,
+            )
+            if not conversation_ids:
+                return
+            # 一次只把一个对话的消息读进内存
+            for conversation_id in conversation_ids:
+                for history in await self.load_conversations(
+                    history_key, [conversation_id]
+                ):
+                    yield history
+            offset += len(conversation_ids)
+
+    async def iter_archived_conversations(
+        self,
+        history_key: str,
+        start_time: Optional[float],
+        end_time: Optional[float],
+        batch_size: int,
+    ) -> AsyncIterator[ConversationHistory]:
+        offset = 0
+        while True:
+            rows = await self.archive.list_histories(
+                history_key, start_time, end_time, offset, batch_size
+            )
+            if not rows:
+                return
+            for _, history_json in rows:
+                yield ConversationHistory.model_validate_json(history_json)
+            offset += len(rows)
+
+    async def export_conversations(
+        self,
+        api_key: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        batch_size: int = CONVERSATION_EXPORT_BATCH_SIZE,
+    ) -> AsyncIterator[ExportedConversation]:
+        """按最后活跃时间和api_key过滤, 逐个返回对话, 内存占用和对话总数无关。"""
+        start = start_time.timestamp() if start_time else None
+        end = end_time.timestamp() if end_time else None
+        history_keys = [
+            history_key
+            async for history_key in self.scan_history_keys(api_key, batch_size)
+        ]
+        # 只剩下归档对话的key在redis里面已经不存在了
+        for history_key in await self.archive.list_history_keys():
+            if history_key in history_keys:
+                continue
+            if api_key and parse_conversation_history_key(history_key)[0] != api_key:
+                continue
+            history_keys.append(history_key)
+
+        for history_key in history_keys:
+            key_api_key, client_idx, conversation_type = parse_conversation_history_key(
+                history_key
+            )
+            for iterator in (
+                self.iter_legacy_conversations(history_key, start, end, batch_size),
+                self.iter_conversations(history_key, start, end, batch_size),
+                self.iter_archived_conversations(history_key, start, end, batch_size),
+            ):
+                async for history in iterator:
+                    yield ExportedConversation(
+                        **history.model_dump(),
+                        api_key=key_api_key,
+                        client_idx=client_idx,
+                        conversation_type=conversation_type,
                     )
-            histories.append(history)
-        histories.sort(
-            key=lambda h: (
-                h.messages[-1].timestamp.replace(tzinfo=None)
-                if h.messages
-                else datetime.min
-            ),
-            reverse=True,
-        )
-
-        return histories
 
     async def delete_all_conversations(self, request: ConversationHistoryRequestInput):
-        conversation_history_key = self.get_conversation_history_key(request)
-        # self.redis.delete(conversation_history_key)
-        await (await self.get_aioredis()).delete(conversation_history_key)
+        history_key = self.get_conversation_history_key(request)
+        redis_instance = await self.get_aioredis()
+        index_key = self.get_conversation_index_key(history_key)
+        conversation_ids = await redis_instance.zrange(index_key, 0, -1)
+        keys = [history_key, index_key]
+        for conversation_id in conversation_ids:
+            keys.append(
+                self.get_conversation_messages_key(history_key, conversation_id)
+            )
+            keys.append(self.get_conversation_meta_key(history_key, conversation_id))
+        await redis_instance.delete(*keys)
+        await self.archive.delete_all(history_key)
+        await self.search_index.delete_all(history_key)
+
+
+def parse_conversation_history_key(history_key: str):
+    """conversation_history-{api_key}-{client_idx}-{type} -> (api_key, client_idx, type)"""
+    api_key, client_idx, conversation_type = history_key[
+        len(CONVERSATION_HISTORY_PREFIX) :
+    ].rsplit("-", 2)
+    return api_key, int(client_idx), conversation_type
 
 
 def get_conversation_history_manager():
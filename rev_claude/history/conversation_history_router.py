@@ -1,14 +1,20 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
 from rev_claude.history.conversation_history_manager import (
     ConversationHistory,
     ConversationHistoryManager,
     ConversationHistoryRequestInput,
+    ConversationSummaryPage,
     Message,
+    SearchPage,
     conversation_history_manager,
 )
+from rev_claude.middlewares.docs_middleware import require_admin_auth
+from rev_claude.utils.compression_utils import gzip_stream
 
 router = APIRouter()
 
@@ -36,20 +42,107 @@ async def get_conversation_histories(
     return histories
 
 
+@router.post("/get_conversation_summaries")
+async def get_conversation_summaries(
+    request: ConversationHistoryRequestInput,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=20, ge=1, le=100),
+) -> ConversationSummaryPage:
+    """Get paginated conversation summaries, most recently active first."""
+    return await conversation_history_manager.get_conversation_summaries(
+        request, offset, limit
+    )
+
+
+@router.post("/get_conversation")
+async def get_conversation(
+    request: ConversationHistoryRequestInput,
+) -> ConversationHistory:
+    """Get all messages of a single conversation."""
+    history = await conversation_history_manager.get_conversation(request)
+    if history is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return history
+
+
+@router.post("/search")
+async def search_conversations(
+    request: ConversationHistoryRequestInput,
+    query: str = Query(min_length=1, max_length=200),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=20, ge=1, le=100),
+) -> SearchPage:
+    """Full-text search over the current client's messages, best matches first."""
+    return await conversation_history_manager.search_conversations(
+        request, query, offset, limit
+    )
+
+
+@router.post("/rebuild_search_index", dependencies=[Depends(require_admin_auth)])
+async def rebuild_search_index(api_key: Optional[str] = None):
+    """Re-index existing conversations, e.g. those stored before search was added."""
+    count = await conversation_history_manager.rebuild_search_index(api_key)
+    return {"message": f"Indexed {count} conversations"}
+
+
 @router.post("/delete_all_conversations")
 async def delete_all_conversations(
     request: ConversationHistoryRequestInput,
 ):
     """Delete all conversations for the current client."""
-    conversation_history_manager.delete_all_conversations(request)
+    await conversation_history_manager.delete_all_conversations(request)
     return {"message": "All conversations deleted successfully"}
 
 
-@router.get("/export_all_conversations")
-async def export_all_conversations():
-    raise NotImplementedError
+async def generate_conversations_ndjson(
+    api_key: Optional[str],
+    start_time: Optional[datetime],
+    end_time: Optional[datetime],
+    limit: Optional[int] = None,
+):
+    count = 0
+    async for conversation in conversation_history_manager.export_conversations(
+        api_key=api_key, start_time=start_time, end_time=end_time
+    ):
+        if limit is not None and count >= limit:
+            break
+        yield (conversation.model_dump_json() + "\n").encode("utf-8")
+        count += 1
+
 
+def build_export_response(chunks, gzip: bool):
+    file_name = f"conversations_{datetime.now().strftime('%Y%m%d%H%M%S')}.ndjson"
+    if gzip:
+        chunks = gzip_stream(chunks)
+        file_name += ".gz"
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
 
-@router.get("/export_all_conversations_test")
-async def export_all_conversations_test():
-    raise NotImplementedError
+
+@router.get("/export_all_conversations", dependencies=[Depends(require_admin_auth)])
+async def export_all_conversations(
+    api_key: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    gzip: bool = False,
+):
+    """Stream all conversations as NDJSON, filtered by API key and last-activity time."""
+    chunks = generate_conversations_ndjson(api_key, start_time, end_time)
+    return build_export_response(chunks, gzip)
+
+
+@router.get(
+    "/export_all_conversations_test", dependencies=[Depends(require_admin_auth)]
+)
+async def export_all_conversations_test(
+    api_key: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    limit: int = Query(default=10, ge=1, le=1000),
+):
+    """Stream only the first few matching conversations, to preview the export format."""
+    chunks = generate_conversations_ndjson(api_key, start_time, end_time, limit)
+    return build_export_response(chunks, gzip=False)
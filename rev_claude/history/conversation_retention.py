@@ -0,0 +1,131 @@
+import asyncio
+import time
+from typing import Tuple
+
+from loguru import logger
+
+from rev_claude.api_key.api_key_manage import APIKeyManager
+from rev_claude.configs import (
+    CONVERSATION_COLD_AFTER_DAYS,
+    CONVERSATION_DEFAULT_RETENTION_DAYS,
+    CONVERSATION_RETENTION_DAYS,
+    CONVERSATION_RETENTION_SWEEP_BATCH_INTERVAL,
+    CONVERSATION_RETENTION_SWEEP_BATCH_SIZE,
+)
+from rev_claude.history.conversation_history_manager import (
+    conversation_history_manager,
+    parse_conversation_history_key,
+)
+from rev_claude.utils.async_task_utils import submit_task2event_loop
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+class ConversationRetentionSweeper:
+    """定期清理对话历史:
+
+    - 超过保留天数(按api key类型)的对话直接删除, 包括已经归档的
+    - 超过 COLD_AFTER_DAYS 没有活跃的对话移到SQLite
+    - api key已经失效的, 它的对话全部移到SQLite
+
+    每处理 batch_size 个对话暂停 batch_interval 秒。
+    """
+
+    def __init__(
+        self,
+        manager=conversation_history_manager,
+        batch_size: int = CONVERSATION_RETENTION_SWEEP_BATCH_SIZE,
+        batch_interval: float = CONVERSATION_RETENTION_SWEEP_BATCH_INTERVAL,
+    ):
+        self.manager = manager
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.api_key_manager = APIKeyManager()
+        self._processed = 0
+
+    @staticmethod
+    def get_retention_seconds(api_key_type: str) -> float:
+        days = CONVERSATION_RETENTION_DAYS.get(
+            api_key_type, CONVERSATION_DEFAULT_RETENTION_DAYS
+        )
+        return days * DAY_SECONDS
+
+    async def _throttle(self):
+        self._processed += 1
+        if self._processed % self.batch_size == 0:
+            await asyncio.sleep(self.batch_interval)
+
+    async def get_api_key_status(self, api_key: str) -> Tuple[bool, str]:
+        is_valid = await submit_task2event_loop(
+            self.api_key_manager.is_api_key_valid, api_key
+        )
+        api_key_type = await submit_task2event_loop(
+            self.api_key_manager.get_api_key_type, api_key
+        )
+        return is_valid, api_key_type
+
+    async def sweep_history_key(self, history_key: str, now: float):
+        """返回 (归档的对话数, 删除的对话数)。"""
+        api_key = parse_conversation_history_key(history_key)[0]
+        is_valid, api_key_type = await self.get_api_key_status(api_key)
+        expire_before = now - self.get_retention_seconds(api_key_type)
+        # api key失效之后不会再有人读这些对话了, 全部移到本地
+        cold_before = now - CONVERSATION_COLD_AFTER_DAYS * DAY_SECONDS
+        if not is_valid:
+            cold_before = now
+
+        await self.manager.migrate_legacy_conversations(history_key)
+        redis_instance = await self.manager.get_aioredis()
+        index_key = self.manager.get_conversation_index_key(history_key)
+
+        deleted = 0
+        for conversation_id in await redis_instance.zrangebyscore(
+            index_key, "-inf", f"({expire_before}"
+        ):
+            await self.manager.delete_conversation(history_key, conversation_id)
+            deleted += 1
+            await self._throttle()
+        expired_ids = await self.manager.archive.delete_older_than(
+            history_key, expire_before
+        )
+        # 过期的消息也不能再被搜索到
+        await self.manager.search_index.delete_conversations(history_key, expired_ids)
+        deleted += len(expired_ids)
+
+        archived = 0
+        for conversation_id in await redis_instance.zrangebyscore(
+            index_key, "-inf", f"({cold_before}"
+        ):
+            if await self.manager.archive_conversation(history_key, conversation_id):
+                archived += 1
+            await self._throttle()
+        return archived, deleted
+
+    async def sweep(self):
+        now = time.time()
+        history_keys = [
+            history_key async for history_key in self.manager.scan_history_keys()
+        ]
+        # 只剩下归档对话的key也要按保留天数清理
+        for history_key in await self.manager.archive.list_history_keys():
+            if history_key not in history_keys:
+                history_keys.append(history_key)
+
+        total_archived, total_deleted = 0, 0
+        for history_key in history_keys:
+            try:
+                archived, deleted = await self.sweep_history_key(history_key, now)
+            except Exception as e:
+                logger.error(f"Failed to sweep conversations of {history_key}: {e}")
+                continue
+            total_archived += archived
+            total_deleted += deleted
+        logger.info(
+            f"Conversation retention sweep: {len(history_keys)} keys, "
+            f"{total_archived} archived, {total_deleted} deleted"
+        )
+        return total_archived, total_deleted
+
+
+async def sweep_conversation_histories():
+    return await ConversationRetentionSweeper().sweep()
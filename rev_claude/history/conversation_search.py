@@ -0,0 +1,214 @@
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from rev_claude.configs import (
+    CONVERSATION_SEARCH_INDEX_PATH,
+    CONVERSATION_SEARCH_SNIPPET_TOKENS,
+)
+from rev_claude.utils.async_task_utils import submit_task2event_loop
+
+# 消息存在普通表里面, 按 history_key 建索引, 查询的时候先筛出这个用户的消息;
+# messages 是它的 external content 全文索引, 由触发器同步。
+# trigram 分词可以直接做中文的子串匹配, 不需要额外的分词器
+SCHEMA_VERSION = 1
+CREATE_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS message_rows (
+    id INTEGER PRIMARY KEY,
+    history_key TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    role TEXT,
+    timestamp REAL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_message_rows_conversation
+ON message_rows (history_key, conversation_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    content,
+    content = 'message_rows',
+    content_rowid = 'id',
+    tokenize = 'trigram'
+);
+CREATE TRIGGER IF NOT EXISTS message_rows_insert AFTER INSERT ON message_rows BEGIN
+    INSERT INTO messages (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS message_rows_delete AFTER DELETE ON message_rows BEGIN
+    INSERT INTO messages (messages, rowid, content)
+    VALUES ('delete', old.id, old.content);
+END;
+"""
+
+# trigram 分词最少需要三个字符才能走索引
+MIN_MATCH_LENGTH = 3
+
+
+class SearchHit(BaseModel):
+    conversation_id: str
+    role: str
+    snippet: str
+    timestamp: Optional[datetime] = None
+
+
+class SearchPage(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    hits: List[SearchHit]
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """把用户输入转成 FTS5 的查询: 每个词作为一个短语, 词之间是 AND。
+
+    有太短的词的时候返回 None, 这个时候改用 LIKE 查询。
+    """
+    terms = query.split()
+    if not terms or any(len(term) < MIN_MATCH_LENGTH for term in terms):
+        return None
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+class ConversationSearchIndex:
+    """对话消息的全文索引(SQLite FTS5), push_message 的时候同步写入。"""
+
+    def __init__(self, path: Path = CONVERSATION_SEARCH_INDEX_PATH):
+        self.path = Path(path)
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._migrate(connection)
+            self._initialized = True
+        return connection
+
+    @staticmethod
+    def _migrate(connection: sqlite3.Connection):
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        with connection:
+            # 旧版本的 messages 是自带内容的全文索引, 没有按用户的索引, 把数据搬到新表
+            legacy = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'messages'"
+            ).fetchone()
+            if legacy:
+                connection.execute("ALTER TABLE messages RENAME TO messages_legacy")
+            connection.executescript(CREATE_TABLES_SQL)
+            if legacy:
+                connection.execute(
+                    "INSERT INTO message_rows "
+                    "(history_key, conversation_id, role, timestamp, content) "
+                    "SELECT history_key, conversation_id, role, timestamp, content "
+                    "FROM messages_legacy"
+                )
+                connection.execute("DROP TABLE messages_legacy")
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _execute(self, sql: str, params=(), fetch: bool = False):
+        with closing(self._connect()) as connection:
+            with connection:
+                cursor = connection.execute(sql, params)
+                return cursor.fetchall() if fetch else cursor.rowcount
+
+    def _executemany(self, sql: str, rows):
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.executemany(sql, rows)
+
+    async def add_messages(
+        self,
+        history_key: str,
+        conversation_id: str,
+        messages: List[Tuple[str, str, Optional[float]]],
+    ):
+        """messages: [(content, role, timestamp)]"""
+        await submit_task2event_loop(
+            self._executemany,
+            "INSERT INTO message_rows "
+            "(content, history_key, conversation_id, role, timestamp) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (content, history_key, conversation_id, role, timestamp)
+                for content, role, timestamp in messages
+            ],
+        )
+
+    async def delete_conversation(self, history_key: str, conversation_id: str):
+        await self.delete_conversations(history_key, [conversation_id])
+
+    async def delete_conversations(self, history_key: str, conversation_ids: List[str]):
+        if not conversation_ids:
+            return
+        await submit_task2event_loop(
+            self._executemany,
+            "DELETE FROM message_rows WHERE history_key = ? AND conversation_id = ?",
+            [(history_key, conversation_id) for conversation_id in conversation_ids],
+        )
+
+    async def delete_all(self, history_key: str):
+        await submit_task2event_loop(
+            self._execute,
+            "DELETE FROM message_rows WHERE history_key = ?",
+            (history_key,),
+        )
+
+    def _search(self, history_key: str, query: str, offset: int, limit: int):
+        match_query = build_match_query(query)
+        if match_query is not None:
+            # CROSS JOIN 固定连接顺序: 先按 history_key 索引取出这个用户的消息,
+            # 再按 rowid 逐条检查是否匹配, 不会先在所有用户的消息里面匹配
+            source = (
+                "message_rows CROSS JOIN messages ON messages.rowid = message_rows.id"
+            )
+            where = "message_rows.history_key = ? AND messages MATCH ?"
+            params = (history_key, match_query)
+            snippet = (
+                f"snippet(messages, 0, '[', ']', '...', "
+                f"{CONVERSATION_SEARCH_SNIPPET_TOKENS})"
+            )
+            order = "messages.rank"
+        else:
+            # 短的词没法用 trigram 索引, 只能逐条匹配这个用户的消息
+            escaped = (
+                query.strip()
+                .replace("\\", "\\\\")
+                .replace("%", "\\%")
+                .replace("_", "\\_")
+            )
+            source = "message_rows"
+            where = "message_rows.history_key = ? AND content LIKE ? ESCAPE '\\'"
+            params = (history_key, f"%{escaped}%")
+            snippet = "substr(content, 1, 200)"
+            order = "timestamp DESC"
+
+        with closing(self._connect()) as connection:
+            total = connection.execute(
+                f"SELECT COUNT(*) FROM {source} WHERE {where}", params
+            ).fetchone()[0]
+            rows = connection.execute(
+                f"SELECT message_rows.conversation_id, message_rows.role, {snippet}, "
+                f"message_rows.timestamp FROM {source} WHERE {where} "
+                f"ORDER BY {order} LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+        return total, rows
+
+    async def search(
+        self, history_key: str, query: str, offset: int = 0, limit: int = 20
+    ) -> Tuple[int, List[Tuple[str, str, str, Optional[float]]]]:
+        """返回 (总数, [(conversation_id, role, snippet, timestamp)]), 按相关度排序。"""
+        if not query.strip():
+            return 0, []
+        return await submit_task2event_loop(
+            self._search, history_key, query, offset, limit
+        )
+
+
+conversation_search_index = ConversationSearchIndex()
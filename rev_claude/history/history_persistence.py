@@ -0,0 +1,177 @@
+import asyncio
+import json
+import time
+import zlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+from rev_claude.configs import (
+    HISTORY_PERSIST_BATCH_SIZE,
+    HISTORY_PERSIST_FAILED_PATH,
+    HISTORY_PERSIST_MAX_RETRIES,
+    HISTORY_PERSIST_QUEUE_SIZE,
+    HISTORY_PERSIST_RETRY_INTERVAL,
+    HISTORY_PERSIST_WORKERS,
+)
+from rev_claude.history.conversation_history_manager import (
+    ConversationHistoryRequestInput,
+    Message,
+    conversation_history_manager,
+)
+from rev_claude.tracing.trace_store import trace_store
+from rev_claude.utils.async_task_utils import submit_task2event_loop
+
+# 后台写入不属于任何请求, 单独作为一个路由记录耗时
+HISTORY_PERSIST_TRACE_ROUTE = "history_persistence"
+
+PersistItem = Tuple[ConversationHistoryRequestInput, List[Message]]
+
+
+def merge_batch(batch: List[PersistItem]) -> List[PersistItem]:
+    """同一个对话连续的几次写入合并成一次, 保持原来的顺序。"""
+    merged: List[PersistItem] = []
+    for request, messages in batch:
+        if merged:
+            last_request, last_messages = merged[-1]
+            if last_request == request:
+                merged[-1] = (last_request, last_messages + messages)
+                continue
+        merged.append((request, list(messages)))
+    return merged
+
+
+class HistoryPersistenceQueue:
+    """对话历史的后台写入队列。
+
+    按 conversation_id 分到不同的worker, 同一个对话的写入始终是有序的;
+    队列满了或者还没有启动的时候直接在调用方写入, 不会丢数据。
+    """
+
+    def __init__(
+        self,
+        manager=conversation_history_manager,
+        workers: int = HISTORY_PERSIST_WORKERS,
+        queue_size: int = HISTORY_PERSIST_QUEUE_SIZE,
+        batch_size: int = HISTORY_PERSIST_BATCH_SIZE,
+        max_retries: int = HISTORY_PERSIST_MAX_RETRIES,
+        retry_interval: float = HISTORY_PERSIST_RETRY_INTERVAL,
+        failed_path: Path = HISTORY_PERSIST_FAILED_PATH,
+    ):
+        self.manager = manager
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.failed_path = Path(failed_path)
+        self.queues: List[asyncio.Queue] = []
+        self.tasks: List[asyncio.Task] = []
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self.tasks)
+
+    def start(self):
+        if self.is_running:
+            return
+        self.queues = [asyncio.Queue(self.queue_size) for _ in range(self.workers)]
+        self.tasks = [
+            asyncio.create_task(self._worker(queue), name=f"history-persist-{idx}")
+            for idx, queue in enumerate(self.queues)
+        ]
+
+    async def stop(self):
+        """等队列里面的写入全部完成之后再停止worker。"""
+        if not self.is_running:
+            return
+        pending = sum(queue.qsize() for queue in self.queues)
+        logger.info(f"Draining {pending} pending history writes")
+        await asyncio.gather(*[queue.join() for queue in self.queues])
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.queues = []
+
+    def _get_queue(self, request: ConversationHistoryRequestInput) -> asyncio.Queue:
+        shard = zlib.crc32((request.conversation_id or "").encode("utf-8"))
+        return self.queues[shard % len(self.queues)]
+
+    async def submit(
+        self, request: ConversationHistoryRequestInput, messages: List[Message]
+    ):
+        if not self.is_running:
+            await self._persist(request, messages)
+            return
+        try:
+            self._get_queue(request).put_nowait((request, messages))
+        except asyncio.QueueFull:
+            logger.warning("History persistence queue is full, writing inline")
+            await self._persist(request, messages)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                try:
+                    merged = merge_batch(batch)
+                except Exception as e:
+                    logger.error(
+                        f"Failed to merge history batch, writing one by one: {e}"
+                    )
+                    merged = batch
+                for request, messages in merged:
+                    # 一条写入失败(比如记录失败的文件写不了)不能让整个 worker 退出
+                    try:
+                        await self._persist(request, messages)
+                    except Exception as e:
+                        logger.error(
+                            f"Dropped history of {request.conversation_id}: {e}"
+                        )
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _persist(
+        self, request: ConversationHistoryRequestInput, messages: List[Message]
+    ):
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries):
+            try:
+                start_time = time.perf_counter()
+                await self.manager.push_message(request, messages)
+                trace_store.observe(
+                    HISTORY_PERSIST_TRACE_ROUTE,
+                    "push_message",
+                    time.perf_counter() - start_time,
+                )
+                return
+            except Exception as e:
+                last_error = e
+                logger.warning(
+                    f"Failed to persist history of {request.conversation_id}. "
+                    f"Retry {attempt + 1}/{self.max_retries}. Error: {e}"
+                )
+                await asyncio.sleep(self.retry_interval * 2**attempt)
+        logger.error(
+            f"Giving up persisting history of {request.conversation_id}: {last_error}"
+        )
+        await submit_task2event_loop(self._save_failed, request, messages)
+
+    def _save_failed(
+        self, request: ConversationHistoryRequestInput, messages: List[Message]
+    ):
+        self.failed_path.parent.mkdir(parents=True, exist_ok=True)
+        record = {
+            "request": request.model_dump(mode="json"),
+            "messages": [message.model_dump(mode="json") for message in messages],
+        }
+        with open(self.failed_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+history_persistence_queue = HistoryPersistenceQueue()
@@ -0,0 +1,84 @@
+import json
+import struct
+import zlib
+from datetime import datetime
+from typing import Optional, Tuple, Union
+
+# 对话消息在redis列表里面的存储格式:
+#   1 字节版本号 + 1 字节标志位 + 8 字节时间戳(double) + 内容
+# 内容超过 COMPRESS_MIN_SIZE 的时候用带预设字典的 zlib 压缩。
+# 预设字典一旦上线就不能修改, 需要修改的时候增加新的版本号并保留旧的字典用于解码。
+
+MESSAGE_FORMAT_V1 = 1
+
+FLAG_ASSISTANT = 1
+FLAG_HAS_TIMESTAMP = 2
+FLAG_COMPRESSED = 4
+
+HEADER = struct.Struct("<BBd")
+
+COMPRESS_MIN_SIZE = 256
+
+# 技术类回答里面常见的片段, 短消息也能从中找到可以复用的内容
+SHARED_DICTIONARY_V1 = (
+    "\n\n```python\nimport \nfrom \ndef \nclass \nreturn \nself.\nasync def await "
+    "```\n\n```javascript\nconst function => console.log(\n```bash\n```json\n"
+    '```html\n<div class="">\n</div>\n```mermaid\ngraph TD\n<svg xmlns='
+    '"http://www.w3.org/2000/svg" \n\n## \n### \n- **\n1. \n2. \n3. | --- |\n'
+    'for i in range(if __name__ == "__main__":\nprint(None True False '
+    "The following Here is an example of This is a Let me explain: "
+    "for example, however, because the function the following code "
+    "我们可以使用 首先, 其次, 最后, 例如: 需要注意的是 总结一下: 下面是一个 "
+    "这个函数 这段代码 你可以 如果你 的时候 以下是 问题 方法 数据 "
+    "https://www. .com/ [1]: "
+).encode("utf-8")
+
+_DICTIONARIES = {MESSAGE_FORMAT_V1: SHARED_DICTIONARY_V1}
+
+
+def _compress(data: bytes) -> bytes:
+    compressor = zlib.compressobj(level=6, zdict=SHARED_DICTIONARY_V1)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress(data: bytes, version: int) -> bytes:
+    decompressor = zlib.decompressobj(zdict=_DICTIONARIES[version])
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def encode_record(
+    content: str, is_assistant: bool, timestamp: Optional[datetime]
+) -> bytes:
+    flags = FLAG_ASSISTANT if is_assistant else 0
+    if timestamp is not None:
+        flags |= FLAG_HAS_TIMESTAMP
+    payload = content.encode("utf-8")
+    if len(payload) >= COMPRESS_MIN_SIZE:
+        compressed = _compress(payload)
+        # 压缩之后反而更大的时候就存原文
+        if len(compressed) < len(payload):
+            payload = compressed
+            flags |= FLAG_COMPRESSED
+    header = HEADER.pack(
+        MESSAGE_FORMAT_V1, flags, timestamp.timestamp() if timestamp else 0.0
+    )
+    return header + payload
+
+
+def decode_record(record: Union[bytes, str]) -> Tuple[str, bool, Optional[float]]:
+    """返回 (content, is_assistant, timestamp), 同时兼容之前的紧凑json格式。"""
+    if isinstance(record, str):
+        record = record.encode("utf-8")
+    if record[:1] == b"{":
+        data = json.loads(record)
+        return data["c"], data["r"] == "assistant", data.get("t")
+
+    version, flags, timestamp = HEADER.unpack_from(record)
+    payload = record[HEADER.size :]
+    if flags & FLAG_COMPRESSED:
+        payload = _decompress(payload, version)
+    return (
+        payload.decode("utf-8"),
+        bool(flags & FLAG_ASSISTANT),
+        timestamp if flags & FLAG_HAS_TIMESTAMP else None,
+    )
@@ -4,7 +4,9 @@ from fastapi import FastAPI
 from loguru import logger
 
 from rev_claude.client.client_manager import ClientManager
+from rev_claude.history.history_persistence import history_persistence_queue
 from rev_claude.periodic_checks.limit_sheduler import LimitScheduler
+from rev_claude.utils.conversion_pool import conversion_pool
 from rev_claude.utils.time_zone_utils import set_cn_time_zone
 
 
@@ -15,12 +17,20 @@ async def on_startup():
     logger.info("Clients loaded")
     await LimitScheduler.start()
     logger.info("Scheduler started")
+    history_persistence_queue.start()
+    logger.info("History persistence queue started")
 
 
 async def on_shutdown():
     logger.info("Shutting down")
     await LimitScheduler.shutdown()
     logger.info("Scheduler stopped")
+    await history_persistence_queue.stop()
+    logger.info("History persistence queue drained")
+    conversion_pool.shutdown()
+    logger.info("Document conversion pool stopped")
+    await ClientManager().close_clients()
+    logger.info("Client connection pools closed")
 
 
 @asynccontextmanager
@@ -1,6 +1,7 @@
 import base64
 import secrets
 
+from fastapi import HTTPException
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.requests import Request
 from starlette.responses import Response
@@ -8,26 +9,37 @@ from starlette.responses import Response
 from rev_claude.configs import DOCS_PASSWORD, DOCS_USERNAME
 
 
+def check_basic_auth(auth_header) -> bool:
+    if not auth_header:
+        return False
+    try:
+        scheme, credentials = auth_header.split()
+        if scheme.lower() != "basic":
+            return False
+        decoded = base64.b64decode(credentials).decode("ascii")
+        username, password = decoded.split(":")
+        correct_username = secrets.compare_digest(username, DOCS_USERNAME)
+        correct_password = secrets.compare_digest(password, DOCS_PASSWORD)
+        return correct_username and correct_password
+    except:
+        return False
+
+
+async def require_admin_auth(request: Request):
+    """维护用的接口和文档使用同一个账号密码。"""
+    if not check_basic_auth(request.headers.get("Authorization")):
+        raise HTTPException(
+            status_code=401,
+            detail="Unauthorized",
+            headers={"WWW-Authenticate": "Basic"},
+        )
+
+
 class ApidocBasicAuthMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
         if request.url.path in ["/docs", "/redoc", "/openapi.json"]:
-            auth_header = request.headers.get("Authorization")
-            if auth_header:
-                try:
-                    scheme, credentials = auth_header.split()
-                    if scheme.lower() == "basic":
-                        decoded = base64.b64decode(credentials).decode("ascii")
-                        username, password = decoded.split(":")
-                        correct_username = secrets.compare_digest(
-                            username, DOCS_USERNAME
-                        )
-                        correct_password = secrets.compare_digest(
-                            password, DOCS_PASSWORD
-                        )
-                        if correct_username and correct_password:
-                            return await call_next(request)
-                except:
-                    pass
+            if check_basic_auth(request.headers.get("Authorization")):
+                return await call_next(request)
             response = Response(content="Unauthorized", status_code=401)
             response.headers["WWW-Authenticate"] = "Basic"
             return response
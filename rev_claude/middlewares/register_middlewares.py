@@ -3,10 +3,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
 
-from rev_claude.configs import IP_REQUEST_LIMIT_PER_MINUTE
+from rev_claude.configs import IP_REQUEST_LIMIT_PER_MINUTE, TRACING_ENABLED
 from rev_claude.middlewares.docs_middleware import ApidocBasicAuthMiddleware
 from rev_claude.middlewares.not_found_middleware import NotFoundResponseMiddleware
 from rev_claude.middlewares.rate_limiter_middleware import RateLimitMiddleware
+from rev_claude.middlewares.tracing_middleware import RequestTracingMiddleware
 
 
 def register_cross_origin(app: FastAPI):
@@ -39,9 +40,16 @@ def register_docs_auth(app: FastAPI):
     return app
 
 
+def register_request_tracing(app: FastAPI):
+    if TRACING_ENABLED:
+        app.add_middleware(RequestTracingMiddleware)
+    return app
+
+
 def register_middleware(app: FastAPI):
     app = register_cross_origin(app)
     app = register_docs_auth(app)
+    app = register_request_tracing(app)
     # app.add_middleware(NotFoundResponseMiddleware)
     # app.add_middleware(RateLimitMiddleware, rate_per_minute=IP_REQUEST_LIMIT_PER_MINUTE)
     return app
@@ -0,0 +1,40 @@
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.requests import Request
+
+from rev_claude.configs import TRACING_PATH_PREFIX
+from rev_claude.tracing.request_trace import RequestTrace, current_trace
+from rev_claude.tracing.trace_store import trace_store
+
+
+def get_route_path(request: Request) -> str:
+    # 用路由的模板而不是实际的url, 避免路径参数让key无限增长
+    route = request.scope.get("route")
+    return getattr(route, "path", "")
+
+
+class RequestTracingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
+        if not request.url.path.startswith(TRACING_PATH_PREFIX):
+            return await call_next(request)
+
+        trace = RequestTrace()
+        token = current_trace.set(trace)
+        try:
+            response = await call_next(request)
+        finally:
+            current_trace.reset(token)
+        trace.route = get_route_path(request)
+        # 流式响应的响应头里面只有开始返回之前的阶段
+        response.headers["Server-Timing"] = trace.server_timing()
+
+        body_iterator = response.body_iterator
+
+        async def traced_body_iterator():
+            try:
+                async for chunk in body_iterator:
+                    yield chunk
+            finally:
+                trace_store.submit_trace(trace)
+
+        response.body_iterator = traced_body_iterator()
+        return response
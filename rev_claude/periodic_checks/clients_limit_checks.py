@@ -1,13 +1,40 @@
 import asyncio
 import time
+from typing import Optional
 
 from loguru import logger
-from tqdm.asyncio import tqdm
+from pydantic import BaseModel
 
-from rev_claude.configs import CLAUDE_CLIENT_LIMIT_CHECKS_PROMPT, NEW_CONVERSATION_RETRY
+from rev_claude.configs import (
+    CLAUDE_CLIENT_LIMIT_CHECKS_CONCURRENCY,
+    CLAUDE_CLIENT_LIMIT_CHECKS_PROMPT,
+    NEW_CONVERSATION_RETRY,
+)
 from rev_claude.models import ClaudeModels
+from rev_claude.REMINDING_MESSAGE import EXCEED_LIMIT_MESSAGE, PLUS_EXPIRE
+from rev_claude.status.clients_status_manager import ClientsStatusManager
 from rev_claude.utility import get_client_status
 
+PROBE_MODEL = ClaudeModels.SONNET_3_5.value
+
+
+class ProbeOutcome:
+    OK = "ok"
+    LIMITED = "limited"
+    ERROR = "error"
+    SKIPPED = "skipped"
+
+
+class ProbeResult(BaseModel):
+    client_type: str
+    client_idx: int
+    outcome: str
+    message: str = ""
+    latency: float = 0
+    checked_at: float
+    # 在cd中的账号, 恢复可用的时间
+    reset_time: Optional[float] = None
+
 
 async def try_to_create_new_conversation(claude_client, model):
     max_retry = NEW_CONVERSATION_RETRY
@@ -41,36 +68,107 @@ async def try_to_create_new_conversation(claude_client, model):
             return
 
 
-async def simple_new_chat(claude_client, client_type, client_idx):
-    model = ClaudeModels.SONNET_3_5.value
-    conversation_id = await try_to_create_new_conversation(claude_client, model)
-    messages = ""
+async def get_probe_conversation_id(claude_client, status_manager):
+    """每个账号复用同一个检测对话, 没有的时候才创建。"""
+    conversation_id = await status_manager.get_probe_conversation_id(
+        claude_client.cookie_key
+    )
+    if conversation_id:
+        return conversation_id
+    conversation_id = await try_to_create_new_conversation(claude_client, PROBE_MODEL)
+    if conversation_id:
+        await status_manager.set_probe_conversation_id(
+            claude_client.cookie_key, conversation_id
+        )
+    return conversation_id
+
+
+async def probe_first_token(claude_client, conversation_id, client_type, client_idx):
+    """只等第一段回复就断开, 回复的内容已经足够判断账号的状态。"""
+    stream = claude_client.stream_message(
+        prompt=CLAUDE_CLIENT_LIMIT_CHECKS_PROMPT,
+        conversation_id=conversation_id,
+        model=PROBE_MODEL,
+        client_type=client_type,
+        client_idx=client_idx,
+        attachments=[],
+    )
+    try:
+        async for data in stream:
+            if data:
+                return data
+        return ""
+    finally:
+        await stream.aclose()
+
+
+async def probe_client(claude_client, client_type, client_idx) -> ProbeResult:
+    status_manager = ClientsStatusManager()
+    start_time = time.perf_counter()
+    result = ProbeResult(
+        client_type=client_type,
+        client_idx=client_idx,
+        outcome=ProbeOutcome.ERROR,
+        checked_at=time.time(),
+    )
+    # cd中的账号在恢复之前不用检测
+    reset_time = await status_manager.get_reset_time(
+        client_type.replace("normal", "basic"), client_idx, PROBE_MODEL
+    )
+    if reset_time is not None:
+        result.outcome = ProbeOutcome.SKIPPED
+        result.reset_time = reset_time
+        await publish_probe_result(status_manager, result)
+        return result
+
     try:
-        async for data in claude_client.stream_message(
-            prompt=CLAUDE_CLIENT_LIMIT_CHECKS_PROMPT,
-            conversation_id=conversation_id,
-            model=model,
-            client_type=client_type,
-            client_idx=client_idx,
-            attachments=[],
-        ):
-            # logger.info(data)
-            messages += data
+        conversation_id = await get_probe_conversation_id(claude_client, status_manager)
+        if not conversation_id:
+            result.message = "Failed to create probe conversation"
+            return result
+        message = await probe_first_token(
+            claude_client, conversation_id, client_type, client_idx
+        )
+        result.message = message
+        if message == EXCEED_LIMIT_MESSAGE:
+            result.outcome = ProbeOutcome.LIMITED
+            result.reset_time = await status_manager.get_reset_time(
+                client_type.replace("normal", "basic"), client_idx, PROBE_MODEL
+            )
+        elif message == PLUS_EXPIRE or message.startswith("error:") or not message:
+            # 对话可能被删除了, 下次重新创建
+            await status_manager.delete_probe_conversation_id(claude_client.cookie_key)
+        else:
+            result.outcome = ProbeOutcome.OK
     except Exception as e:
         from traceback import format_exc
 
-        messages = f"Error: {e}\n{format_exc()}"
-    return messages
+        result.message = f"Error: {e}\n{format_exc()}"
+    finally:
+        result.latency = time.perf_counter() - start_time
+        await publish_probe_result(status_manager, result)
+    return result
 
 
-async def __check_reverse_official_usage_limits():
+async def publish_probe_result(status_manager, result: ProbeResult):
+    # 检测只在leader上运行, 结果放到redis里面让所有worker都能读到
+    try:
+        await status_manager.set_probe_result(
+            result.client_type, result.client_idx, result.model_dump_json()
+        )
+    except Exception as e:
+        logger.error(f"Failed to publish probe result: {e}")
+
+
+async def get_clients_to_check():
     from rev_claude.client.client_manager import ClientManager
 
-    start_time = time.perf_counter()
     basic_clients, plus_clients = ClientManager().get_clients()
     status_list = await get_client_status(basic_clients, plus_clients)
-    clients = [
-        {
+    clients = {}
+    for status in status_list:
+        # 就算不是官网登录的也要check, 同一个账号只检测一次
+        clients[(status.type, status.idx)] = {
             "client": (
                 plus_clients[status.idx]
                 if status.type == "plus"
@@ -79,87 +177,45 @@ async def __check_reverse_official_usage_limits():
             "type": status.type,
             "idx": status.idx,
         }
-        for status in status_list
-        # if status.is_session_login  就算不是官网登录的也要check。
-    ]
+    return list(clients.values())
 
-    logger.info(f"Found {len(clients)} active clients to check")
 
-    results = []
-
-    # async def check_client(client):
-    #     try:
-    #         # logger.debug(f"Testing client {client['type']} {client['idx']}")
-    #         res = await simple_new_chat(client["client"], client["type"], client["idx"])
-    #         # logger.debug(
-    #         #     f"Completed test for client {client['type']} {client['idx']}\n: {res}"
-    #         # )
-    #         return f"Client {client['type']} {client['idx']}: {res}"
-    #     except Exception as e:
-    #         error_msg = f"Error testing client {client['type']} {client['idx']}: {e}"
-    #         logger.error(error_msg)
-    #         return error_msg
-    #
-    #
-    # try:
-    #     # tasks = [asyncio.create_task(check_client(client)) for client in clients]
-    #     #     # check_client(client) for client in clients]
-    #     # results = await tqdm.gather(*tasks, desc="Checking clients", unit="client")
-    #     results = []
-    #     for client in clients:
-    #         try:
-    #             logger.debug(f"Testing client {client['type']} {client['idx']}")
-    #             res = await simple_new_chat(client["client"], client["type"], client["idx"])
-    #             logger.debug(f"Completed test for client {client['type']} {client['idx']}\n: {res}")
-    #             results.append(f"Client {client['type']} {client['idx']}: {res}")
-    #         except Exception as e:
-    #             error_msg = f"Error testing client {client['type']} {client['idx']}: {e}"
-    #             logger.error(error_msg)
-    #             results.append(error_msg)
-    #
-    #         # 添加一个短暂的延迟，避免可能的限速问题
-    #         await asyncio.sleep(1)
-    #
-    # except Exception as e:
-    #     logger.error(f"Error during client checks: {e}")
+async def check_clients(clients, concurrency=CLAUDE_CLIENT_LIMIT_CHECKS_CONCURRENCY):
+    semaphore = asyncio.Semaphore(concurrency)
 
     async def check_client(client):
-        try:
+        async with semaphore:
             logger.debug(f"Testing client {client['type']} {client['idx']}")
-            res = await simple_new_chat(client["client"], client["type"], client["idx"])
+            result = await probe_client(client["client"], client["type"], client["idx"])
             logger.debug(
-                f"Completed test for client {client['type']} {client['idx']}\n: {res}"
+                f"Completed test for client {client['type']} {client['idx']}: "
+                f"{result.outcome} in {result.latency:.2f}s"
             )
-            return f"Client {client['type']} {client['idx']}: {res}"
-        except Exception as e:
-            error_msg = f"Error testing client {client['type']} {client['idx']}: {e}"
-            logger.error(error_msg)
-            return error_msg
+            return result
 
-    async def process_batch(batch):
-        return await asyncio.gather(*[check_client(client) for client in batch])
+    return await asyncio.gather(*[check_client(client) for client in clients])
 
-    results = []
-    batch_size = 3  # 每批处理的客户端数量
-    for i in range(0, len(clients), batch_size):
-        batch = clients[i : i + batch_size]
-        logger.info(
-            f"Processing batch {i // batch_size + 1} of {len(clients) // batch_size + 1}"
-        )
-        batch_results = await process_batch(batch)
-        results.extend(batch_results)
-        if i + batch_size < len(clients):
-            logger.info("Waiting between batches...")
-            await asyncio.sleep(1)  # 批次之间的间隔
 
-    logger.info("Completed check_reverse_official_usage_limits")
+async def __check_reverse_official_usage_limits():
+    start_time = time.perf_counter()
+    clients = await get_clients_to_check()
+    logger.info(f"Found {len(clients)} active clients to check")
 
-    # Print all results at the end
-    logger.info("\nResults of client checks:")
+    results = await check_clients(clients)
+
+    logger.info("Completed check_reverse_official_usage_limits")
     time_elapsed = time.perf_counter() - start_time
     logger.debug(f"Time elapsed: {time_elapsed:.2f} seconds")
     for result in results:
-        logger.info(result)
+        logger.info(
+            f"Client {result.client_type} {result.client_idx}: "
+            f"{result.outcome} {result.message}"
+        )
+
+    from rev_claude.periodic_checks.reset_rechecks import schedule_reset_rechecks
+
+    await schedule_reset_rechecks(results)
+    return results
 
 
 async def check_reverse_official_usage_limits():
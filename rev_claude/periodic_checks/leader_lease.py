@@ -0,0 +1,146 @@
+import asyncio
+import os
+import socket
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+from redis.asyncio import Redis
+
+from rev_claude.configs import (
+    REDIS_HOST,
+    REDIS_PORT,
+    SCHEDULER_LEADER_KEY,
+    SCHEDULER_LEADER_LEASE_SECONDS,
+    SCHEDULER_LEADER_RENEW_INTERVAL,
+)
+
+# 只有租约还是自己的时候才续期/释放
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    """基于redis租约的leader选举。
+
+    leader 每 renew_interval 秒续期一次, 进程挂掉之后租约在 lease_seconds 内过期,
+    其他进程就可以拿到租约接管。
+    """
+
+    def __init__(
+        self,
+        key: str = SCHEDULER_LEADER_KEY,
+        lease_seconds: int = SCHEDULER_LEADER_LEASE_SECONDS,
+        renew_interval: float = SCHEDULER_LEADER_RENEW_INTERVAL,
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=0,
+    ):
+        self.key = key
+        self.lease_seconds = lease_seconds
+        self.renew_interval = renew_interval
+        self.host = host
+        self.port = port
+        self.db = db
+        self.instance_id = (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        )
+        self.is_leader = False
+        self.aioredis = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def get_aioredis(self):
+        if self.aioredis is None:
+            self.aioredis = await Redis.from_url(
+                f"redis://{self.host}:{self.port}/{self.db}", decode_responses=True
+            )
+        return self.aioredis
+
+    async def try_acquire(self) -> bool:
+        redis_instance = await self.get_aioredis()
+        if self.is_leader:
+            renewed = await redis_instance.eval(
+                RENEW_LEASE_SCRIPT, 1, self.key, self.instance_id, self.lease_seconds
+            )
+            return bool(renewed)
+        acquired = await redis_instance.set(
+            self.key, self.instance_id, nx=True, ex=self.lease_seconds
+        )
+        return bool(acquired)
+
+    async def _release_lease(self):
+        redis_instance = await self.get_aioredis()
+        await redis_instance.eval(RELEASE_LEASE_SCRIPT, 1, self.key, self.instance_id)
+
+    async def release(self):
+        if not self.is_leader:
+            return
+        await self._release_lease()
+        self.is_leader = False
+
+    async def _become_leader(self, on_acquired, on_lost):
+        try:
+            await on_acquired()
+        except Exception as e:
+            # 没有完成接管的时候交出租约, 让其他进程来当leader, 不能拿着租约却不运行任务
+            logger.error(f"Failed to take over the scheduler, releasing lease: {e}")
+            try:
+                await on_lost()
+            finally:
+                await self._release_lease()
+            return
+        self.is_leader = True
+        logger.info(f"{self.instance_id} became the scheduler leader")
+
+    async def _run(
+        self,
+        on_acquired: Callable[[], Awaitable[None]],
+        on_lost: Callable[[], Awaitable[None]],
+    ):
+        while True:
+            try:
+                is_leader = await self.try_acquire()
+            except Exception as e:
+                # 连不上redis的时候没法确认租约还在, 按失去leader处理
+                logger.error(f"Failed to refresh leader lease: {e}")
+                is_leader = False
+
+            try:
+                if is_leader and not self.is_leader:
+                    await self._become_leader(on_acquired, on_lost)
+                elif not is_leader and self.is_leader:
+                    self.is_leader = False
+                    logger.warning(f"{self.instance_id} lost the scheduler leadership")
+                    await on_lost()
+            except Exception as e:
+                logger.error(f"Failed to switch scheduler leadership: {e}")
+            await asyncio.sleep(self.renew_interval)
+
+    def start(
+        self,
+        on_acquired: Callable[[], Awaitable[None]],
+        on_lost: Callable[[], Awaitable[None]],
+    ):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(on_acquired, on_lost))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.release()
+        except Exception as e:
+            logger.error(f"Failed to release leader lease: {e}")
@@ -2,11 +2,24 @@ from datetime import datetime
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from loguru import logger
 
-from rev_claude.configs import CLAUDE_CLIENT_LIMIT_CHECKS_INTERVAL_MINUTES
+from rev_claude.configs import (
+    CLAUDE_CLIENT_LIMIT_CHECKS_INTERVAL_MINUTES,
+    CLAUDE_CLIENT_RESET_RECHECK_POLL_SECONDS,
+    CONVERSATION_RETENTION_SWEEP_INTERVAL_MINUTES,
+    ORGANIZATION_REVALIDATE_INTERVAL_MINUTES,
+)
+from rev_claude.cookie.organization_cache import revalidate_organization_ids
+from rev_claude.history.conversation_retention import sweep_conversation_histories
 from rev_claude.periodic_checks.clients_limit_checks import (
     check_reverse_official_usage_limits,
 )
+from rev_claude.periodic_checks.leader_lease import LeaderLease
+from rev_claude.periodic_checks.reset_rechecks import (
+    run_due_rechecks,
+    schedule_pending_rechecks,
+)
 
 limit_check_scheduler = AsyncIOScheduler()
 
@@ -15,19 +28,65 @@ limit_check_scheduler.add_job(
     check_reverse_official_usage_limits,
     trigger=IntervalTrigger(minutes=CLAUDE_CLIENT_LIMIT_CHECKS_INTERVAL_MINUTES),
     id="check_usage_limits",
-    name=f"Check API usage limits every {CLAUDE_CLIENT_LIMIT_CHECKS_INTERVAL_MINUTES} minutes",
+    name=f"Safety sweep of API usage limits every {CLAUDE_CLIENT_LIMIT_CHECKS_INTERVAL_MINUTES} minutes",
+    replace_existing=True,
+)
+
+limit_check_scheduler.add_job(
+    revalidate_organization_ids,
+    trigger=IntervalTrigger(minutes=ORGANIZATION_REVALIDATE_INTERVAL_MINUTES),
+    id="revalidate_organization_ids",
+    name=f"Revalidate stale organization ids every {ORGANIZATION_REVALIDATE_INTERVAL_MINUTES} minutes",
+    replace_existing=True,
+)
+
+limit_check_scheduler.add_job(
+    sweep_conversation_histories,
+    trigger=IntervalTrigger(minutes=CONVERSATION_RETENTION_SWEEP_INTERVAL_MINUTES),
+    id="sweep_conversation_histories",
+    name=f"Archive and expire conversation histories every {CONVERSATION_RETENTION_SWEEP_INTERVAL_MINUTES} minutes",
+    replace_existing=True,
+    # 上一次还没扫完的时候不要重复启动
+    max_instances=1,
+    coalesce=True,
+)
+
+limit_check_scheduler.add_job(
+    run_due_rechecks,
+    trigger=IntervalTrigger(seconds=CLAUDE_CLIENT_RESET_RECHECK_POLL_SECONDS),
+    id="run_due_rechecks",
+    name=f"Recheck clients whose limits reset, polling every {CLAUDE_CLIENT_RESET_RECHECK_POLL_SECONDS} seconds",
     replace_existing=True,
+    max_instances=1,
+    coalesce=True,
 )
 
 
+async def on_leader_acquired():
+    limit_check_scheduler.resume()
+    # 补上在别的进程当leader期间进入cd的账号; 失败也不影响定时任务, 之后的轮询会继续处理
+    try:
+        await schedule_pending_rechecks()
+    except Exception as e:
+        logger.error(f"Failed to schedule pending rechecks: {e}")
+
+
+async def on_leader_lost():
+    limit_check_scheduler.pause()
+
+
 class LimitScheduler:
     limit_check_scheduler = limit_check_scheduler
+    leader_lease = LeaderLease()
 
     @staticmethod
     async def start():
         # await check_reverse_official_usage_limits()
-        limit_check_scheduler.start()
+        # 每个进程都启动调度器, 但是只有拿到租约的leader才真正运行定时任务
+        limit_check_scheduler.start(paused=True)
+        LimitScheduler.leader_lease.start(on_leader_acquired, on_leader_lost)
 
     @staticmethod
     async def shutdown():
+        await LimitScheduler.leader_lease.stop()
         limit_check_scheduler.shutdown()
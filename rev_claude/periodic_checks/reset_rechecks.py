@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+from loguru import logger
+
+from rev_claude.configs import (
+    CLAUDE_CLIENT_LIMIT_CHECKS_CONCURRENCY,
+    CLAUDE_CLIENT_RESET_RECHECK_DELAY_SECONDS,
+)
+from rev_claude.periodic_checks.clients_limit_checks import probe_client
+from rev_claude.status.clients_status_manager import ClientsStatusManager
+
+
+def normalize_client_type(client_type):
+    return client_type.replace("normal", "basic")
+
+
+async def schedule_reset_recheck(client_type, client_idx, reset_time):
+    """在账号额度刷新的时候检测一次, 同一个账号只保留最新的一次。
+
+    检测时间写在redis里面, 由定时任务的leader到期之后执行。
+    """
+    client_type = normalize_client_type(client_type)
+    run_at = float(reset_time) + CLAUDE_CLIENT_RESET_RECHECK_DELAY_SECONDS
+    await ClientsStatusManager().add_reset_recheck(client_type, client_idx, run_at)
+    logger.info(
+        f"Scheduled recheck of {client_type} {client_idx} "
+        f"in {run_at - time.time():.0f} seconds"
+    )
+
+
+async def recheck_client(client_type, client_idx):
+    from rev_claude.client.client_manager import ClientManager
+
+    basic_clients, plus_clients = ClientManager().get_clients()
+    clients = plus_clients if client_type == "plus" else basic_clients
+    client = clients.get(client_idx)
+    if client is None:
+        logger.warning(f"Client {client_type} {client_idx} no longer exists")
+        return
+
+    # 所有模型都过了cd的时候先恢复成可用
+    await ClientsStatusManager().set_client_active_when_cd(client_type, client_idx)
+    result = await probe_client(client, client_type, client_idx)
+    logger.info(
+        f"Recheck of {client_type} {client_idx}: {result.outcome} "
+        f"in {result.latency:.2f}s"
+    )
+    # 还在cd中(比如刷新时间推迟了), 按新的时间再检测一次
+    if result.reset_time is not None:
+        await schedule_reset_recheck(client_type, client_idx, result.reset_time)
+    return result
+
+
+async def run_due_rechecks(concurrency=CLAUDE_CLIENT_LIMIT_CHECKS_CONCURRENCY):
+    due = await ClientsStatusManager().pop_due_reset_rechecks()
+    if not due:
+        return []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(client_type, client_idx):
+        async with semaphore:
+            try:
+                return await recheck_client(client_type, client_idx)
+            except Exception as e:
+                logger.error(f"Failed to recheck {client_type} {client_idx}: {e}")
+
+    return await asyncio.gather(*[run(*item) for item in due])
+
+
+async def schedule_reset_rechecks(results):
+    """全量检测之后, 给还在cd中的账号安排刷新时候的检测。"""
+    for result in results:
+        if result.reset_time is not None:
+            await schedule_reset_recheck(
+                result.client_type, result.client_idx, result.reset_time
+            )
+
+
+async def schedule_pending_rechecks():
+    """根据redis里面的cd状态补上检测任务, 不需要请求claude。"""
+    from rev_claude.client.client_manager import ClientManager
+
+    basic_clients, plus_clients = ClientManager().get_clients()
+    status_manager = ClientsStatusManager()
+    count = 0
+    for client_type, clients in (("plus", plus_clients), ("basic", basic_clients)):
+        for client_idx in clients:
+            reset_time = await status_manager.get_next_reset_time(
+                client_type, client_idx
+            )
+            if reset_time is not None:
+                await schedule_reset_recheck(client_type, client_idx, reset_time)
+                count += 1
+    logger.info(f"Scheduled {count} pending rechecks")
+    return count
@@ -1,9 +1,9 @@
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from loguru import logger
 from pydantic import BaseModel
 
-from rev_claude.duckduck_search.utils import search_with_duckduckgo
+from rev_claude.duckduck_search.search_stage import web_search_stage
 
 
 class DuckDuckSearchPrompt(BaseModel):
@@ -19,28 +19,45 @@ User's question:
 {prompt}
     """
 
+    async def search(self) -> List[Dict[str, str]]:
+        search_result = await web_search_stage.search(self.prompt, self.max_results)
+        logger.info(
+            f"Web search returned {len(search_result.results)} results "
+            f"in {search_result.elapsed:.2f}s "
+            f"(cached: {search_result.cached}, timed_out: {search_result.timed_out})"
+        )
+        return search_result.results
+
+    def build_prompt(
+        self, results: List[Dict[str, str]], prompt: Optional[str] = None
+    ) -> Tuple[str, List]:
+        """prompt 是最终发给claude的内容, 默认就是搜索的问题本身。"""
+        prompt = self.prompt if prompt is None else prompt
+        if not results:
+            return prompt, []
+        search_res = ""
+        hrefs = []
+        for idx, res in enumerate(results):
+            body = res["body"]
+            href = res["href"]
+            message = f"[{idx+1}]: {body}"
+            search_res += message + "\n"
+            # [[2]: https://news.cctv.com/china/](https://news.cctv.com/china/)
+            hypper_link = f"[[{idx+1}]: {href}]({href})"
+            hypper_link = f"\n{hypper_link}\n"
+            if idx == 0:
+                hypper_link = "\n" + hypper_link
+            hrefs.append(hypper_link)
+
+        # TODO: this will be fixed later, just a trade off
+        return (
+            self.base_prompt.format(search_results=search_res, prompt=prompt),
+            hrefs,
+        )
+
     async def render_prompt(self) -> Tuple[str, List]:
         try:
-            _res = await search_with_duckduckgo(self.prompt, self.max_results)
-            search_res = ""
-            hrefs = []
-            for idx, res in enumerate(_res):
-                body = res["body"]
-                href = res["href"]
-                message = f"[{idx+1}]: {body}"
-                search_res += message + "\n"
-                # [[2]: https://news.cctv.com/china/](https://news.cctv.com/china/)
-                hypper_link = f"[[{idx+1}]: {href}]({href})"
-                hypper_link = f"\n{hypper_link}\n"
-                if idx == 0:
-                    hypper_link = "\n" + hypper_link
-                hrefs.append(hypper_link)
-
-            # TODO: this will be fixed later, just a trade off
-            return (
-                self.base_prompt.format(search_results=search_res, prompt=self.prompt),
-                hrefs,
-            )
+            return self.build_prompt(await self.search())
         except Exception as e:
             from traceback import format_exc
 
@@ -13,6 +13,7 @@ from rev_claude.history.conversation_history_router import (
 )
 from rev_claude.renewal.renewal_router import router as renewal_router
 from rev_claude.status.clients_status_router import router as clients_status_router
+from rev_claude.tracing.tracing_router import router as tracing_router
 
 router = APIRouter(prefix="/api/v1")
 router.include_router(claude_router, prefix="/claude", tags=["claude"])
@@ -32,3 +33,4 @@ router.include_router(
 router.include_router(devices_router, prefix="/devices", tags=["devices"])
 router.include_router(renewal_router, prefix="/renewal", tags=["renewal"])
 router.include_router(gpt_login_router, prefix="/gpt_login", tags=["gpt_login"])
+router.include_router(tracing_router, prefix="/tracing", tags=["tracing"])
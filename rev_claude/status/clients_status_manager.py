@@ -177,6 +177,90 @@ class ClientsStatusManager:
         # self.redis.set(client_status_start_time_key, json.dumps(start_time_dict))
         await self.set_async(client_status_start_time_key, json.dumps(start_time_dict))
 
+    async def get_reset_time(self, client_type, client_idx, model):
+        """账号这个模型在cd中的时候返回恢复的时间戳, 否则返回None。"""
+        client_status_key = self.get_client_status_key(client_type, client_idx)
+        if await self.decoded_get(client_status_key) != ClientStatus.CD.value:
+            return None
+        start_time_dict = await self.get_dict_value_async(
+            self.get_client_status_start_time_key(client_type, client_idx)
+        )
+        start_time = start_time_dict.get(model)
+        if start_time is None:
+            return None
+        reset_time = float(start_time) + 8 * 3600
+        return reset_time if reset_time > time.time() else None
+
+    async def get_next_reset_time(self, client_type, client_idx):
+        """cd中的账号最早有模型恢复可用的时间戳, 不在cd中的时候返回None。"""
+        client_status_key = self.get_client_status_key(client_type, client_idx)
+        if await self.decoded_get(client_status_key) != ClientStatus.CD.value:
+            return None
+        start_time_dict = await self.get_dict_value_async(
+            self.get_client_status_start_time_key(client_type, client_idx)
+        )
+        current_time = time.time()
+        reset_times = [
+            float(start_time) + 8 * 3600
+            for start_time in start_time_dict.values()
+            if float(start_time) + 8 * 3600 > current_time
+        ]
+        return min(reset_times) if reset_times else None
+
+    # 等待额度刷新之后检测的账号, zset 的分数是检测的时间,
+    # 任何一个worker都可以写入, 由定时任务的leader执行
+    def get_reset_rechecks_key(self):
+        return "reset_rechecks"
+
+    async def add_reset_recheck(self, client_type, client_idx, run_at):
+        await (await self.get_aioredis()).zadd(
+            self.get_reset_rechecks_key(), {f"{client_type}-{client_idx}": run_at}
+        )
+
+    async def pop_due_reset_rechecks(self, now=None):
+        """取出已经到期的账号, 返回 [(client_type, client_idx)]。"""
+        redis_instance = await self.get_aioredis()
+        key = self.get_reset_rechecks_key()
+        members = await redis_instance.zrangebyscore(
+            key, "-inf", now if now is not None else time.time()
+        )
+        due = []
+        for member in members:
+            # 只有删除成功的那一个调用才执行检测
+            if await redis_instance.zrem(key, member):
+                client_type, client_idx = member.rsplit("-", 1)
+                due.append((client_type, int(client_idx)))
+        return due
+
+    # 最近一次检测的结果, 所有worker都可以读取
+    def get_probe_results_key(self):
+        return "probe_results"
+
+    async def set_probe_result(self, client_type, client_idx, result_json):
+        await (await self.get_aioredis()).hset(
+            self.get_probe_results_key(), f"{client_type}-{client_idx}", result_json
+        )
+
+    async def get_probe_results(self):
+        return await (await self.get_aioredis()).hgetall(self.get_probe_results_key())
+
+    # 检测额度用的对话, 每个账号只创建一次
+    def get_probe_conversation_key(self, cookie_key):
+        return f"probe_conversation-{cookie_key}"
+
+    async def get_probe_conversation_id(self, cookie_key):
+        return await self.decoded_get(self.get_probe_conversation_key(cookie_key))
+
+    async def set_probe_conversation_id(self, cookie_key, conversation_id):
+        await self.set_async(
+            self.get_probe_conversation_key(cookie_key), conversation_id
+        )
+
+    async def delete_probe_conversation_id(self, cookie_key):
+        await (await self.get_aioredis()).delete(
+            self.get_probe_conversation_key(cookie_key)
+        )
+
     async def set_client_error(self, client_type, client_idx):
         client_status_key = self.get_client_status_key(client_type, client_idx)
         # self.redis.set(client_status_key, ClientStatus.ERROR.value)
@@ -300,10 +384,7 @@ class ClientsStatusManager:
 
             for idx, client in clients.items():
                 status = await retrieve_client_status(idx, client, client_type, models)
-                cookie_key = client.cookie_key
-                cookie_usage_type = await cookie_manager.get_cookie_usage_type(
-                    cookie_key
-                )
+                cookie_usage_type = cookie_usage_types[client.cookie_key]
 
                 if cookie_usage_type != CookieUsageType.REVERSE_API_ONLY:
                     if status.status == ClientStatus.ACTIVE.value:
@@ -322,15 +403,19 @@ class ClientsStatusManager:
             for idx, client in clients.items():
                 status = await retrieve_client_status(idx, client, client_type, models)
                 status.is_session_login = True
-                cookie_key = client.cookie_key
-                cookie_usage_type = await cookie_manager.get_cookie_usage_type(
-                    cookie_key
-                )
+                cookie_usage_type = cookie_usage_types[client.cookie_key]
                 if cookie_usage_type != CookieUsageType.WEB_LOGIN_ONLY:
                     clients_status.append(status)
 
         clients_status = []
         cookie_manager = get_cookie_manager()
+        # 一次性取出(必要时分配)所有账号的 usage_type
+        cookie_usage_types = await cookie_manager.get_cookie_usage_types(
+            [
+                client.cookie_key
+                for client in list(plus_clients.values()) + list(basic_clients.values())
+            ]
+        )
         if plus_clients:
             # 当然是全部都要测试了， 但是这个for循环了两次， 感觉不太好， anyway。
             last_plus_idx = list(plus_clients.keys())
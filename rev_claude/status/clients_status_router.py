@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import JSONResponse
 
 from rev_claude.periodic_checks.clients_limit_checks import (
+    ProbeResult,
     check_reverse_official_usage_limits,
 )
 from rev_claude.status.clients_status_manager import ClientsStatusManager
@@ -29,3 +30,11 @@ async def update_cookie(
 @router.get("/check_clients_limits")
 async def check_clients_limits():
     await check_reverse_official_usage_limits()
+
+
+@router.get("/probe_results")
+async def get_probe_results() -> list[ProbeResult]:
+    """Latest limit probe outcome and latency of every client, from any worker."""
+    manager = ClientsStatusManager()
+    results = await manager.get_probe_results()
+    return [ProbeResult.model_validate_json(value) for value in results.values()]
@@ -2,4 +2,5 @@ NORMAL_ERROR = 400
 HTTP_480_API_KEY_INVALID = 480
 HTTP_481_IMAGE_UPLOAD_FAILED = 481
 HTTP_482_DOCUMENT_UPLOAD_FAILED = 482
+HTTP_429_TOO_MANY_REQUESTS = 429
 INTERNAL_ERROR = 500
@@ -0,0 +1,88 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class Span(BaseModel):
+    name: str
+    # 相对请求开始的时间, 毫秒
+    start: float
+    duration: float
+    # 同名的阶段(比如重试、逐段更新状态)合并成一个, 耗时累加
+    count: int = 1
+
+
+class RequestTrace:
+    """一个请求里面各个阶段的耗时。
+
+    通过 contextvar 传递, 在路由、Client 和各个 manager 里面都可以直接记录,
+    不需要一层层传参数; 没有在请求里面(比如定时任务)的时候记录是空操作。
+    """
+
+    def __init__(self, route: str = ""):
+        self.route = route
+        self.started_at = time.perf_counter()
+        self.spans: Dict[str, Span] = {}
+
+    @property
+    def elapsed(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def record(self, name: str, start: float, end: Optional[float] = None):
+        """start 和 end 是 time.perf_counter() 的值。"""
+        end = time.perf_counter() if end is None else end
+        duration = (end - start) * 1000
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = Span(
+                name=name, start=(start - self.started_at) * 1000, duration=duration
+            )
+        else:
+            span.duration += duration
+            span.count += 1
+
+    def to_list(self) -> List[dict]:
+        spans = [
+            Span(
+                name=span.name,
+                start=round(span.start, 2),
+                duration=round(span.duration, 2),
+                count=span.count,
+            ).model_dump()
+            for span in self.spans.values()
+        ]
+        spans.append({"name": "total", "start": 0, "duration": round(self.elapsed, 2)})
+        return spans
+
+    def server_timing(self) -> str:
+        # https://www.w3.org/TR/server-timing/
+        return ", ".join(
+            f"{span.name};dur={span.duration:.2f}" for span in self.spans.values()
+        )
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+def get_current_trace() -> Optional[RequestTrace]:
+    return current_trace.get()
+
+
+def record_span(name: str, start: float, end: Optional[float] = None):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.record(name, start, end)
+
+
+@contextmanager
+def trace_span(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, start)
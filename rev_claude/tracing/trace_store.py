@@ -0,0 +1,185 @@
+import asyncio
+import random
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+from pydantic import BaseModel
+from redis.asyncio import Redis
+
+from rev_claude.configs import (
+    REDIS_HOST,
+    REDIS_PORT,
+    TRACE_HISTOGRAM_RETENTION_HOURS,
+    TRACE_SAMPLE_RATE,
+    TRACING_ENABLED,
+)
+from rev_claude.tracing.request_trace import RequestTrace
+
+TRACE_STORE_PREFIX = "request_traces"
+# 直方图每个桶的上限, 毫秒; 超过最后一个的放到 inf 桶里面
+HISTOGRAM_BUCKETS_MS = (
+    5,
+    10,
+    25,
+    50,
+    100,
+    250,
+    500,
+    1000,
+    2500,
+    5000,
+    10000,
+    30000,
+    60000,
+)
+OVERFLOW_BUCKET = "inf"
+
+
+def get_bucket(duration_ms: float) -> str:
+    for bound in HISTOGRAM_BUCKETS_MS:
+        if duration_ms <= bound:
+            return str(bound)
+    return OVERFLOW_BUCKET
+
+
+class SpanHistogram(BaseModel):
+    span: str
+    count: int = 0
+    mean: float = 0
+    # 分位数是所在桶的上限, 只是估计值
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+    buckets: Dict[str, int] = {}
+
+    def estimate_percentile(self, quantile: float) -> Optional[float]:
+        if not self.count:
+            return None
+        threshold = quantile * self.count
+        cumulative = 0
+        for bound in HISTOGRAM_BUCKETS_MS:
+            cumulative += self.buckets.get(str(bound), 0)
+            if cumulative >= threshold:
+                return bound
+        return HISTOGRAM_BUCKETS_MS[-1]
+
+
+class TraceStore:
+    """抽样记录请求各个阶段的耗时, 每个路由每小时一个redis hash。
+
+    hash 的字段是 `阶段|桶` 的计数, 加上每个阶段的 `阶段|count` 和 `阶段|sum`,
+    写入只需要 HINCRBY, 查询的时候再把最近几个小时的合并起来。
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        retention_hours: int = TRACE_HISTOGRAM_RETENTION_HOURS,
+        enabled: bool = TRACING_ENABLED,
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=0,
+    ):
+        self.sample_rate = sample_rate
+        self.retention_hours = retention_hours
+        self.enabled = enabled
+        self.host = host
+        self.port = port
+        self.db = db
+        self.aioredis = None
+        self._pending: Set[asyncio.Task] = set()
+
+    async def get_aioredis(self):
+        if self.aioredis is None:
+            self.aioredis = await Redis.from_url(
+                f"redis://{self.host}:{self.port}/{self.db}", decode_responses=True
+            )
+        return self.aioredis
+
+    @staticmethod
+    def get_hour(timestamp: Optional[float] = None) -> int:
+        return int((timestamp or time.time()) // 3600)
+
+    def get_histogram_key(self, route: str, hour: int):
+        return f"{TRACE_STORE_PREFIX}:{route}:{hour}"
+
+    def get_routes_key(self):
+        return f"{TRACE_STORE_PREFIX}:routes"
+
+    def should_sample(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    async def record(self, route: str, durations: List[Tuple[str, float]]):
+        key = self.get_histogram_key(route, self.get_hour())
+        redis_instance = await self.get_aioredis()
+        async with redis_instance.pipeline(transaction=False) as pipe:
+            for span, duration in durations:
+                pipe.hincrby(key, f"{span}|{get_bucket(duration)}", 1)
+                pipe.hincrby(key, f"{span}|count", 1)
+                pipe.hincrbyfloat(key, f"{span}|sum", duration)
+            pipe.expire(key, self.retention_hours * 3600)
+            pipe.sadd(self.get_routes_key(), route)
+            await pipe.execute()
+
+    async def _record_safely(self, route: str, durations: List[Tuple[str, float]]):
+        try:
+            await self.record(route, durations)
+        except Exception as e:
+            logger.error(f"Failed to record request trace: {e}")
+
+    def _submit(self, route: str, durations: List[Tuple[str, float]]):
+        # 在后台写入, 不占用请求的时间
+        task = asyncio.create_task(self._record_safely(route, durations))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def submit_trace(self, trace: RequestTrace):
+        if not trace.route or not self.should_sample():
+            return
+        durations = [(span.name, span.duration) for span in trace.spans.values()]
+        durations.append(("total", trace.elapsed))
+        self._submit(trace.route, durations)
+
+    def observe(self, route: str, span: str, seconds: float):
+        """记录不在请求里面的耗时, 比如后台写入对话历史。"""
+        if self.should_sample():
+            self._submit(route, [(span, seconds * 1000)])
+
+    async def get_routes(self) -> List[str]:
+        redis_instance = await self.get_aioredis()
+        return sorted(await redis_instance.smembers(self.get_routes_key()))
+
+    async def get_histograms(self, route: str, hours: int = 24) -> List[SpanHistogram]:
+        current_hour = self.get_hour()
+        redis_instance = await self.get_aioredis()
+        async with redis_instance.pipeline(transaction=False) as pipe:
+            for hour in range(current_hour - hours + 1, current_hour + 1):
+                pipe.hgetall(self.get_histogram_key(route, hour))
+            hourly = await pipe.execute()
+
+        histograms: Dict[str, SpanHistogram] = {}
+        sums: Dict[str, float] = {}
+        for fields in hourly:
+            for field, value in fields.items():
+                span, _, name = field.rpartition("|")
+                histogram = histograms.setdefault(span, SpanHistogram(span=span))
+                if name == "count":
+                    histogram.count += int(value)
+                elif name == "sum":
+                    sums[span] = sums.get(span, 0) + float(value)
+                else:
+                    histogram.buckets[name] = histogram.buckets.get(name, 0) + int(
+                        value
+                    )
+
+        for span, histogram in histograms.items():
+            if histogram.count:
+                histogram.mean = round(sums.get(span, 0) / histogram.count, 2)
+            histogram.p50 = histogram.estimate_percentile(0.5)
+            histogram.p90 = histogram.estimate_percentile(0.9)
+            histogram.p99 = histogram.estimate_percentile(0.99)
+        return sorted(histograms.values(), key=lambda histogram: histogram.span)
+
+
+trace_store = TraceStore()
@@ -0,0 +1,19 @@
+from typing import List
+
+from fastapi import APIRouter
+
+from rev_claude.tracing.trace_store import SpanHistogram, trace_store
+
+router = APIRouter()
+
+
+@router.get("/routes")
+async def get_traced_routes() -> List[str]:
+    """Routes with sampled stage timings."""
+    return await trace_store.get_routes()
+
+
+@router.get("/histograms")
+async def get_stage_histograms(route: str, hours: int = 24) -> List[SpanHistogram]:
+    """Latency histogram of every stage of a route over the last `hours` hours."""
+    return await trace_store.get_histograms(route, hours)
@@ -17,6 +17,7 @@ async def _register_clients(
 ):
     retry_count = REGISTER_MAY_RETRY if not reload else REGISTER_MAY_RETRY_RELOAD
     from rev_claude.cookie.claude_cookie_manage import get_cookie_manager
+    from rev_claude.cookie.organization_cache import organization_id_cache
 
     cookie_manager = get_cookie_manager()
     while retry_count > 0:
@@ -24,7 +25,8 @@ async def _register_clients(
             client = Client(cookie, cookie_key)
             if not reload:
                 # first , try to obtain it from the reids, if not then register it
-                organization_id = await cookie_manager.get_organization_id(cookie_key)
+                # 过期的 organization_id 先照常使用, 由后台任务分批重新校验
+                organization_id, _ = await organization_id_cache.get(cookie_key)
                 if organization_id:
                     client.organization_id = organization_id
                 else:
@@ -69,6 +71,22 @@ async def _register_clients(
             await asyncio.sleep(REGISTER_WAIT)  # 在重试前暂停1秒
 
 
+async def validate_client(cookie: str, cookie_key: str):
+    """直接向官网获取 organization_id 来校验cookie, 失败时返回 None, 不会删除cookie。"""
+    from rev_claude.cookie.claude_cookie_manage import get_cookie_manager
+
+    cookie_manager = get_cookie_manager()
+    client = Client(cookie, cookie_key)
+    try:
+        organization_id = await client.__set_organization_id__()
+    except Exception as e:
+        logger.error(f"Failed to validate the client {cookie_key}: {e}")
+        await client.aclose()
+        return None
+    await cookie_manager.update_organization_id(cookie_key, organization_id)
+    return client
+
+
 async def register_clients(
     _basic_cookies,
     _basic_cookie_keys,
@@ -0,0 +1,13 @@
+import zlib
+from typing import AsyncIterable, AsyncIterator
+
+
+async def gzip_stream(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """边生成边压缩成gzip格式, 不需要把整个内容放进内存。"""
+    # wbits=31 表示带gzip头
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,159 @@
+import time
+import zlib
+from typing import Optional
+
+from loguru import logger
+from pydantic import BaseModel
+from redis.asyncio import Redis
+
+from rev_claude.configs import (
+    DOCUMENT_CONVERSION_CACHE_ENABLED,
+    DOCUMENT_CONVERSION_CACHE_MAX_BYTES,
+    REDIS_HOST,
+    REDIS_PORT,
+)
+
+CONVERSION_CACHE_PREFIX = "conversion_cache"
+
+# KEYS: 缓存的key, LRU的zset, 总大小的计数
+# ARGV: 压缩后的内容, 当前时间, 大小上限
+# 写入之后从最久没用过的开始淘汰, 直到总大小不超过上限
+SET_CACHE_SCRIPT = """
+local old_size = redis.call('STRLEN', KEYS[1])
+redis.call('SET', KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[2], KEYS[1])
+local size = redis.call('INCRBY', KEYS[3], string.len(ARGV[1]) - old_size)
+local evicted = 0
+while size > tonumber(ARGV[3]) do
+    local oldest = redis.call('ZPOPMIN', KEYS[2])
+    if #oldest == 0 then
+        break
+    end
+    size = redis.call('INCRBY', KEYS[3], -redis.call('STRLEN', oldest[1]))
+    redis.call('DEL', oldest[1])
+    evicted = evicted + 1
+end
+return evicted
+"""
+
+
+class ConversionCacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    hit_rate: float = 0
+    # 命中缓存的时候不需要再转换的上传文件大小
+    bytes_saved: int = 0
+    entries: int = 0
+    size: int = 0
+    max_size: int = 0
+
+
+class ConversionCache:
+    """文档转换结果的缓存, key 是文件内容的sha256加上转换器的版本。"""
+
+    def __init__(
+        self,
+        max_bytes: int = DOCUMENT_CONVERSION_CACHE_MAX_BYTES,
+        enabled: bool = DOCUMENT_CONVERSION_CACHE_ENABLED,
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=0,
+    ):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.host = host
+        self.port = port
+        self.db = db
+        self.aioredis = None
+
+    async def get_aioredis(self):
+        # 缓存的内容是压缩过的二进制, 不能自动解码
+        if self.aioredis is None:
+            self.aioredis = await Redis.from_url(
+                f"redis://{self.host}:{self.port}/{self.db}"
+            )
+        return self.aioredis
+
+    def get_entry_key(self, cache_key: str):
+        return f"{CONVERSION_CACHE_PREFIX}:entry:{cache_key}"
+
+    def get_lru_key(self):
+        return f"{CONVERSION_CACHE_PREFIX}:lru"
+
+    def get_size_key(self):
+        return f"{CONVERSION_CACHE_PREFIX}:size"
+
+    def get_stats_key(self):
+        return f"{CONVERSION_CACHE_PREFIX}:stats"
+
+    @staticmethod
+    def build_cache_key(content_hash: str, *parts) -> str:
+        return ":".join([content_hash, *[str(part) for part in parts]])
+
+    async def get(self, cache_key: str, file_size: int = 0) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            redis_instance = await self.get_aioredis()
+            entry_key = self.get_entry_key(cache_key)
+            data = await redis_instance.get(entry_key)
+            async with redis_instance.pipeline(transaction=False) as pipe:
+                if data is None:
+                    pipe.hincrby(self.get_stats_key(), "misses", 1)
+                else:
+                    pipe.zadd(self.get_lru_key(), {entry_key: time.time()})
+                    pipe.hincrby(self.get_stats_key(), "hits", 1)
+                    pipe.hincrby(self.get_stats_key(), "bytes_saved", file_size)
+                await pipe.execute()
+        except Exception as e:
+            # 缓存不可用的时候直接转换
+            logger.error(f"Failed to read conversion cache: {e}")
+            return None
+        if data is None:
+            return None
+        return zlib.decompress(data).decode("utf-8")
+
+    async def set(self, cache_key: str, extracted_content: str):
+        if not self.enabled:
+            return
+        data = zlib.compress(extracted_content.encode("utf-8"))
+        if len(data) > self.max_bytes:
+            return
+        try:
+            redis_instance = await self.get_aioredis()
+            evicted = await redis_instance.eval(
+                SET_CACHE_SCRIPT,
+                3,
+                self.get_entry_key(cache_key),
+                self.get_lru_key(),
+                self.get_size_key(),
+                data,
+                time.time(),
+                self.max_bytes,
+            )
+            if evicted:
+                logger.info(f"Evicted {evicted} converted documents from cache")
+        except Exception as e:
+            logger.error(f"Failed to write conversion cache: {e}")
+
+    async def get_stats(self) -> ConversionCacheStats:
+        redis_instance = await self.get_aioredis()
+        async with redis_instance.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self.get_stats_key())
+            pipe.zcard(self.get_lru_key())
+            pipe.get(self.get_size_key())
+            stats, entries, size = await pipe.execute()
+        stats = {key.decode("utf-8"): int(value) for key, value in stats.items()}
+        hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+        return ConversionCacheStats(
+            hits=hits,
+            misses=misses,
+            hit_rate=hits / (hits + misses) if hits + misses else 0,
+            bytes_saved=stats.get("bytes_saved", 0),
+            entries=entries,
+            size=int(size or 0),
+            max_size=self.max_bytes,
+        )
+
+
+conversion_cache = ConversionCache()
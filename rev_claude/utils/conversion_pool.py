@@ -0,0 +1,117 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from loguru import logger
+
+from rev_claude.configs import (
+    DOCUMENT_CONVERSION_MEMORY_LIMIT_MB,
+    DOCUMENT_CONVERSION_QUEUE_SIZE,
+    DOCUMENT_CONVERSION_TIMEOUT,
+    DOCUMENT_CONVERSION_WORKERS,
+)
+
+try:
+    import resource
+except ImportError:  # windows 没有 resource 模块
+    resource = None
+
+
+class ConversionPoolBusy(Exception):
+    """正在转换和排队的任务都满了。"""
+
+
+class ConversionTimeout(Exception):
+    pass
+
+
+def _limit_worker_memory(memory_limit_mb: int):
+    if resource is None or memory_limit_mb <= 0:
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class ConversionPool:
+    """文档转换用的进程池。
+
+    同时存在的任务(转换中 + 排队中)超过 workers + queue_size 的时候直接抛出
+    ConversionPoolBusy; 超时的任务没法单独取消, 只能重建整个进程池。
+    """
+
+    def __init__(
+        self,
+        workers: int = DOCUMENT_CONVERSION_WORKERS,
+        queue_size: int = DOCUMENT_CONVERSION_QUEUE_SIZE,
+        timeout: float = DOCUMENT_CONVERSION_TIMEOUT,
+        memory_limit_mb: int = DOCUMENT_CONVERSION_MEMORY_LIMIT_MB,
+    ):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # 第一次用到的时候才启动进程
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_limit_worker_memory,
+                initargs=(self.memory_limit_mb,),
+            )
+        return self._executor
+
+    @property
+    def is_busy(self) -> bool:
+        return self.pending >= self.capacity
+
+    def _reset_executor(self, executor: ProcessPoolExecutor):
+        if self._executor is not executor:
+            return
+        self._executor = None
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        # 卡住的进程不会自己退出, 只能直接结束掉
+        for process in processes:
+            process.terminate()
+
+    async def run(
+        self,
+        func,
+        *args,
+        timeout: Optional[float] = None,
+        check_capacity: bool = True,
+    ):
+        # 同一个文档的后续任务不检查容量, 不然可能转换到一半被拒绝
+        if check_capacity and self.is_busy:
+            raise ConversionPoolBusy()
+        self.pending += 1
+        executor = self.executor
+        try:
+            future = asyncio.get_running_loop().run_in_executor(executor, func, *args)
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Document conversion {func.__name__} timed out")
+            self._reset_executor(executor)
+            raise ConversionTimeout()
+        except BrokenProcessPool:
+            # 进程被系统杀掉了(比如内存不够)
+            logger.error(
+                f"Document conversion pool broke while running {func.__name__}"
+            )
+            self._reset_executor(executor)
+            raise
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+conversion_pool = ConversionPool()
@@ -0,0 +1,202 @@
+import re
+import zipfile
+from typing import Iterator, List, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_NAMESPACE = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+DOCUMENT_PART = "word/document.xml"
+HEADER_PART_PATTERN = re.compile(r"word/header\d*\.xml")
+FOOTER_PART_PATTERN = re.compile(r"word/footer\d*\.xml")
+
+PARAGRAPH = WORD_NAMESPACE + "p"
+TEXT = WORD_NAMESPACE + "t"
+TAB = WORD_NAMESPACE + "tab"
+BREAK = WORD_NAMESPACE + "br"
+CARRIAGE_RETURN = WORD_NAMESPACE + "cr"
+TABLE = WORD_NAMESPACE + "tbl"
+ROW = WORD_NAMESPACE + "tr"
+CELL = WORD_NAMESPACE + "tc"
+GRID_SPAN = f"{WORD_NAMESPACE}tcPr/{WORD_NAMESPACE}gridSpan"
+SPAN_VALUE = WORD_NAMESPACE + "val"
+BODY = WORD_NAMESPACE + "body"
+# 文本框这类新格式的内容会在 Choice 和 Fallback 里面各存一份
+ALTERNATE_CONTENT = MC_NAMESPACE + "AlternateContent"
+CHOICE = MC_NAMESPACE + "Choice"
+FALLBACK = MC_NAMESPACE + "Fallback"
+
+PARAGRAPH_BLOCK = "paragraph"
+TABLE_BLOCK = "table"
+
+# 页眉页脚和正文一样都是以这几个标签作为块的容器
+BLOCK_CONTAINERS = {
+    BODY,
+    WORD_NAMESPACE + "hdr",
+    WORD_NAMESPACE + "ftr",
+}
+
+
+def escape_table_cell(text: str) -> str:
+    return text.replace("|", "\\|").replace("\n", "<br>").strip()
+
+
+def render_markdown_table(rows: List[List[str]]) -> str:
+    """第一行作为表头, 列数不一样的行(合并单元格)用空单元格补齐。"""
+    column_count = max(len(row) for row in rows)
+    lines = []
+    for idx, row in enumerate(rows):
+        cells = [escape_table_cell(cell) for cell in row]
+        cells += [""] * (column_count - len(cells))
+        lines.append("| " + " | ".join(cells) + " |")
+        if idx == 0:
+            lines.append("|" + " --- |" * column_count)
+    return "\n".join(lines)
+
+
+def iter_part_blocks(fp) -> Iterator[Tuple[str, str]]:
+    """增量解析一个xml部件, 按文档顺序产出 (块类型, 内容), 表格转换成markdown。
+
+    每个块处理完之后就从树里面清掉, 内存占用只和最大的一个块有关, 和文档大小无关。
+    文本框里面的内容作为单独的块, 放在所在段落的后面。
+    """
+    container = None
+    paragraphs: List[List[str]] = []
+    # 每个打开的段落里面的文本框产出的块
+    text_boxes: List[List[Tuple[str, str]]] = []
+    # 表格可以嵌套, 每一层是 行 -> 单元格 -> 段落
+    tables: List[List[List[List[str]]]] = []
+    # 表格开始的时候已经打开的段落数, 用来区分表格里面的段落和文本框里面的段落
+    table_depths: List[int] = []
+    # 每层 AlternateContent 是否已经选了一个 Choice
+    alternates: List[bool] = []
+    skip_depth = 0
+
+    def in_table_cell() -> bool:
+        return bool(tables) and table_depths[-1] == len(paragraphs)
+
+    def place(blocks: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """把处理完的块放到表格单元格或者外层段落的文本框里面, 返回需要直接产出的块。"""
+        if in_table_cell():
+            if tables[-1] and tables[-1][-1]:
+                tables[-1][-1][-1].extend(text for _, text in blocks)
+            return []
+        if paragraphs:
+            text_boxes[-1].extend(blocks)
+            return []
+        return blocks
+
+    for event, elem in iterparse(fp, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if skip_depth:
+                skip_depth += 1
+            elif tag == ALTERNATE_CONTENT:
+                alternates.append(False)
+            elif tag == FALLBACK or (tag == CHOICE and alternates and alternates[-1]):
+                # 只用第一个 Choice, 其他的是同样内容的另一种表示
+                skip_depth = 1
+            elif tag == CHOICE and alternates:
+                alternates[-1] = True
+            elif tag in BLOCK_CONTAINERS:
+                container = elem
+            elif tag == PARAGRAPH:
+                paragraphs.append([])
+                text_boxes.append([])
+            elif tag == TABLE:
+                tables.append([])
+                table_depths.append(len(paragraphs))
+            elif tag == ROW and tables:
+                tables[-1].append([])
+            elif tag == CELL and tables and tables[-1]:
+                tables[-1][-1].append([])
+            continue
+
+        if skip_depth:
+            skip_depth -= 1
+            continue
+        if tag == ALTERNATE_CONTENT and alternates:
+            alternates.pop()
+            continue
+        if not paragraphs and not tables:
+            continue
+        if tag == TEXT and paragraphs:
+            paragraphs[-1].append(elem.text or "")
+        elif tag == TAB and paragraphs:
+            paragraphs[-1].append("\t")
+        elif tag in (BREAK, CARRIAGE_RETURN) and paragraphs:
+            paragraphs[-1].append("\n")
+        elif tag == PARAGRAPH:
+            text = "".join(paragraphs.pop())
+            blocks = [(PARAGRAPH_BLOCK, text), *text_boxes.pop()]
+            for block in place([block for block in blocks if block[1]]):
+                yield block
+        elif tag == CELL:
+            # 横向合并的单元格补上空的单元格, 保证后面的列能对齐
+            grid_span = elem.find(GRID_SPAN)
+            if grid_span is not None and tables and tables[-1]:
+                span = int(grid_span.get(SPAN_VALUE, 1))
+                tables[-1][-1].extend([] for _ in range(span - 1))
+            continue
+        elif tag == TABLE:
+            rows = [
+                ["\n".join(p for p in cell if p) for cell in row]
+                for row in tables.pop()
+                if row
+            ]
+            table_depths.pop()
+            if in_table_cell():
+                # 嵌套的表格没法用markdown表示, 把内容放到外层的单元格里面
+                if tables[-1] and tables[-1][-1]:
+                    tables[-1][-1][-1].extend(cell for row in rows for cell in row)
+            elif rows:
+                for block in place([(TABLE_BLOCK, render_markdown_table(rows))]):
+                    yield block
+        else:
+            continue
+
+        # 处理完顶层的块之后, 之前的块都不会再用到了
+        if not paragraphs and not tables and container is not None:
+            container.clear()
+
+
+def iter_docx_blocks(source_fp) -> Iterator[Tuple[str, str, str]]:
+    """按 (部件类型, 块类型, 内容) 依次产出页眉、正文、页脚, 不会构建整个文档的对象模型。"""
+    with zipfile.ZipFile(source_fp) as archive:
+        names = archive.namelist()
+        parts = (
+            [("header", name) for name in names if HEADER_PART_PATTERN.fullmatch(name)]
+            + [("body", DOCUMENT_PART)]
+            + [
+                ("footer", name)
+                for name in names
+                if FOOTER_PART_PATTERN.fullmatch(name)
+            ]
+        )
+        for part_type, name in parts:
+            with archive.open(name) as part:
+                for block_type, block in iter_part_blocks(part):
+                    yield part_type, block_type, block
+
+
+def extract_docx_markdown(source_fp, max_chars: Optional[int] = None):
+    """返回 (文本, 是否因为超过字数上限被截断)。
+
+    不同的节经常用同样的页眉页脚, 相同的内容只保留一次。
+    """
+    blocks, seen, chars = [], set(), 0
+    for part_type, block_type, block in iter_docx_blocks(source_fp):
+        if part_type != "body":
+            if block in seen:
+                continue
+            seen.add(block)
+        if block_type == TABLE_BLOCK:
+            # 表格前后需要空行, markdown才能正确识别
+            block = f"\n{block}\n"
+        if max_chars is not None:
+            remaining = max_chars - chars - (1 if blocks else 0)
+            if len(block) > remaining:
+                blocks.append(block[: max(remaining, 0)])
+                return "\n".join(blocks), True
+        blocks.append(block)
+        chars += len(block) + (1 if len(blocks) > 1 else 0)
+    return "\n".join(blocks), False
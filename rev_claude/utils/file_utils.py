@@ -1,15 +1,132 @@
 import asyncio
+import hashlib
+import os
+import sys
+import tempfile
 from io import BytesIO, StringIO
+from typing import Awaitable, Callable, List, Optional, Tuple
 
-from docx import Document
 from fastapi import UploadFile
 from loguru import logger
-from pdfminer.high_level import extract_text_to_fp
+from pdfminer.converter import TextConverter
 from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
 from pydantic import BaseModel
 from starlette.datastructures import UploadFile as StarletteUploadFile
 
+from rev_claude.configs import (
+    DOCUMENT_EXTRACT_MAX_CHARS,
+    DOCUMENT_PDF_PAGES_PER_JOB,
+    DOCUMENT_PDF_PARALLEL_JOBS,
+    DOCUMENT_PDF_PARALLEL_MIN_PAGES,
+)
 from rev_claude.utils.async_task_utils import submit_task2event_loop
+from rev_claude.utils.conversion_cache import conversion_cache
+from rev_claude.utils.conversion_pool import conversion_pool
+from rev_claude.utils.docx_utils import extract_docx_markdown
+
+# 修改了提取的逻辑之后需要加一, 让之前缓存的转换结果失效
+DOCUMENT_CONVERTER_VERSION = 4
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# (已经提取的页数, 总页数, 已经提取的字符数)
+ProgressCallback = Callable[[int, Optional[int], int], Awaitable[None]]
+
+
+def open_source(source):
+    """转换进程里面的输入可以是文件路径, 也可以是二进制内容。"""
+    if isinstance(source, (bytes, bytearray)):
+        return BytesIO(source)
+    return open(source, "rb")
+
+
+def get_pdf_page_count(document: PDFDocument) -> Optional[int]:
+    try:
+        return int(resolve1(document.catalog["Pages"])["Count"])
+    except Exception:
+        # 页面树损坏的时候没法提前知道总页数
+        return None
+
+
+# 下面的函数在转换进程里面执行, 必须是模块级别的函数才能被pickle
+def extract_pdf_pages(source, start: int, end: int) -> Tuple[Optional[int], List[str]]:
+    """逐页提取 [start, end) 范围内的文本, 返回 (总页数, 每一页的文本)。
+
+    pdfminer 按需读取文件, 不会把整个文件读进内存。
+    """
+    with open_source(source) as fp:
+        document = PDFDocument(PDFParser(fp))
+        total_pages = get_pdf_page_count(document)
+        resource_manager = PDFResourceManager(caching=True)
+        output_buffer = StringIO()
+        device = TextConverter(
+            resource_manager, output_buffer, codec="utf-8", laparams=LAParams()
+        )
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        page_texts = []
+        try:
+            for page_number, page in enumerate(PDFPage.create_pages(document)):
+                if page_number < start:
+                    continue
+                if page_number >= end:
+                    break
+                interpreter.process_page(page)
+                page_texts.append(output_buffer.getvalue())
+                output_buffer.seek(0)
+                output_buffer.truncate()
+        finally:
+            device.close()
+    return total_pages, page_texts
+
+
+def extract_pdf_text(source) -> str:
+    return "".join(extract_pdf_pages(source, 0, sys.maxsize)[1])
+
+
+def extract_docx(source, max_chars: int) -> "ExtractionResult":
+    """流式解析docx, 段落和表格(markdown)按文档顺序输出, 包括页眉页脚。"""
+    with open_source(source) as fp:
+        text, truncated = extract_docx_markdown(fp, max_chars)
+    return ExtractionResult(text=text, truncated=truncated)
+
+
+def extract_docx_text(source) -> str:
+    return extract_docx(source, sys.maxsize).text
+
+
+def hash_file(file) -> Tuple[str, int]:
+    """分块计算上传文件的sha256, 返回 (sha256, 文件大小)。"""
+    file.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := file.read(UPLOAD_CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return digest.hexdigest(), size
+
+
+def copy_to_temp_file(file) -> str:
+    """把上传的文件(SpooledTemporaryFile)复制成一个有路径的临时文件, 转换进程可以直接打开。"""
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".upload") as temp_file:
+        while chunk := file.read(UPLOAD_CHUNK_SIZE):
+            temp_file.write(chunk)
+    file.seek(0)
+    return temp_file.name
+
+
+class ExtractionResult(BaseModel):
+    text: str
+    # 超过字数上限之后后面的内容就没有提取
+    truncated: bool = False
+    pages_extracted: Optional[int] = None
+    total_pages: Optional[int] = None
 
 
 class DocumentConvertedResponse(BaseModel):
@@ -17,43 +134,49 @@ class DocumentConvertedResponse(BaseModel):
     file_type: str
     file_size: int
     extracted_content: str
+    truncated: bool = False
+    pages_extracted: Optional[int] = None
+    total_pages: Optional[int] = None
 
 
 class DocumentConverter:
-    def __init__(self, upload_file: UploadFile):
+    def __init__(
+        self,
+        upload_file: UploadFile,
+        max_chars: int = DOCUMENT_EXTRACT_MAX_CHARS,
+        parallel_min_pages: int = DOCUMENT_PDF_PARALLEL_MIN_PAGES,
+        parallel_jobs: int = DOCUMENT_PDF_PARALLEL_JOBS,
+    ):
         self.upload_file = upload_file
+        self.max_chars = max_chars
+        self.parallel_min_pages = parallel_min_pages
+        self.parallel_jobs = max(1, parallel_jobs)
 
-    async def convert(self):
+    async def convert(self, on_progress: Optional[ProgressCallback] = None):
         file_name = self.upload_file.filename
         file_type = self.upload_file.content_type
-        content = await self.upload_file.read()
-        file_size = len(content)
         logger.debug(f"file_type: {file_type}")
         if self.is_text_file():
+            content = await self.upload_file.read()
             extracted_content = await self.process_text(content)
             return DocumentConvertedResponse(
                 file_name=file_name,
                 file_type=file_type,
-                file_size=file_size,
+                file_size=len(content),
                 extracted_content=extracted_content,
             )
         # docx, pdf,
-        elif self.is_pdf_file():
-            extracted_content = await self.process_pdf(content)
-            return DocumentConvertedResponse(
-                file_name=file_name,
-                file_type=file_type,
-                file_size=file_size,
-                extracted_content=extracted_content,
-            )
-
-        elif self.is_docx_file():
-            extracted_content = await self.process_docx(content)
+        elif self.is_pdf_file() or self.is_docx_file():
+            process = self.process_pdf if self.is_pdf_file() else self.process_docx
+            file_size, result = await self.process_cached(process, on_progress)
             return DocumentConvertedResponse(
                 file_name=file_name,
                 file_type=file_type,
                 file_size=file_size,
-                extracted_content=extracted_content,
+                extracted_content=result.text,
+                truncated=result.truncated,
+                pages_extracted=result.pages_extracted,
+                total_pages=result.total_pages,
             )
 
         else:
@@ -107,48 +230,115 @@ class DocumentConverter:
         extracted_text = await submit_task2event_loop(self.process_text_sync, content)
         return extracted_text
 
-    def process_pdf_sync(self, content):
-        # 将二进制内容转换为类文件对象
-        pdf_content = BytesIO(content)
-
-        # 准备一个输出缓冲区来捕获文本
-        output_buffer = StringIO()
-
-        # 调用函数
-        extract_text_to_fp(
-            inf=pdf_content, outfp=output_buffer, codec="utf-8", laparams=LAParams()
+    async def process_cached(
+        self, process, on_progress: Optional[ProgressCallback] = None
+    ) -> Tuple[int, ExtractionResult]:
+        """返回 (文件大小, 提取结果)。
+
+        同样的文件经常被反复上传, 按内容缓存转换结果; 没有命中缓存的时候才把上传的文件
+        复制到临时文件交给转换进程, 整个过程不会把文件整个读进内存。
+        """
+        upload = self.upload_file.file
+        content_hash, file_size = await submit_task2event_loop(hash_file, upload)
+        cache_key = conversion_cache.build_cache_key(
+            content_hash, DOCUMENT_CONVERTER_VERSION, self.max_chars
         )
-
-        # 从输出缓冲区中检索提取的文本
-        extracted_text = output_buffer.getvalue()
-        return extracted_text
-
-    async def process_pdf(self, content):
-        # 使用 run_in_threadpool 处理同步操作
-        extracted_text = await submit_task2event_loop(self.process_pdf_sync, content)
-        return extracted_text
-
-    def process_docx_sync(self, content):
-        # Convert the binary content to a file-like object
-        docx_file = BytesIO(content)
-
-        # Load the DOCX file with python-docx
-        doc = Document(docx_file)
-
-        # Extract text from each paragraph in the document
-        extracted_text = "\n".join(
-            paragraph.text for paragraph in doc.paragraphs if paragraph.text
+        cached = await conversion_cache.get(cache_key, file_size)
+        if cached is not None:
+            return file_size, ExtractionResult.model_validate_json(cached)
+
+        temp_path = await submit_task2event_loop(copy_to_temp_file, upload)
+        try:
+            result = await process(temp_path, on_progress)
+        finally:
+            os.unlink(temp_path)
+        await conversion_cache.set(cache_key, result.model_dump_json())
+        return file_size, result
+
+    def get_parallel_jobs(self, total_pages: Optional[int]) -> int:
+        # 不知道总页数或者页数太少的时候还是一批一批地提取
+        if total_pages is None or total_pages < self.parallel_min_pages:
+            return 1
+        return self.parallel_jobs
+
+    async def extract_page_ranges(
+        self, source, ranges: List[Tuple[int, int]], check_capacity: bool
+    ) -> Tuple[Optional[int], List[str]]:
+        results = await asyncio.gather(
+            *[
+                conversion_pool.run(
+                    extract_pdf_pages,
+                    source,
+                    start,
+                    end,
+                    check_capacity=check_capacity,
+                )
+                for start, end in ranges
+            ]
+        )
+        total_pages = next((total for total, _ in results if total is not None), None)
+        # gather 按传入的顺序返回, 直接拼起来就是原来的页序
+        return total_pages, [text for _, batch in results for text in batch]
+
+    async def process_pdf(
+        self, source, on_progress: Optional[ProgressCallback] = None
+    ) -> ExtractionResult:
+        """pdfminer 是纯python的CPU密集操作, 按页分段交给转换进程池。
+
+        第一段提取完之后就知道总页数, 页数多的文档后面的页每轮分成多段并行提取,
+        每轮结束之后检查字数上限, 超过上限最多多提取一轮。
+        """
+        page_texts, chars = [], 0
+        total_pages, truncated = None, False
+        start, jobs = 0, 1
+        while total_pages is None or start < total_pages:
+            ranges = []
+            for idx in range(jobs):
+                range_start = start + idx * DOCUMENT_PDF_PAGES_PER_JOB
+                if total_pages is not None and range_start >= total_pages:
+                    break
+                ranges.append((range_start, range_start + DOCUMENT_PDF_PAGES_PER_JOB))
+            end = ranges[-1][1]
+            batch_total_pages, batch = await self.extract_page_ranges(
+                # 第一批之后的任务不再检查队列是否已满, 避免转换到一半被拒绝
+                source,
+                ranges,
+                check_capacity=start == 0,
+            )
+            if batch_total_pages is not None:
+                total_pages = batch_total_pages
+                jobs = self.get_parallel_jobs(total_pages)
+            for page_text in batch:
+                remaining = self.max_chars - chars
+                if len(page_text) > remaining:
+                    page_texts.append(page_text[:remaining])
+                    chars += remaining
+                    truncated = True
+                    break
+                page_texts.append(page_text)
+                chars += len(page_text)
+            if on_progress is not None:
+                await on_progress(start + len(batch), total_pages, chars)
+            if truncated or len(batch) < end - start:
+                break
+            start = end
+        if truncated:
+            logger.info(
+                f"Stopped extracting after {len(page_texts)} pages: "
+                f"reached {self.max_chars} characters"
+            )
+        return ExtractionResult(
+            text="".join(page_texts),
+            truncated=truncated,
+            pages_extracted=len(page_texts),
+            total_pages=total_pages,
         )
 
-        # Optionally, handle more complex structures like tables, headers, footers if needed
-        # For simplicity, this example focuses only on text in paragraphs
-
-        return extracted_text
-
-    async def process_docx(self, content):
-        extracted_text = await submit_task2event_loop(self.process_docx_sync, content)
-
-        return extracted_text
+    async def process_docx(
+        self, source, on_progress: Optional[ProgressCallback] = None
+    ) -> ExtractionResult:
+        # 流式解析, 超过字数上限的时候直接停下来, 不用解析剩下的部分
+        return await conversion_pool.run(extract_docx, source, self.max_chars)
 
 
 async def main():
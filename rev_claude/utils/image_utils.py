@@ -0,0 +1,120 @@
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Optional, Tuple
+
+from fastapi import UploadFile
+from loguru import logger
+
+from rev_claude.configs import (
+    IMAGE_DOWNSCALE_ENABLED,
+    IMAGE_DOWNSCALE_MAX_BYTES,
+    IMAGE_DOWNSCALE_MAX_SIDE,
+    IMAGE_DOWNSCALE_QUALITY,
+)
+from rev_claude.utils.async_task_utils import submit_task2event_loop
+from rev_claude.utils.conversion_pool import conversion_pool
+from rev_claude.utils.file_utils import copy_to_temp_file
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 没有安装 pillow 的时候直接上传原图
+    Image = ImageOps = None
+
+
+def get_file_size(file) -> int:
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    return size
+
+
+def get_image_size(file) -> Optional[Tuple[int, int]]:
+    """只读取图片的头部拿到宽高, 不会解码整张图片。"""
+    try:
+        with Image.open(file) as image:
+            return image.size
+    except Exception:
+        return None
+    finally:
+        file.seek(0)
+
+
+def needs_downscale(file) -> bool:
+    if not IMAGE_DOWNSCALE_ENABLED or Image is None:
+        return False
+    if get_file_size(file) > IMAGE_DOWNSCALE_MAX_BYTES:
+        return True
+    size = get_image_size(file)
+    return size is not None and max(size) > IMAGE_DOWNSCALE_MAX_SIDE
+
+
+# 在转换进程里面执行
+def downscale_image(
+    path: str, max_side: int, quality: int
+) -> Optional[Tuple[str, str]]:
+    """缩小并重新编码图片, 返回 (临时文件路径, content_type), 不需要处理的时候返回 None。"""
+    with Image.open(path) as image:
+        # 动图重新编码会丢掉后面的帧
+        if getattr(image, "is_animated", False):
+            return None
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        has_alpha = image.mode in ("RGBA", "LA") or (
+            image.mode == "P" and "transparency" in image.info
+        )
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".image") as temp_file:
+            if has_alpha:
+                image.save(temp_file, format="PNG", optimize=True)
+                content_type = "image/png"
+            else:
+                image.convert("RGB").save(
+                    temp_file, format="JPEG", quality=quality, optimize=True
+                )
+                content_type = "image/jpeg"
+    return temp_file.name, content_type
+
+
+def replace_extension(file_name: str, content_type: str) -> str:
+    extension = ".png" if content_type == "image/png" else ".jpg"
+    return os.path.splitext(file_name or "image")[0] + extension
+
+
+@asynccontextmanager
+async def open_upload_image(image_file: UploadFile):
+    """返回 (文件名, 文件对象, content_type), 文件对象直接交给httpx分块发送。
+
+    尺寸或者大小超过上限的图片先缩小, 缩小失败的时候还是上传原图。
+    """
+    upload = image_file.file
+    file_name, content_type = image_file.filename, image_file.content_type
+    downscaled = None
+    if await submit_task2event_loop(needs_downscale, upload):
+        temp_path = await submit_task2event_loop(copy_to_temp_file, upload)
+        try:
+            downscaled = await conversion_pool.run(
+                downscale_image,
+                temp_path,
+                IMAGE_DOWNSCALE_MAX_SIDE,
+                IMAGE_DOWNSCALE_QUALITY,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to downscale {file_name}, uploading as is: {e}")
+        finally:
+            os.unlink(temp_path)
+
+    if downscaled is None:
+        yield file_name, upload, content_type
+        return
+
+    downscaled_path, content_type = downscaled
+    try:
+        with open(downscaled_path, "rb") as downscaled_file:
+            logger.info(
+                f"Downscaled {file_name} from {get_file_size(upload)} "
+                f"to {get_file_size(downscaled_file)} bytes"
+            )
+            file_name = replace_extension(file_name, content_type)
+            yield file_name, downscaled_file, content_type
+    finally:
+        os.unlink(downscaled_path)
@@ -1,8 +1,15 @@
 import json
+from typing import List, Optional
 
 
-def build_sse_data(message: str, id: str = ""):
+def build_sse_data(message: str, id: str = "", spans: Optional[List[dict]] = None):
     event_name = "chat_response"
     data = {"message": message, "id": id}
+    if spans is not None:
+        data["spans"] = spans
     sse_data = f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
     return sse_data
+
+
+def build_sse_event(event_name: str, data: dict):
+    return f"event: {event_name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"